@@ -2,17 +2,34 @@ from langchain_qwq import ChatQwen
 from langchain_deepseek import ChatDeepSeek
 from src.runner import LarkRunner
 from src.agents.agent import Agent
+from src.runtime.supervisor import Supervisor
+from src.utlis.config import get_config
 from src.utlis.logger_config import logger
 
 
-def main():
-    runner = LarkRunner(config="dev")
-    builder = Agent()
-    llm = ChatQwen(model="qwen-plus-latest")
+def create_agent(config) -> Agent:
+    builder = Agent(config)
+    # 简单对话走快模型，复杂问题与多跳工具调用升级到慢模型
+    llm = {
+        "fast": ChatQwen(model="qwen-turbo-latest"),
+        "slow": ChatQwen(model="qwen-plus-latest"),
+    }
     # llm = ChatDeepSeek(model="deepseek-reasoner")
     builder.build_agent(llm)
-    runner.set_agent(builder)
+    return builder
+
+
+def main():
+    config = get_config("dev")
     logger.info("Start to Run Taro")
+
+    if config.runner_workers > 1:
+        # 多进程模式：每个worker进程调用create_agent构建自己的agent
+        Supervisor(config, create_agent).run()
+        return
+
+    runner = LarkRunner(config=config)
+    runner.set_agent(create_agent(config))
     runner.run()
 
 
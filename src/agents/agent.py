@@ -1,27 +1,37 @@
 import os
 import asyncio
-import aiosqlite
 
 from typing import Optional, Callable, AsyncGenerator
 
 from loguru import logger
+from langchain_core.messages import SystemMessage
 from langgraph.graph.graph import CompiledGraph
 from langgraph.prebuilt import create_react_agent
 from langgraph.prebuilt.chat_agent_executor import AgentState
 
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.checkpoint.base import BaseCheckpointSaver
 
 from ..utlis.config import Config, get_config
-from ..utlis.lark_utils import invoke_lark
+from ..utlis.lark_utils import invoke_lark, StreamCoalescer
 from ..core.rag import LarkRAGManager
 from ..core.db_client import DatabaseClient
 from ..core.lark_sync import LarkSynchronizer
-from .prompt import agent_prompt
+from ..core.checkpointer import PrunedSqliteSaver, BoundedMemorySaver
+from ..core.search import SearchClients
+from ..runtime.tool_cache import ToolResultCache
+from ..runtime.resilience import Resilience
+from ..runtime.speculation import SpeculativeRetriever
+from .history import HistoryTrimmer
+from .resilient_model import ResilientChatModel
+from .router import ModelRouter, RoutedChatModel
+from .prompt import agent_prompt, kb_catalog_prompt
 
 
 class State(AgentState):
     open_id: str
+    summary: str
+    # 上次摘要失败时的历史token数，用于退避重试
+    summary_failed_at: int
 
 
 class Agent:
@@ -41,36 +51,124 @@ class Agent:
         # 初始化数据组件
         self.db_api = DatabaseClient(self.config.db_file)
         self.lark_synchronizer = LarkSynchronizer(lark_api, self.db_api)
-        self.rag_manager = LarkRAGManager(self.lark_synchronizer, self.config.kb_folder)
+        # 模型、embedding与搜索调用的熔断与对冲
+        self.resilience = Resilience(
+            failure_threshold=self.config.breaker_failure_threshold,
+            recovery_timeout=self.config.breaker_recovery_timeout,
+            hedge_quantile=self.config.hedge_quantile,
+        )
+        self.rag_manager = LarkRAGManager(
+            self.lark_synchronizer,
+            self.config.kb_folder,
+            resilience=self.resilience,
+            embedding_timeout=self.config.embedding_timeout,
+        )
+        # 网络搜索与深度研究的结果缓存
+        self.tool_cache = ToolResultCache(
+            self.db_api if self.config.tool_cache_persist else None,
+            ttls=self.config.tool_cache_ttls,
+            max_size=self.config.tool_cache_max_size,
+        )
+        # 网络搜索共享的HTTP连接池
+        self.search_clients = SearchClients(
+            timeout=self.config.search_timeout,
+            max_connections=self.config.search_max_connections,
+            concurrency=self.config.search_engine_concurrency,
+            resilience=self.resilience,
+        )
+
+        # 投机检索：收到消息即用原始问题预取知识库，与第一次模型调用并行
+        self.speculator: Optional[SpeculativeRetriever] = None
+        if self.config.speculative_retrieval:
+            from .toolkits import format_docs, query_knowledge_bases
+
+            self.speculator = SpeculativeRetriever(
+                lambda query: query_knowledge_bases(self.rag_manager, query),
+                lambda results, space_id: format_docs(self.rag_manager, results, space_id),
+                threshold=self.config.speculative_match_threshold,
+                min_query_chars=self.config.speculative_min_query_chars,
+            )
 
         # Agent相关
         self.agent: Optional[CompiledGraph] = None
-        self.checkpointer = None
+        self.checkpointer: Optional[BaseCheckpointSaver] = None
+        self.history_trimmer: Optional[HistoryTrimmer] = None
+        self.router: Optional[ModelRouter] = None
 
-    def build_agent(self, model) -> CompiledGraph:
+    def build_agent(
+        self, model, summary_model=None, fallback_model=None, router=None
+    ) -> CompiledGraph:
         """构建LangGraph agent
 
         Args:
-            model: LLM模型实例
+            model: LLM模型实例，或{"fast": 快模型, "slow": 慢模型}形式的多个模型，由router为每次调用选择
+            summary_model: 用于压缩历史的模型，默认使用model（多个模型时使用快模型）
+            fallback_model: model超时、出错或熔断时使用的备用模型
+            router: 多个模型时的路由策略，默认按配置创建ModelRouter
 
         Returns:
             CompiledGraph: 编译后的 agent
         """
         tools = self._create_tools()
-        self.checkpointer = MemorySaver()
+        self.checkpointer = self._create_checkpointer()
 
-        # self.build_checkpointer()
+        if isinstance(model, dict):
+            self.router = router or ModelRouter(
+                long_query_chars=self.config.router_long_query_chars,
+                long_history_chars=self.config.router_long_history_chars,
+                max_fast_tool_rounds=self.config.router_max_fast_tool_rounds,
+            )
+            for name in (self.router.fast, self.router.slow):
+                if name not in model:
+                    raise ValueError(f"缺少路由所需的模型: {name}")
+            models = {
+                name: self._resilient(m, fallback_model, f"llm:{name}")
+                for name, m in model.items()
+            }
+            summary_model = summary_model or models[self.router.fast]
+            model = RoutedChatModel(models=models, router=self.router)
+        else:
+            model = self._resilient(model, fallback_model)
+
+        if self.config.history_max_tokens:
+            self.history_trimmer = HistoryTrimmer(
+                summary_model=summary_model or model,
+                max_tokens=self.config.history_max_tokens,
+                tool_result_tokens=self.config.history_tool_result_tokens,
+            )
 
         # 创建react agent
         self.agent = create_react_agent(
             model=model,
             tools=tools,
-            prompt=agent_prompt,
+            prompt=self._prompt,
+            pre_model_hook=self.history_trimmer,
             state_schema=State,
             checkpointer=self.checkpointer,
         )
         return self.agent
 
+    def _resilient(self, model, fallback_model=None, provider: str = "llm"):
+        return ResilientChatModel(
+            model=model,
+            fallback=fallback_model,
+            resilience=self.resilience,
+            provider=provider,
+            timeout=self.config.llm_timeout,
+            first_token_timeout=self.config.llm_first_token_timeout,
+        )
+
+    def _prompt(self, state: State) -> list:
+        """系统提示词 + 知识库目录 + 滚动摘要 + 对话历史"""
+        system_prompt = agent_prompt
+        if self.config.kb_catalog_in_prompt:
+            catalog = self.rag_manager.render_catalog()
+            if catalog:
+                system_prompt += kb_catalog_prompt.format(catalog=catalog)
+        if state.get("summary"):
+            system_prompt += f"\n之前对话的摘要:\n{state['summary']}\n"
+        return [SystemMessage(content=system_prompt), *state["messages"]]
+
     async def invoke2lark(
         self,
         query: str,
@@ -78,6 +176,9 @@ class Agent:
         interrupt: Optional[Callable] = None,
         chunk_size: int = 30,
         recursion_limit: Optional[int] = 25,
+        max_latency: float = 0.8,
+        coalescer: Optional[StreamCoalescer] = None,
+        stop_event: Optional[asyncio.Event] = None,
     ) -> AsyncGenerator[dict, None]:
         """主要接口：通过invoke_lark运行agent并生成流式响应
 
@@ -87,8 +188,11 @@ class Agent:
             query: 用户查询
             thread_id: 线程ID
             interrupt: 中断检查函数
-            chunk_size: 文本块大小
+            chunk_size: 文本块的最小大小
             recursion_limit: 递归限制
+            max_latency: 文本在缓冲区中的最长停留时间(秒)
+            coalescer: 自定义合并器，调用方可在结束后读取frames等统计
+            stop_event: 设置后立即取消本轮运行，已输出的部分回答会写入checkpoint
 
         Yields:
             dict: 包含type和text的字典
@@ -96,31 +200,77 @@ class Agent:
         if not self.agent:
             raise ValueError("请先调用build_agent()来创建agent")
 
-        async for chunks in invoke_lark(
-            agent=self.agent,
-            query=query,
-            thread_id=thread_id,
-            interrupt=interrupt,
-            chunk_size=chunk_size,
-            recursion_limit=recursion_limit,
-        ):
-            for chunk in chunks:
-                yield chunk
+        await self.setup()
+
+        if coalescer is None:
+            coalescer = StreamCoalescer(max_latency=max_latency, min_size=chunk_size)
+
+        speculation = self.speculator.start(query) if self.speculator else None
+        try:
+            async for chunks in invoke_lark(
+                agent=self.agent,
+                query=query,
+                thread_id=thread_id,
+                interrupt=interrupt,
+                recursion_limit=recursion_limit,
+                coalescer=coalescer,
+                stop_event=stop_event,
+            ):
+                for chunk in chunks:
+                    yield chunk
+        finally:
+            if speculation is not None:
+                speculation.close()
+
+        logger.info(f"Stream finished for thread {thread_id}: {coalescer.stats()}")
 
     def _create_tools(self):
         """创建工具列表"""
         from .toolkits import LarkToolkit
 
-        toolkit = LarkToolkit(rag_manager=self.rag_manager)
+        toolkit = LarkToolkit(
+            rag_manager=self.rag_manager,
+            enable_research=self.config.research_enabled,
+            cache=self.tool_cache,
+            search_clients=self.search_clients,
+        )
         return toolkit.get_tools()
 
-    # async def build_checkpointer(self):
-    #     self.conn = await aiosqlite.connect(self.config.db_file)
-    #     self.checkpointer = AsyncSqliteSaver(self.conn)
+    def _create_checkpointer(self) -> BaseCheckpointSaver:
+        """根据配置创建checkpointer"""
+        if self.config.checkpointer == "sqlite":
+            return PrunedSqliteSaver.from_db_file(
+                self.config.db_file,
+                keep_last=self.config.checkpoint_keep_last,
+                thread_ttl=self.config.checkpoint_thread_ttl,
+                maintenance_interval=self.config.checkpoint_maintenance_interval,
+                stats_interval=self.config.checkpoint_stats_interval,
+            )
+        return BoundedMemorySaver(
+            keep_last=self.config.checkpoint_memory_keep_last,
+            thread_ttl=self.config.checkpoint_thread_ttl,
+            max_threads=self.config.checkpoint_memory_max_threads,
+            max_bytes=self.config.checkpoint_memory_max_bytes,
+        )
+
+    async def setup(self):
+        """在事件循环中初始化异步资源（checkpointer连接、维护任务），可重复调用"""
+        if isinstance(self.checkpointer, PrunedSqliteSaver):
+            if not self.checkpointer.is_setup:
+                await self.checkpointer.setup()
+                logger.info(f"Checkpointer ready: {self.config.db_file}")
+            self.checkpointer.start_maintenance()
 
-    # async def close_conn(self):
-    #     await self.conn.close()
+    def checkpointer_stats(self) -> dict:
+        """checkpointer当前规模，sqlite模式返回维护任务最近一次统计的结果"""
+        if isinstance(self.checkpointer, (BoundedMemorySaver, PrunedSqliteSaver)):
+            return self.checkpointer.stats()
+        return {}
 
-    # def __del__(self):
-    #     self.conn.close()
-    #     logger.info("Checkpointer closed")
+    async def aclose(self):
+        """释放异步资源"""
+        if isinstance(self.checkpointer, PrunedSqliteSaver):
+            await self.checkpointer.close()
+            logger.info("Checkpointer closed")
+        await self.search_clients.aclose()
+        await self.db_api.close()
@@ -0,0 +1,210 @@
+import json
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AnyMessage,
+    HumanMessage,
+    RemoveMessage,
+    SystemMessage,
+    ToolMessage,
+)
+from langchain_core.runnables import RunnableConfig
+from langgraph.constants import TAG_NOSTREAM
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from src.utlis.logger_config import logger
+
+
+SUMMARY_PROMPT = """
+你负责压缩对话历史。请把下面的对话整理成一段简洁的摘要，保留：
+- 用户的目标、偏好和已确认的事实
+- 工具查询得到的关键结论（知识库来源、链接、数字）
+- 尚未解决的问题
+不要编造内容，直接输出摘要正文。
+"""
+
+
+def build_token_counter(encoding_name: str = "cl100k_base") -> Callable[[str], int]:
+    """构建基于tiktoken的计数函数，编码不可用时退化为按字符计数（对中文偏保守）"""
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding(encoding_name)
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception as e:
+        logger.warning(f"tiktoken encoding {encoding_name} unavailable, fallback: {e}")
+        return len
+
+
+def message_text(msg: AnyMessage) -> str:
+    """提取消息的文本内容（包括工具调用参数）"""
+    if isinstance(msg.content, str):
+        text = msg.content
+    else:
+        text = "".join(
+            part if isinstance(part, str) else str(part.get("text", ""))
+            for part in msg.content
+        )
+    if isinstance(msg, AIMessage) and msg.tool_calls:
+        text += json.dumps(
+            [{"name": c["name"], "args": c["args"]} for c in msg.tool_calls],
+            ensure_ascii=False,
+        )
+    return text
+
+
+class HistoryTrimmer:
+    """create_react_agent的pre_model_hook：按token预算压缩对话历史
+
+    超出max_tokens时依次：
+    1. 截断早于当前轮次的工具结果（每条最多tool_result_tokens）
+    2. 将较早的轮次总结进滚动摘要(state["summary"])，只保留最近keep_tokens内的轮次；
+       没有摘要模型或摘要失败时保留这些轮次，不丢弃历史
+    摘要失败时记录当时的token数(state["summary_failed_at"])，
+    历史再增长retry_tokens之后才重试，避免每次模型调用都重复请求失败的摘要。
+
+    压缩结果会写回state，后续轮次不会重复处理同样的历史。
+    """
+
+    def __init__(
+        self,
+        summary_model: Optional[BaseChatModel] = None,
+        max_tokens: int = 8000,
+        keep_tokens: Optional[int] = None,
+        tool_result_tokens: int = 800,
+        retry_tokens: Optional[int] = None,
+        token_counter: Optional[Callable[[str], int]] = None,
+        stats_size: int = 1000,
+    ):
+        self.summary_model = summary_model
+        self.max_tokens = max_tokens
+        self.keep_tokens = keep_tokens or max_tokens // 2
+        self.tool_result_tokens = tool_result_tokens
+        self.retry_tokens = retry_tokens or max_tokens // 4
+        self.count = token_counter or build_token_counter()
+
+        # 每次模型调用前的token统计(一轮对话可能包含多次调用)
+        self.stats: deque[dict] = deque(maxlen=stats_size)
+
+    def count_messages(self, messages: list[AnyMessage], summary: str = "") -> int:
+        # 每条消息额外计入少量格式开销
+        return self.count(summary) + sum(self.count(message_text(m)) + 4 for m in messages)
+
+    async def __call__(self, state: dict, config: RunnableConfig) -> dict:
+        messages: list[AnyMessage] = state["messages"]
+        summary: str = state.get("summary") or ""
+        before = self.count_messages(messages, summary)
+
+        if before <= self.max_tokens:
+            self._record(config, before, before, False)
+            return {}
+
+        turns = self._split_turns(messages)
+        current = turns.pop() if turns else []
+
+        # 1. 截断旧轮次中的工具结果
+        turns = [[self._truncate_tool_result(m) for m in turn] for turn in turns]
+        kept = [m for turn in turns for m in turn] + current
+        summarized = False
+        failed_at: int = state.get("summary_failed_at") or 0
+        update: dict = {}
+
+        # 2. 仍然超出预算时，把较早的轮次合并进滚动摘要（上次失败后历史增长足够才重试）
+        truncated = self.count_messages(kept, summary)
+        backoff = failed_at and truncated < failed_at + self.retry_tokens
+        if truncated > self.max_tokens and turns and not backoff:
+            budget = self.keep_tokens - self.count_messages(current)
+            recent: list[list[AnyMessage]] = []
+            while turns and self.count_messages(turns[-1]) <= budget:
+                budget -= self.count_messages(turns[-1])
+                recent.insert(0, turns.pop())
+
+            if turns and self.summary_model is not None:
+                old = [m for turn in turns for m in turn]
+                new_summary = await self._summarize(summary, old)
+                # 只有较早的轮次确实进入了摘要才从历史中移除
+                if new_summary is not None:
+                    summary = new_summary
+                    summarized = True
+                    kept = [m for turn in recent for m in turn] + current
+                    if failed_at:
+                        update["summary_failed_at"] = 0
+                else:
+                    update["summary_failed_at"] = truncated
+
+        after = self.count_messages(kept, summary)
+        self._record(config, before, after, summarized)
+        if after == before:
+            return update
+        logger.info(
+            f"Trimmed history for thread {self._thread_id(config)}: "
+            f"{before} -> {after} tokens, summarized={summarized}"
+        )
+        return {
+            **update,
+            "messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *kept],
+            "summary": summary,
+        }
+
+    @staticmethod
+    def _split_turns(messages: list[AnyMessage]) -> list[list[AnyMessage]]:
+        """按HumanMessage切分轮次，保证工具调用与其结果不被拆开"""
+        turns: list[list[AnyMessage]] = []
+        for msg in messages:
+            if isinstance(msg, HumanMessage) or not turns:
+                turns.append([])
+            turns[-1].append(msg)
+        return turns
+
+    def _truncate_tool_result(self, msg: AnyMessage) -> AnyMessage:
+        if not isinstance(msg, ToolMessage) or not isinstance(msg.content, str):
+            return msg
+        if self.count(msg.content) <= self.tool_result_tokens:
+            return msg
+
+        # 按比例估算保留的字符数
+        ratio = self.tool_result_tokens / self.count(msg.content)
+        content = msg.content[: int(len(msg.content) * ratio)] + "\n...[内容已截断]"
+        return msg.model_copy(update={"content": content})
+
+    async def _summarize(
+        self, summary: str, messages: list[AnyMessage]
+    ) -> Optional[str]:
+        """返回合并后的新摘要，没有摘要模型或调用失败时返回None"""
+        if self.summary_model is None:
+            return None
+        transcript = "\n".join(
+            f"{m.type}: {message_text(m)}" for m in messages if message_text(m)
+        )
+
+        content = f"已有摘要:\n{summary or '无'}\n\n新的对话:\n{transcript}"
+        try:
+            response = await self.summary_model.ainvoke(
+                [SystemMessage(content=SUMMARY_PROMPT), HumanMessage(content=content)],
+                config={"tags": [TAG_NOSTREAM]},
+            )
+            return message_text(response).strip()
+        except Exception as e:
+            logger.error(f"Failed to summarize history: {e}")
+            return None
+
+    @staticmethod
+    def _thread_id(config: RunnableConfig) -> Optional[str]:
+        return (config or {}).get("configurable", {}).get("thread_id")
+
+    def _record(
+        self, config: RunnableConfig, before: int, after: int, summarized: bool
+    ) -> None:
+        self.stats.append(
+            {
+                "thread_id": self._thread_id(config),
+                "before": before,
+                "after": after,
+                "summarized": summarized,
+                "time": time.time(),
+            }
+        )
@@ -0,0 +1,131 @@
+import time
+import asyncio
+from typing import Any, AsyncIterator, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.constants import TAG_NOSTREAM
+
+from loguru import logger
+
+from ..runtime.resilience import CircuitOpenError, Resilience
+
+
+class ResilientChatModel(BaseChatModel):
+    """带超时、熔断与降级的对话模型
+
+    模型调用不是幂等的（会消耗token且可能触发工具调用），因此不做对冲：
+    首token超过first_token_timeout或整体超过timeout视为失败，连续失败后熔断；
+    熔断或尚未输出任何内容时失败，改用fallback模型重新生成。
+    内部模型的流式token打上nostream标签，只由本模型向外输出一次。
+    """
+
+    model: Any
+    fallback: Optional[Any] = None
+    resilience: Resilience
+    provider: str = "llm"
+    first_token_timeout: Optional[float] = 30
+    timeout: Optional[float] = 120
+
+    @property
+    def _llm_type(self) -> str:
+        return "resilient"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "ResilientChatModel":
+        return self.model_copy(
+            update={
+                "model": self.model.bind_tools(tools, **kwargs),
+                "fallback": self.fallback.bind_tools(tools, **kwargs)
+                if self.fallback is not None
+                else None,
+            }
+        )
+
+    def _generate(self, *args: Any, **kwargs: Any) -> ChatResult:
+        raise NotImplementedError("ResilientChatModel只支持异步调用")
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        config = {"tags": [TAG_NOSTREAM]}
+        fallback = None
+        if self.fallback is not None:
+
+            async def fallback():
+                return await self.fallback.ainvoke(messages, config, stop=stop, **kwargs)
+
+        message = await self.resilience.call(
+            self.provider,
+            lambda: self.model.ainvoke(messages, config, stop=stop, **kwargs),
+            deadline=self.timeout,
+            fallback=fallback,
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        counter = self.resilience.counters[self.provider]
+        breaker = self.resilience.breaker(self.provider)
+        config = {"tags": [TAG_NOSTREAM]}
+
+        if not breaker.allow():
+            counter["rejected"] += 1
+            if self.fallback is None:
+                raise CircuitOpenError(f"{self.provider}服务暂时不可用")
+            counter["fallbacks"] += 1
+            async for chunk in self.fallback.astream(messages, config, stop=stop, **kwargs):
+                yield ChatGenerationChunk(message=chunk)
+            return
+
+        counter["calls"] += 1
+        started = time.monotonic()
+        stream = self.model.astream(messages, config, stop=stop, **kwargs)
+        first = True
+        try:
+            while True:
+                timeout = None
+                if self.timeout is not None:
+                    timeout = max(self.timeout - (time.monotonic() - started), 0)
+                if first and self.first_token_timeout is not None:
+                    timeout = (
+                        self.first_token_timeout
+                        if timeout is None
+                        else min(timeout, self.first_token_timeout)
+                    )
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                first = False
+                yield ChatGenerationChunk(message=chunk)
+        except (asyncio.CancelledError, GeneratorExit):
+            breaker.release()
+            raise
+        except Exception as e:
+            counter["failures"] += 1
+            breaker.record_failure()
+            # 已经输出的内容无法撤回，只有首token之前失败才能降级
+            if not first or self.fallback is None:
+                raise
+            logger.warning(
+                f"{self.provider}调用失败，使用备用模型: {str(e) or type(e).__name__}"
+            )
+            counter["fallbacks"] += 1
+            async for chunk in self.fallback.astream(messages, config, stop=stop, **kwargs):
+                yield ChatGenerationChunk(message=chunk)
+            return
+        finally:
+            await stream.aclose()
+
+        breaker.record_success()
+        self.resilience.record_latency(self.provider, time.monotonic() - started)
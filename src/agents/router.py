@@ -0,0 +1,193 @@
+import time
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AnyMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.constants import TAG_NOSTREAM
+
+from loguru import logger
+
+from .history import message_text
+
+
+# 出现这些词时通常需要查知识库、搜索或多步推理
+COMPLEX_HINTS = (
+    "知识库",
+    "文档",
+    "搜索",
+    "查一下",
+    "研究",
+    "调研",
+    "分析",
+    "对比",
+    "比较",
+    "总结",
+    "为什么",
+    "原因",
+    "步骤",
+    "方案",
+    "代码",
+    "报告",
+    "search",
+    "compare",
+    "analy",
+    "why",
+)
+
+
+def _percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return round(values[min(int(len(values) * p), len(values) - 1)], 3)
+
+
+class ModelRouter:
+    """快慢模型路由策略
+
+    按启发式规则为每次模型调用选择模型：
+    - 当前轮次的工具调用超过max_fast_tool_rounds次（多跳问题）时升级到慢模型
+    - 问题较长、包含需要工具或推理的关键词、对话历史较长时使用慢模型
+    - 其余（寒暄、简单问答）使用快模型
+
+    同时记录路由决策与各模型的首token耗时、总耗时。
+    """
+
+    def __init__(
+        self,
+        fast: str = "fast",
+        slow: str = "slow",
+        long_query_chars: int = 80,
+        long_history_chars: int = 6000,
+        max_fast_tool_rounds: int = 1,
+        hints: Sequence[str] = COMPLEX_HINTS,
+        latency_window: int = 200,
+    ):
+        self.fast = fast
+        self.slow = slow
+        self.long_query_chars = long_query_chars
+        self.long_history_chars = long_history_chars
+        self.max_fast_tool_rounds = max_fast_tool_rounds
+        self.hints = tuple(hint.lower() for hint in hints)
+
+        self.decisions: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.latencies: dict[str, deque] = defaultdict(lambda: deque(maxlen=latency_window))
+        self.first_token: dict[str, deque] = defaultdict(lambda: deque(maxlen=latency_window))
+
+    def route(self, messages: Sequence[AnyMessage]) -> tuple[str, str]:
+        """返回(模型名, 原因)"""
+        query = ""
+        tool_rounds = 0
+        history_chars = 0
+        for msg in messages:
+            if isinstance(msg, SystemMessage):
+                continue
+            history_chars += len(message_text(msg))
+            if isinstance(msg, HumanMessage):
+                query = message_text(msg)
+                tool_rounds = 0
+            elif isinstance(msg, AIMessage) and msg.tool_calls:
+                tool_rounds += 1
+
+        if tool_rounds > self.max_fast_tool_rounds:
+            return self.slow, "multi_hop"
+        if len(query) >= self.long_query_chars:
+            return self.slow, "long_query"
+        lowered = query.lower()
+        if any(hint in lowered for hint in self.hints):
+            return self.slow, "complex_hint"
+        if history_chars >= self.long_history_chars:
+            return self.slow, "long_history"
+        return self.fast, "simple"
+
+    def record(
+        self,
+        model: str,
+        reason: str,
+        latency: float,
+        first_token: Optional[float] = None,
+    ):
+        self.decisions[model][reason] += 1
+        self.latencies[model].append(latency)
+        if first_token is not None:
+            self.first_token[model].append(first_token)
+
+    def stats(self) -> dict:
+        return {
+            model: {
+                "calls": sum(reasons.values()),
+                "reasons": dict(reasons),
+                "latency_p50": _percentile(self.latencies[model], 0.5),
+                "latency_p95": _percentile(self.latencies[model], 0.95),
+                "first_token_p50": _percentile(self.first_token[model], 0.5),
+                "first_token_p95": _percentile(self.first_token[model], 0.95),
+            }
+            for model, reasons in self.decisions.items()
+        }
+
+
+class RoutedChatModel(BaseChatModel):
+    """按ModelRouter选择模型的对话模型，create_react_agent中每次模型调用都会重新路由
+
+    被选中模型的流式token打上nostream标签，只由本模型向外输出一次。
+    """
+
+    models: dict[str, Any]
+    router: ModelRouter
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "RoutedChatModel":
+        return self.model_copy(
+            update={
+                "models": {
+                    name: model.bind_tools(tools, **kwargs)
+                    for name, model in self.models.items()
+                }
+            }
+        )
+
+    def _select(self, messages: list[BaseMessage]) -> tuple[str, str, Any]:
+        name, reason = self.router.route(messages)
+        logger.debug(f"Route model call to {name}: {reason}")
+        return name, reason, self.models[name]
+
+    def _generate(self, *args: Any, **kwargs: Any) -> ChatResult:
+        raise NotImplementedError("RoutedChatModel只支持异步调用")
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        name, reason, model = self._select(messages)
+        started = time.monotonic()
+        message = await model.ainvoke(
+            messages, {"tags": [TAG_NOSTREAM]}, stop=stop, **kwargs
+        )
+        self.router.record(name, reason, time.monotonic() - started)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        name, reason, model = self._select(messages)
+        started = time.monotonic()
+        first_token = None
+        async for chunk in model.astream(
+            messages, {"tags": [TAG_NOSTREAM]}, stop=stop, **kwargs
+        ):
+            if first_token is None:
+                first_token = time.monotonic() - started
+            yield ChatGenerationChunk(message=chunk)
+        self.router.record(name, reason, time.monotonic() - started, first_token)
@@ -1,12 +1,22 @@
+import os
+import sys
+import time
+import uuid
 import asyncio
-from typing import Type, Optional
+import weakref
+from typing import AsyncIterator, Type, Optional
 from pydantic import BaseModel, Field, ConfigDict
 from loguru import logger
 
+from langchain_core.documents import Document
 from langchain_core.tools import BaseTool
 from langchain_core.tools.base import BaseToolkit
 
 from ..core.rag import LarkRAGManager
+from ..core.search import SearchClients
+from ..runtime.jobs import current_chat
+from ..runtime.speculation import current_speculation
+from ..runtime.tool_cache import ToolResultCache
 
 
 class SearchDocsTool(BaseTool):
@@ -36,33 +46,62 @@ class SearchDocsTool(BaseTool):
         space_id: Optional[str] = None,
     ) -> str:
         """Execute document search"""
+        speculation = current_speculation.get()
+        if speculation is not None:
+            result = await speculation.take(query, space_id)
+            if result is not None:
+                return result
+        return await search_docs(self.rag_manager, query, space_id)
+
+
+async def search_docs(
+    rag_manager: LarkRAGManager, query: str, space_id: Optional[str] = None
+) -> str:
+    """search_docs工具的检索逻辑"""
+    try:
+        if space_id:
+            # 搜索特定知识库
+            results = {space_id: await rag_manager.query(space_id, query, top_k=3)}
+        else:
+            # 搜索所有可用知识库
+            if not rag_manager.list_knowledge_bases():
+                return "暂无可用的知识库"
+            results = await query_knowledge_bases(rag_manager, query)
+        return format_docs(rag_manager, results, space_id)
+    except Exception as e:
+        return f"搜索出错: {str(e)}"
+
+
+async def query_knowledge_bases(
+    rag_manager: LarkRAGManager, query: str
+) -> dict[str, list[Document]]:
+    """在前几个可用知识库中检索，按space_id返回结果，投机检索也使用该函数预取"""
+    results = {}
+    for kb_id, kb_name in rag_manager.list_knowledge_bases()[:3]:  # 限制搜索数量
         try:
-            if space_id:
-                # 搜索特定知识库
-                results = await self.rag_manager.query(space_id, query, top_k=3)
-                content = "\n\n".join([doc.page_content for doc in results])
-                return f"知识库 {space_id} 中的搜索结果:\n{content}"
-            else:
-                # 搜索所有可用知识库
-                available_kbs = self.rag_manager.list_knowledge_bases()
-                if not available_kbs:
-                    return "暂无可用的知识库"
-
-                all_results = []
-                for kb_id, kb_name in available_kbs[:3]:  # 限制搜索数量
-                    try:
-                        results = await self.rag_manager.query(kb_id, query, top_k=2)
-                        for doc in results:
-                            all_results.append(
-                                f"[知识库: {kb_name}]: {doc.page_content}"
-                            )
-                    except Exception as e:
-                        logger.error(f"搜索知识库 {kb_name} 出错: {str(e)}")
-                        continue
-
-                return "\n\n".join(all_results) if all_results else "未找到相关内容"
+            results[kb_id] = await rag_manager.query(kb_id, query, top_k=3)
         except Exception as e:
-            return f"搜索出错: {str(e)}"
+            logger.error(f"搜索知识库 {kb_name} 出错: {str(e)}")
+    return results
+
+
+def format_docs(
+    rag_manager: LarkRAGManager,
+    results: dict[str, list[Document]],
+    space_id: Optional[str] = None,
+) -> str:
+    """把按space_id分组的检索结果渲染为search_docs的输出"""
+    if space_id:
+        content = "\n\n".join([doc.page_content for doc in results[space_id][:3]])
+        return f"知识库 {space_id} 中的搜索结果:\n{content}"
+
+    names = dict(rag_manager.list_knowledge_bases())
+    all_results = [
+        f"[知识库: {names.get(kb_id, kb_id)}]: {doc.page_content}"
+        for kb_id, docs in results.items()
+        for doc in docs[:2]
+    ]
+    return "\n\n".join(all_results) if all_results else "未找到相关内容"
 
 
 class ListKBsTool(BaseTool):
@@ -98,20 +137,34 @@ class ListKBsTool(BaseTool):
             return f"获取知识库列表出错: {str(e)}"
 
 
+# 支持的搜索引擎 -> 结果中显示的名称
+SEARCH_ENGINES = {"tavily": "Tavily", "duckduckgo": "DuckDuckGo"}
+
+
 class WebSearchTool(BaseTool):
     """Tool for web search - supports multiple search engines"""
 
     name: str = "web_search"
     description: str = "搜索网络内容，请加入主题"
 
+    # 搜索结果缓存，None表示不缓存
+    cache: Optional[ToolResultCache] = Field(default=None, exclude=True)
+    # 复用的搜索客户端与连接池
+    clients: SearchClients = Field(default_factory=SearchClients, exclude=True)
+
     class Input(BaseModel):
         query: str = Field(..., description="搜索查询")
         engine: str = Field(
-            default="tavily", description="搜索引擎选择: tavily, duckduckgo"
+            default="tavily",
+            description="搜索引擎选择: tavily, duckduckgo，多个引擎用逗号分隔并行搜索",
         )
         max_results: int = Field(default=5, description="最大结果数量")
+        fresh: bool = Field(
+            default=False, description="是否忽略缓存重新搜索，用户需要最新信息时使用"
+        )
 
     args_schema: Type[BaseModel] = Input
+    model_config = ConfigDict(arbitrary_types_allowed=True)
 
     def _run(self, *args, **kwargs):
         raise NotImplementedError(
@@ -119,40 +172,46 @@ class WebSearchTool(BaseTool):
         )
 
     async def _arun(
-        self, query: str, engine: str = "tavily", max_results: int = 5
+        self,
+        query: str,
+        engine: str = "tavily",
+        max_results: int = 5,
+        fresh: bool = False,
     ) -> str:
-        """Execute web search using specified engine"""
+        """Execute web search using specified engines in parallel"""
+        engines = list(dict.fromkeys(e.strip() for e in engine.split(",") if e.strip()))
+        if not engines or any(e not in SEARCH_ENGINES for e in engines):
+            return (
+                f"不支持的搜索引擎: {engine}. 支持的引擎: tavily, duckduckgo, serpapi"
+            )
 
-        if engine == "tavily":
-            # Tavily Search - 专为AI优化的搜索引擎
-            try:
-                from langchain_tavily import TavilySearch
+        results = await asyncio.gather(
+            *(self._search(query, e, max_results, fresh) for e in engines)
+        )
+        return "\n\n".join(results)
 
-                tool = TavilySearch(max_results=max_results)
-                result = await tool.ainvoke({"query": query})
-                return f"Tavily搜索结果: {result}"
-            except ImportError:
-                return "Tavily未安装，请安装: pip install langchain-tavily"
-            except Exception as e:
-                return f"Tavily搜索失败: {str(e)}"
-
-        elif engine == "duckduckgo":
-            # DuckDuckGo Search - 免费隐私友好搜索
-            try:
-                from langchain_community.tools import DuckDuckGoSearchResults
-
-                tool = DuckDuckGoSearchResults(num_results=max_results)
-                result = await tool.ainvoke({"query": query})
-                return f"DuckDuckGo搜索结果: {result}"
-            except ImportError:
-                return "DuckDuckGo搜索未安装，请安装: pip install duckduckgo-search"
-            except Exception as e:
-                return f"DuckDuckGo搜索失败: {str(e)}"
+    async def _search(self, query: str, engine: str, max_results: int, fresh: bool) -> str:
+        """单个引擎的搜索，结果按引擎分别缓存"""
+        label = SEARCH_ENGINES[engine]
 
-        else:
-            return (
-                f"不支持的搜索引擎: {engine}. 支持的引擎: tavily, duckduckgo, serpapi"
+        async def call():
+            # 失败时抛出异常，失败结果不进入缓存
+            result = await self.clients.search(engine, query, max_results)
+            return f"{label}搜索结果: {result}"
+
+        try:
+            if self.cache is None:
+                return await call()
+            key = ToolResultCache.make_key(
+                self.name, query, engine=engine, max_results=max_results
             )
+            return await self.cache.get_or_call(self.name, key, call, bypass=fresh)
+        except ImportError:
+            if engine == "tavily":
+                return "Tavily未安装，请安装: pip install langchain-tavily"
+            return "DuckDuckGo搜索未安装，请安装: pip install duckduckgo-search"
+        except Exception as e:
+            return f"{label}搜索失败: {str(e) or type(e).__name__}"
 
 
 class CreateLarkDocToolkit(BaseTool):
@@ -161,6 +220,167 @@ class CreateLarkDocToolkit(BaseTool):
     """
 
 
+# DeerFlow图在进程内只编译一次，所有研究任务共享同一个图
+_research_graph = None
+# 研究并发限制按事件循环区分(Semaphore只能在一个事件循环中使用)：loop -> (上限, Semaphore)
+_research_slots: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def get_research_graph():
+    """返回已编译的DeerFlow图，首次调用时编译"""
+    global _research_graph
+    if _research_graph is None:
+        deer_flow_path = os.path.join(os.getcwd(), "deer_flow")
+        if deer_flow_path not in sys.path:
+            sys.path.insert(0, deer_flow_path)
+
+        from deer_flow.src.graph import build_graph
+
+        _research_graph = build_graph()
+        logger.info("DeerFlow图编译完成")
+    return _research_graph
+
+
+def _research_slots_for(max_concurrent: int) -> asyncio.Semaphore:
+    """当前事件循环内共享的研究并发限制，上限变化时对之后开始的研究生效"""
+    loop = asyncio.get_running_loop()
+    limit, slots = _research_slots.get(loop, (None, None))
+    if limit != max_concurrent:
+        slots = asyncio.Semaphore(max_concurrent)
+        _research_slots[loop] = (max_concurrent, slots)
+    return slots
+
+
+def _field(obj, name: str):
+    # DeerFlow的计划可能是pydantic对象或dict
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def _research_progress(state: dict, seen: set) -> list[str]:
+    """从DeerFlow状态中提取尚未报告过的计划与步骤进度"""
+    plan = state.get("current_plan")
+    # 计划尚未生成或仍是未解析的JSON字符串
+    if plan is None or isinstance(plan, str):
+        return []
+
+    lines = []
+    title = _field(plan, "title") or "研究计划"
+    steps = _field(plan, "steps") or []
+    if ("plan", title) not in seen:
+        seen.add(("plan", title))
+        lines.append(
+            f"\n**{title}**\n"
+            + "".join(f"{i}. {_field(step, 'title')}\n" for i, step in enumerate(steps, 1))
+        )
+    for i, step in enumerate(steps, 1):
+        if _field(step, "execution_res") and ("step", title, i) not in seen:
+            seen.add(("step", title, i))
+            lines.append(f"已完成步骤{i}：{_field(step, 'title')}\n")
+    return lines
+
+
+async def research_events(
+    query: str,
+    max_plan_iterations: int = 3,
+    max_step_num: int = 20,
+    enable_background_investigation: bool = False,
+    max_concurrent: int = 2,
+    cache: Optional[ToolResultCache] = None,
+    bypass_cache: bool = False,
+) -> AsyncIterator[dict]:
+    """运行一次DeerFlow研究
+
+    传入cache时复用近期相同主题的报告，相同主题的并发研究只运行一次。
+
+    Yields:
+        {"type": "progress", "text": ...}: 计划与步骤进度
+        {"type": "report", "text": ...}: 最终报告，之后结束
+    """
+    params = {
+        "max_plan_iterations": max_plan_iterations,
+        "max_step_num": max_step_num,
+        "enable_background_investigation": enable_background_investigation,
+    }
+    if cache is None:
+        async for event in _run_research(query, max_concurrent=max_concurrent, **params):
+            yield event
+        return
+
+    tool = "deep_research"
+    key = ToolResultCache.make_key(tool, query, **params)
+    if not bypass_cache:
+        if key in cache.inflight:
+            yield {"type": "progress", "text": "相同主题的研究正在进行，等待其结果…\n"}
+        report = await cache.join(tool, key)
+        if report is not None:
+            yield {"type": "progress", "text": "（复用近期相同主题的研究结果）\n"}
+            yield {"type": "report", "text": report}
+            return
+
+    future = cache.begin(tool, key, bypass=bypass_cache)
+    report = None
+    try:
+        async for event in _run_research(query, max_concurrent=max_concurrent, **params):
+            if event["type"] == "report":
+                report = event["text"] or None
+            yield event
+    except BaseException as e:
+        await cache.finish(tool, key, future, error=e)
+        raise
+    await cache.finish(tool, key, future, value=report)
+
+
+async def _run_research(
+    query: str,
+    max_plan_iterations: int,
+    max_step_num: int,
+    enable_background_investigation: bool,
+    max_concurrent: int,
+) -> AsyncIterator[dict]:
+    graph = get_research_graph()
+
+    initial_state = {
+        "messages": [{"role": "user", "content": query}],
+        "auto_accepted_plan": True,
+        "enable_background_investigation": enable_background_investigation,
+    }
+
+    # 每次调用使用独立的thread_id，避免并发研究共享checkpoint状态
+    thread_id = f"deep_research_{uuid.uuid4().hex}"
+    config = {
+        "configurable": {
+            "thread_id": thread_id,
+            "max_plan_iterations": max_plan_iterations,
+            "max_step_num": max_step_num,
+        },
+        "recursion_limit": 100,
+    }
+
+    enqueued = time.monotonic()
+    async with _research_slots_for(max_concurrent):
+        started = time.monotonic()
+        logger.info(f"开始深度研究[{thread_id}]: {query}，排队 {started - enqueued:.1f}s")
+        seen = set()
+        try:
+            async for s in graph.astream(
+                input=initial_state, config=config, stream_mode="values"
+            ):
+                if not isinstance(s, dict):
+                    continue
+                for line in _research_progress(s, seen):
+                    yield {"type": "progress", "text": line}
+                if "final_report" in s:
+                    yield {"type": "report", "text": s["final_report"]}
+                    return
+        finally:
+            logger.info(
+                f"深度研究结束[{thread_id}]: 排队 {started - enqueued:.1f}s，"
+                f"运行 {time.monotonic() - started:.1f}s"
+            )
+
+
 class DeepResearchTool(BaseTool):
     """
     DeerFlow DeepResearch as a Tool.
@@ -170,6 +390,10 @@ class DeepResearchTool(BaseTool):
     description: str = (
         "执行深度研究任务。使用DeerFlow的AI研究能力对给定主题进行全面分析和调研。"
     )
+    # 同一事件循环内同时运行的研究任务上限
+    max_concurrent: int = Field(default=2, exclude=True)
+    # 研究报告缓存，None表示不缓存
+    cache: Optional[ToolResultCache] = Field(default=None, exclude=True)
 
     class Input(BaseModel):
         query: str = Field(..., description="研究查询或主题")
@@ -179,8 +403,10 @@ class DeepResearchTool(BaseTool):
         enable_background_investigation: bool = Field(
             default=False, description="是否启用背景调查（网络搜索）"
         )
+        fresh: bool = Field(default=False, description="是否忽略缓存重新研究")
 
     args_schema: Type[BaseModel] = Input
+    model_config = ConfigDict(arbitrary_types_allowed=True)
 
     def _run(self, *args, **kwargs):
         raise NotImplementedError(
@@ -194,53 +420,27 @@ class DeepResearchTool(BaseTool):
         max_plan_iterations: int = 3,
         max_step_num: int = 20,
         enable_background_investigation: bool = False,
+        fresh: bool = False,
     ) -> str:
         """Execute deep research using DeerFlow"""
-        try:
-            import sys
-            import os
-
-            # Add deer_flow to path
-            deer_flow_path = os.path.join(os.getcwd(), "deer_flow")
-            if deer_flow_path not in sys.path:
-                sys.path.insert(0, deer_flow_path)
-
-            from deer_flow.src.graph import build_graph
-
-            # Create the graph
-            graph = build_graph()
-
-            if not query:
-                return "查询不能为空"
-
-            logger.info(f"开始深度研究: {query}")
-
-            initial_state = {
-                "messages": [{"role": "user", "content": query}],
-                "auto_accepted_plan": True,
-                "enable_background_investigation": enable_background_investigation,
-            }
-
-            config = {
-                "configurable": {
-                    "thread_id": "deep_research_tool",
-                    "max_plan_iterations": max_plan_iterations,
-                    "max_step_num": max_step_num,
-                },
-                "recursion_limit": 100,
-            }
+        if not query:
+            return "查询不能为空"
 
+        try:
             final_report = None
-
-            async for s in graph.astream(
-                input=initial_state, config=config, stream_mode="values"
+            async for event in research_events(
+                query,
+                max_plan_iterations=max_plan_iterations,
+                max_step_num=max_step_num,
+                enable_background_investigation=enable_background_investigation,
+                max_concurrent=self.max_concurrent,
+                cache=self.cache,
+                bypass_cache=fresh,
             ):
-                if isinstance(s, dict) and "final_report" in s:
-                    final_report = s["final_report"]
-                    break
+                if event["type"] == "report":
+                    final_report = event["text"]
 
             if final_report:
-                logger.info("深度研究完成")
                 return final_report
             else:
                 return "研究过程中未能生成最终报告"
@@ -253,15 +453,111 @@ class DeepResearchTool(BaseTool):
             return f"深度研究执行失败: {str(e)}"
 
 
+class BackgroundResearchTool(BaseTool):
+    """Start a deep research job that runs outside the chat turn"""
+
+    name: str = "deep_research"
+    description: str = (
+        "在后台启动深度研究任务，对给定主题进行全面分析和调研。调用后立即返回任务ID，"
+        "研究进度和最终报告会通过单独的卡片发送给用户，无需等待结果。"
+    )
+
+    class Input(BaseModel):
+        query: str = Field(..., description="研究查询或主题")
+        max_plan_iterations: int = Field(default=3, description="最大计划迭代次数")
+        max_step_num: int = Field(default=20, description="计划中的最大步骤数")
+        enable_background_investigation: bool = Field(
+            default=False, description="是否启用背景调查（网络搜索）"
+        )
+        fresh: bool = Field(default=False, description="是否忽略缓存重新研究")
+
+    args_schema: Type[BaseModel] = Input
+
+    def _run(self, *args, **kwargs):
+        raise NotImplementedError(
+            "This tool only supports async execution. Please use _arun() instead."
+        )
+
+    async def _arun(
+        self,
+        query: str,
+        max_plan_iterations: int = 3,
+        max_step_num: int = 20,
+        enable_background_investigation: bool = False,
+        fresh: bool = False,
+    ) -> str:
+        """Submit a research job for the current chat"""
+        if not query:
+            return "查询不能为空"
+        chat = current_chat.get()
+        if chat is None:
+            return "当前会话不支持后台研究任务"
+
+        job = await chat.jobs.submit(
+            chat.open_id,
+            chat.chat_id,
+            chat.recv_id_type,
+            query,
+            max_plan_iterations=max_plan_iterations,
+            max_step_num=max_step_num,
+            enable_background_investigation=enable_background_investigation,
+            bypass_cache=fresh,
+        )
+        if job is None:
+            return "本会话进行中的研究任务已达上限，请等待完成或取消后再试"
+        return f"已创建研究任务 {job.job_id}，进度和报告将通过单独的卡片发送给用户。"
+
+
+class CancelResearchTool(BaseTool):
+    """Cancel research jobs of the current chat"""
+
+    name: str = "cancel_research"
+    description: str = "取消当前会话进行中的深度研究任务。不指定任务ID时取消全部。"
+
+    class Input(BaseModel):
+        job_id: Optional[str] = Field(None, description="研究任务ID")
+
+    args_schema: Type[BaseModel] = Input
+
+    def _run(self, *args, **kwargs):
+        raise NotImplementedError(
+            "This tool only supports async execution. Please use _arun() instead."
+        )
+
+    async def _arun(self, job_id: Optional[str] = None) -> str:
+        """Cancel research jobs"""
+        chat = current_chat.get()
+        if chat is None:
+            return "当前会话不支持后台研究任务"
+
+        key = (chat.open_id, chat.chat_id)
+        job_ids = [job_id] if job_id else [job.job_id for job in chat.jobs.active(key)]
+        cancelled = [i for i in job_ids if await chat.jobs.cancel(i, key)]
+        if not cancelled:
+            return "没有可取消的研究任务"
+        return f"已取消研究任务: {', '.join(cancelled)}"
+
+
 class LarkToolkit(BaseToolkit):
     """Toolkit containing all Lark-related tools"""
 
     rag_manager: LarkRAGManager = Field(exclude=True)
+    # 是否提供后台深度研究工具
+    enable_research: bool = False
+    # 网络搜索与深度研究的结果缓存
+    cache: Optional[ToolResultCache] = Field(default=None, exclude=True)
+    # 网络搜索共享的客户端，None时由工具自行创建
+    search_clients: Optional[SearchClients] = Field(default=None, exclude=True)
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     def get_tools(self) -> list[BaseTool]:
         """Get all tools in this toolkit"""
-        return [
+        tools = [
             SearchDocsTool(rag_manager=self.rag_manager),
-            WebSearchTool(),
+            WebSearchTool(
+                cache=self.cache, clients=self.search_clients or SearchClients()
+            ),
         ]
+        if self.enable_research:
+            tools += [BackgroundResearchTool(), CancelResearchTool()]
+        return tools
@@ -0,0 +1,145 @@
+import time
+import uuid
+import asyncio
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Literal, Optional
+
+from src.utlis.card_renderer import TokenBucket
+
+
+@dataclass
+class CardRecord:
+    """一张卡片从创建到结束的记录"""
+
+    open_id: str
+    chat_id: str
+    title: Optional[str]
+    created_at: float
+    first_update_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    updates: int = 0
+    text: str = ""
+
+
+@dataclass
+class FakeLarkServer:
+    """模拟飞书开放平台：每次API调用有固定延迟，并受应用级QPS限制
+
+    Args:
+        api_latency: 每次API调用(发消息、更新卡片)的延迟(秒)
+        rate_limit: 应用级每秒最多调用次数，None表示不限制
+    """
+
+    api_latency: float = 0.05
+    rate_limit: Optional[float] = 50.0
+    cards: list[CardRecord] = field(default_factory=list)
+    messages: list[tuple[str, str, str]] = field(default_factory=list)
+    api_calls: int = 0
+    throttled_seconds: float = 0.0
+    listeners: list[Callable[[CardRecord, str], None]] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.limiter = (
+            TokenBucket(self.rate_limit, max(int(self.rate_limit), 1))
+            if self.rate_limit
+            else None
+        )
+
+    async def call(self):
+        """模拟一次API调用"""
+        if self.limiter is not None:
+            self.throttled_seconds += await self.limiter.acquire()
+        self.api_calls += 1
+        await asyncio.sleep(self.api_latency)
+
+    def emit(self, card: CardRecord, event: Literal["update", "finish"]):
+        for listener in self.listeners:
+            listener(card, event)
+
+
+class FakeLarkAPI:
+    """EasyLarkAPI的本地替身，只实现runner用到的接口"""
+
+    def __init__(self, server: FakeLarkServer):
+        self.server = server
+
+    async def do_send_msg(self, receive_id, content, msg_type, receive_id_type):
+        await self.server.call()
+        self.server.messages.append((receive_id, msg_type, content))
+        return {"message_id": f"om_{uuid.uuid4().hex}"}
+
+
+class FakeLarkClient:
+    """LarkClient的本地替身：每个卡片帧对应一次卡片更新API调用"""
+
+    def __init__(self, api: FakeLarkAPI):
+        self.api = api
+        self.server = api.server
+
+    async def send_card_pipeline(
+        self,
+        frames: AsyncIterator[dict],
+        open_id: str,
+        chat_id: str,
+        recv_id_type: Literal["open_id", "chat_id"] = "open_id",
+        injection_config: Optional[dict] = None,
+    ):
+        card = CardRecord(
+            open_id=open_id,
+            chat_id=chat_id,
+            title=(injection_config or {}).get("chat_title"),
+            created_at=time.monotonic(),
+        )
+        self.server.cards.append(card)
+        # 创建卡片
+        await self.server.call()
+
+        async for frame in frames:
+            await self.server.call()
+            card.updates += 1
+            card.text += frame.get("text", "")
+            if card.first_update_at is None:
+                card.first_update_at = time.monotonic()
+            self.server.emit(card, "update")
+
+        card.finished_at = time.monotonic()
+        self.server.emit(card, "finish")
+
+
+class FakeLarkWsServer:
+    """EasyLarkWsServer的本地替身：由压测脚本主动投递事件，投递有固定延迟"""
+
+    def __init__(
+        self,
+        app_id=None,
+        app_secret=None,
+        callback_reply_message=None,
+        callback_card_action=None,
+        callback_hello=None,
+        delivery_latency: float = 0.01,
+    ):
+        self.callback_reply_message = callback_reply_message
+        self.callback_card_action = callback_card_action
+        self.callback_hello = callback_hello
+        self.delivery_latency = delivery_latency
+
+    async def send_message(
+        self,
+        open_id: str,
+        chat_id: str,
+        content: str,
+        recv_id_type: Literal["open_id", "chat_id"] = "open_id",
+    ) -> str:
+        msg_id = f"om_{uuid.uuid4().hex}"
+        await asyncio.sleep(self.delivery_latency)
+        await self.callback_reply_message(open_id, chat_id, msg_id, content, recv_id_type)
+        return msg_id
+
+    async def click(self, open_id: str, chat_id: str, name: str) -> dict:
+        await asyncio.sleep(self.delivery_latency)
+        return await self.callback_card_action(
+            open_id, chat_id, {"name": name, "event_id": uuid.uuid4().hex}
+        )
+
+    def start(self):
+        raise NotImplementedError("FakeLarkWsServer由压测脚本驱动，不监听真实连接")
@@ -0,0 +1,55 @@
+import asyncio
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """离线压测用的流式对话模型
+
+    首token延迟first_token_latency秒后，按token_latency的间隔逐个输出answer_tokens个token，
+    不发起任何网络请求，也不会调用工具。
+    """
+
+    first_token_latency: float = 0.5
+    token_latency: float = 0.02
+    answer_tokens: int = 200
+    token: str = "测试"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-streaming"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "FakeStreamingChatModel":
+        return self
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        content = self.token * self.answer_tokens
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    def _stream(self, *args: Any, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        raise NotImplementedError("FakeStreamingChatModel只支持异步调用")
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: Optional[list[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for i in range(self.answer_tokens):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=self.token))
+            if run_manager:
+                await run_manager.on_llm_new_token(self.token, chunk=chunk)
+            yield chunk
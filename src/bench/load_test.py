@@ -0,0 +1,197 @@
+"""LarkRunner离线压测
+
+使用本地飞书替身与假流式模型模拟N个并发会话，每个会话串行发送若干轮消息
+（收到上一轮完整回答后，思考一段时间再发下一条），统计吞吐与延迟。
+
+用法：
+    python -m src.bench.load_test --chats 50 --turns 3
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from src.bench.fake_lark import (
+    CardRecord,
+    FakeLarkAPI,
+    FakeLarkClient,
+    FakeLarkServer,
+    FakeLarkWsServer,
+)
+from src.bench.fake_model import FakeStreamingChatModel
+from src.utlis.config import Config
+from src.utlis.logger_config import logger
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return round(values[min(int(len(values) * p), len(values) - 1)], 3)
+
+
+async def run_load_test(
+    chats: int = 20,
+    turns_per_chat: int = 3,
+    think_time: float = 0.5,
+    turn_timeout: float = 300,
+    config: Optional[Config] = None,
+    server: Optional[FakeLarkServer] = None,
+    model=None,
+    agent=None,
+) -> dict:
+    """运行一次压测并返回报告
+
+    Args:
+        chats: 并发会话数
+        turns_per_chat: 每个会话发送的消息数
+        think_time: 两轮之间的平均思考时间(秒)
+        turn_timeout: 单轮等待回答的最长时间(秒)，超时记为失败
+        config: runner与agent使用的配置，默认使用临时数据库
+        server: 飞书替身，可配置API延迟与QPS限制
+        model: agent使用的模型，默认FakeStreamingChatModel
+        agent: 直接指定agent（需实现invoke2lark与aclose），指定后忽略model
+    """
+    from src.runner import LarkRunner, QUEUE_NOTICE_TITLE
+
+    server = server or FakeLarkServer()
+    lark_api = FakeLarkAPI(server)
+    runner = LarkRunner(config, lark_api=lark_api, lark_client=FakeLarkClient(lark_api))
+
+    if agent is None:
+        from src.agents.agent import Agent
+
+        # 知识库不会被检索，embedding不会真正调用
+        os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+        agent = Agent(config, lark_api=lark_api)
+        agent.build_agent(model or FakeStreamingChatModel())
+    runner.set_agent(agent)
+
+    ws = FakeLarkWsServer(
+        callback_reply_message=runner.callback_reply_message,
+        callback_card_action=runner.callback_card_action,
+        callback_hello=runner.call_back_hello,
+    )
+
+    # 每个会话已完成的回答卡片
+    finished: dict[tuple[str, str], asyncio.Queue] = {}
+
+    def on_card(card: CardRecord, event: str):
+        if event == "finish" and card.title != QUEUE_NOTICE_TITLE:
+            finished[(card.open_id, card.chat_id)].put_nowait(card)
+
+    server.listeners.append(on_card)
+
+    ttfc: list[float] = []
+    e2e: list[float] = []
+    updates: list[int] = []
+    failed = 0
+
+    async def simulate_chat(i: int):
+        nonlocal failed
+        key = (f"ou_bench_{i}", f"oc_bench_{i}")
+        finished[key] = asyncio.Queue()
+        # 错开各会话的起始时间
+        await asyncio.sleep(random.uniform(0, think_time))
+
+        for turn in range(turns_per_chat):
+            sent_at = time.monotonic()
+            await ws.send_message(*key, f"第{turn}个问题")
+            try:
+                card = await asyncio.wait_for(finished[key].get(), timeout=turn_timeout)
+            except asyncio.TimeoutError:
+                failed += 1
+                continue
+
+            if card.first_update_at is not None:
+                ttfc.append(card.first_update_at - sent_at)
+            e2e.append(card.finished_at - sent_at)
+            updates.append(card.updates)
+            await asyncio.sleep(random.uniform(0, 2 * think_time))
+
+    started = time.monotonic()
+    await asyncio.gather(*(simulate_chat(i) for i in range(chats)))
+    elapsed = time.monotonic() - started
+
+    report = {
+        "chats": chats,
+        "turns": len(e2e),
+        "failed": failed,
+        "elapsed": round(elapsed, 3),
+        "turns_per_sec": round(len(e2e) / elapsed, 3) if elapsed else 0.0,
+        "ttfc_p50": percentile(ttfc, 0.5),
+        "ttfc_p95": percentile(ttfc, 0.95),
+        "e2e_p50": percentile(e2e, 0.5),
+        "e2e_p95": percentile(e2e, 0.95),
+        "e2e_p99": percentile(e2e, 0.99),
+        "card_updates": sum(updates),
+        "card_updates_per_turn": round(sum(updates) / len(updates), 2) if updates else 0.0,
+        "queue_notices": sum(card.title == QUEUE_NOTICE_TITLE for card in server.cards),
+        "api_calls": server.api_calls,
+        "api_throttled_seconds": round(server.throttled_seconds, 3),
+        "renderer": runner.card_renderer.stats(),
+        "admission": runner.admission.stats(),
+    }
+    await runner.shutdown(timeout=5)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LarkRunner离线压测")
+    parser.add_argument("--chats", type=int, default=20, help="并发会话数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的消息数")
+    parser.add_argument("--think-time", type=float, default=0.5, help="两轮之间的平均间隔(秒)")
+    parser.add_argument("--first-token-latency", type=float, default=0.5)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--answer-tokens", type=int, default=200)
+    parser.add_argument("--api-latency", type=float, default=0.05, help="飞书API延迟(秒)")
+    parser.add_argument("--rate-limit", type=float, default=50.0, help="飞书API每秒调用上限")
+    parser.add_argument("--checkpointer", choices=["memory", "sqlite"], default="sqlite")
+    parser.add_argument("--max-concurrent-runs", type=int, default=None)
+    parser.add_argument("--coalesce-window", type=float, default=None)
+    parser.add_argument("--output", type=str, default=None, help="报告保存路径(json)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = Config(
+            db_file=str(Path(work_dir) / "bench.db"),
+            kb_folder=str(Path(work_dir) / "kb"),
+            checkpointer=args.checkpointer,
+        )
+        if args.max_concurrent_runs is not None:
+            config.max_concurrent_runs = args.max_concurrent_runs
+        if args.coalesce_window is not None:
+            config.coalesce_window = args.coalesce_window
+
+        model = FakeStreamingChatModel(
+            first_token_latency=args.first_token_latency,
+            token_latency=args.token_latency,
+            answer_tokens=args.answer_tokens,
+        )
+        server = FakeLarkServer(api_latency=args.api_latency, rate_limit=args.rate_limit)
+
+        logger.info(f"Load test: {vars(args)}")
+        report = asyncio.run(
+            run_load_test(
+                chats=args.chats,
+                turns_per_chat=args.turns,
+                think_time=args.think_time,
+                config=config,
+                server=server,
+                model=model,
+            )
+        )
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
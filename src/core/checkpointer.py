@@ -0,0 +1,474 @@
+import time
+import asyncio
+import sqlite3
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+import aiosqlite
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+)
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from src.utlis.logger_config import logger
+
+
+class PrunedSqliteSaver(AsyncSqliteSaver):
+    """带保留策略的SQLite checkpointer
+
+    - keep_last: 每个线程(及checkpoint_ns)只保留最近N个checkpoint
+    - thread_ttl: 超过TTL(秒)未活跃的线程整体删除
+    - maintenance_interval: 周期性执行TTL清理与VACUUM的间隔(秒)
+    - stats_interval: 后台统计存储规模的间隔(秒)，stats()只读取缓存的结果
+
+    与AsyncSqliteSaver不同，构造时不需要运行中的事件循环，
+    连接在第一次使用(setup)时才真正打开，因此可以在同步的build_agent中创建。
+    """
+
+    def __init__(
+        self,
+        conn: aiosqlite.Connection,
+        *,
+        keep_last: Optional[int] = 20,
+        thread_ttl: Optional[float] = None,
+        maintenance_interval: Optional[float] = None,
+        stats_interval: Optional[float] = None,
+        db_file: Optional[str] = None,
+        serde: Optional[SerializerProtocol] = None,
+    ):
+        BaseCheckpointSaver.__init__(self, serde=serde)
+        self.jsonplus_serde = JsonPlusSerializer()
+        self.conn = conn
+        self.lock = asyncio.Lock()
+        self.loop = None
+        self.is_setup = False
+        # 父类在建好自己的表后就把is_setup置为True，需要单独的标记与锁
+        # 保证checkpoint_threads建好之前其他协程不会跳过setup
+        self._setup_lock = asyncio.Lock()
+        self._ready = False
+        # aiosqlite连接关闭后无法重新打开，close之后的读写直接报错
+        self._closed = False
+
+        self.keep_last = keep_last
+        self.thread_ttl = thread_ttl
+        self.maintenance_interval = maintenance_interval
+        self.stats_interval = stats_interval
+        self._maintenance_task: Optional[asyncio.Task] = None
+        # 统计使用独立的只读连接，全表扫描不占用共享连接与锁
+        self.db_file = db_file
+        self._stats: dict = {}
+
+    @classmethod
+    def from_db_file(cls, db_file: str, **kwargs) -> "PrunedSqliteSaver":
+        """基于数据库文件创建checkpointer（连接延迟到setup时打开）"""
+        Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+        return cls(aiosqlite.connect(db_file), db_file=db_file, **kwargs)
+
+    async def setup(self) -> None:
+        """建表并绑定事件循环，可重复、可并发调用"""
+        if self._closed:
+            raise RuntimeError("checkpointer已关闭，请重新创建")
+        if self._ready:
+            return
+        async with self._setup_lock:
+            if self._ready:
+                return
+            self.loop = asyncio.get_running_loop()
+            await super().setup()
+            async with self.lock:
+                await self._execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS checkpoint_threads (
+                        thread_id TEXT PRIMARY KEY,
+                        updated_at REAL NOT NULL
+                    )
+                    """
+                )
+                await self.conn.commit()
+            self._ready = True
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """保存checkpoint，并按keep_last裁剪该线程的历史"""
+        next_config = await super().aput(config, checkpoint, metadata, new_versions)
+        thread_id = str(next_config["configurable"]["thread_id"])
+        checkpoint_ns = next_config["configurable"]["checkpoint_ns"]
+
+        async with self.lock:
+            await self._execute(
+                """
+                INSERT INTO checkpoint_threads (thread_id, updated_at) VALUES (?, ?)
+                ON CONFLICT(thread_id) DO UPDATE SET updated_at = excluded.updated_at
+                """,
+                (thread_id, time.time()),
+            )
+            if self.keep_last:
+                await self._prune_locked(thread_id, checkpoint_ns, self.keep_last)
+            await self.conn.commit()
+        return next_config
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """删除线程的全部checkpoint"""
+        await super().adelete_thread(thread_id)
+        async with self.lock:
+            await self._execute(
+                "DELETE FROM checkpoint_threads WHERE thread_id = ?", (str(thread_id),)
+            )
+            await self.conn.commit()
+
+    async def prune_thread(
+        self, thread_id: str, checkpoint_ns: str = "", keep_last: Optional[int] = None
+    ) -> int:
+        """手动裁剪某个线程，返回删除的checkpoint数量"""
+        await self.setup()
+        async with self.lock:
+            deleted = await self._prune_locked(
+                str(thread_id), checkpoint_ns, keep_last or self.keep_last or 1
+            )
+            await self.conn.commit()
+        return deleted
+
+    async def _prune_locked(
+        self, thread_id: str, checkpoint_ns: str, keep_last: int
+    ) -> int:
+        # checkpoint_id 是单调递增的uuid6，按id倒序即按时间倒序
+        deleted = await self._execute(
+            """
+            DELETE FROM checkpoints
+            WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (
+                SELECT checkpoint_id FROM checkpoints
+                WHERE thread_id = ? AND checkpoint_ns = ?
+                ORDER BY checkpoint_id DESC LIMIT ?
+            )
+            """,
+            (thread_id, checkpoint_ns, thread_id, checkpoint_ns, keep_last),
+        )
+        if deleted:
+            await self._execute(
+                """
+                DELETE FROM writes
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN (
+                    SELECT checkpoint_id FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ?
+                )
+                """,
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns),
+            )
+        return deleted
+
+    async def _execute(self, query: str, params: tuple = ()) -> int:
+        """执行语句并立即关闭游标，返回受影响的行数"""
+        async with self.conn.execute(query, params) as cursor:
+            return cursor.rowcount
+
+    async def expire_idle_threads(self, ttl: Optional[float] = None) -> int:
+        """删除超过TTL未活跃的线程，返回删除的线程数量"""
+        ttl = ttl if ttl is not None else self.thread_ttl
+        if ttl is None:
+            return 0
+
+        await self.setup()
+        deadline = time.time() - ttl
+        async with self.lock:
+            async with self.conn.execute(
+                "SELECT thread_id FROM checkpoint_threads WHERE updated_at < ?",
+                (deadline,),
+            ) as cursor:
+                thread_ids = [row[0] for row in await cursor.fetchall()]
+
+            for thread_id in thread_ids:
+                for table in ("checkpoints", "writes", "checkpoint_threads"):
+                    await self._execute(
+                        f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,)
+                    )
+            await self.conn.commit()
+
+        if thread_ids:
+            logger.info(f"Expired {len(thread_ids)} idle checkpoint threads")
+        return len(thread_ids)
+
+    async def vacuum(self) -> None:
+        """回收已删除数据占用的磁盘空间"""
+        await self.setup()
+        async with self.lock:
+            await self.conn.commit()
+            await self._execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            await self._execute("VACUUM")
+
+    STATS_QUERIES = (
+        """
+        SELECT COUNT(*), COALESCE(SUM(
+            COALESCE(LENGTH(checkpoint), 0) + COALESCE(LENGTH(metadata), 0)
+        ), 0)
+        FROM checkpoints
+        """,
+        "SELECT COALESCE(SUM(COALESCE(LENGTH(value), 0)), 0) FROM writes",
+        "SELECT COUNT(*) FROM checkpoint_threads",
+    )
+
+    def stats(self) -> dict:
+        """最近一次refresh_stats的结果：线程数、checkpoint数及序列化数据的字节数"""
+        return dict(self._stats)
+
+    async def refresh_stats(self) -> dict:
+        """扫描checkpoint与writes表统计存储规模（需扫描全表，由维护任务周期性调用）"""
+        await self.setup()
+        if self.db_file is not None:
+            # WAL模式下读连接不阻塞写入
+            rows = await asyncio.to_thread(self._scan_stats)
+        else:
+            async with self.lock:
+                rows = []
+                for query in self.STATS_QUERIES:
+                    async with self.conn.execute(query) as cursor:
+                        rows.append(await cursor.fetchone())
+        (checkpoints, checkpoint_bytes), (write_bytes,), (threads,) = rows
+        self._stats = {
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "bytes": checkpoint_bytes + write_bytes,
+        }
+        return self.stats()
+
+    def _scan_stats(self) -> list[tuple]:
+        conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True)
+        try:
+            return [conn.execute(query).fetchone() for query in self.STATS_QUERIES]
+        finally:
+            conn.close()
+
+    async def maintain(self) -> None:
+        """执行一次维护：TTL清理 + VACUUM"""
+        await self.expire_idle_threads()
+        await self.vacuum()
+
+    def start_maintenance(self) -> None:
+        """启动周期性维护与统计任务（需要在事件循环中调用）"""
+        if self._maintenance_task:
+            return
+        if not self.maintenance_interval and not self.stats_interval:
+            return
+        self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def _maintenance_loop(self) -> None:
+        interval = min(i for i in (self.maintenance_interval, self.stats_interval) if i)
+        maintained_at = time.monotonic()
+        while True:
+            if (
+                self.maintenance_interval
+                and time.monotonic() - maintained_at >= self.maintenance_interval
+            ):
+                maintained_at = time.monotonic()
+                try:
+                    await self.maintain()
+                except Exception as e:
+                    logger.error(f"Checkpoint maintenance failed: {e}")
+            if self.stats_interval:
+                try:
+                    await self.refresh_stats()
+                except Exception as e:
+                    logger.warning(f"Checkpoint stats refresh failed: {e}")
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        """停止维护任务并关闭连接，关闭后不可再使用"""
+        self._closed = True
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+        if self.is_setup:
+            await self.conn.close()
+
+
+class BoundedMemorySaver(MemorySaver):
+    """有界的内存checkpointer
+
+    - keep_last: 每个线程(及checkpoint_ns)只保留最近N个checkpoint，默认只保留最新一个
+    - thread_ttl: 超过TTL(秒)未访问的线程被淘汰
+    - max_threads / max_bytes: 超出预算时按LRU淘汰最久未访问的线程
+
+    淘汰只在写入时进行，当前正在写入的线程不会被淘汰。
+    """
+
+    def __init__(
+        self,
+        *,
+        keep_last: Optional[int] = 1,
+        thread_ttl: Optional[float] = None,
+        max_threads: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        serde: Optional[SerializerProtocol] = None,
+    ):
+        super().__init__(serde=serde)
+        self.keep_last = keep_last
+        self.thread_ttl = thread_ttl
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+
+        # thread_id -> 最近访问时间，按访问顺序排列(LRU)
+        self._access: OrderedDict[str, float] = OrderedDict()
+        self._thread_bytes: dict[str, int] = {}
+        self._total_bytes = 0
+        self._blob_keys: dict[str, set] = {}
+        self._write_keys: dict[str, set] = {}
+        self.evicted_threads = 0
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        if thread_id not in self._access:
+            # 避免defaultdict为未知线程创建空条目
+            return None
+        self._touch(thread_id)
+        return super().get_tuple(config)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+
+        self._blob_keys.setdefault(thread_id, set()).update(
+            (thread_id, checkpoint_ns, k, v) for k, v in new_versions.items()
+        )
+        if self.keep_last:
+            self._prune(thread_id, checkpoint_ns, self.keep_last)
+        self._touch(thread_id)
+        self._update_size(thread_id)
+        self._evict(keep=thread_id)
+        return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        super().put_writes(config, writes, task_id, task_path)
+        thread_id = config["configurable"]["thread_id"]
+        self._write_keys.setdefault(thread_id, set()).add(
+            (
+                thread_id,
+                config["configurable"].get("checkpoint_ns", ""),
+                config["configurable"]["checkpoint_id"],
+            )
+        )
+        self._touch(thread_id)
+        self._update_size(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.storage.pop(thread_id, None)
+        for key in self._write_keys.pop(thread_id, ()):
+            self.writes.pop(key, None)
+        for key in self._blob_keys.pop(thread_id, ()):
+            self.blobs.pop(key, None)
+        self._access.pop(thread_id, None)
+        self._total_bytes -= self._thread_bytes.pop(thread_id, 0)
+
+    def stats(self) -> dict:
+        """当前存储规模"""
+        return {
+            "threads": len(self._access),
+            "checkpoints": sum(
+                len(checkpoints)
+                for namespaces in self.storage.values()
+                for checkpoints in namespaces.values()
+            ),
+            "bytes": self._total_bytes,
+            "evicted_threads": self.evicted_threads,
+            "max_threads": self.max_threads,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _touch(self, thread_id: str) -> None:
+        self._access[thread_id] = time.monotonic()
+        self._access.move_to_end(thread_id)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str, keep_last: int) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= keep_last:
+            return
+
+        for checkpoint_id in sorted(checkpoints)[:-keep_last]:
+            del checkpoints[checkpoint_id]
+            write_key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(write_key, None)
+            self._write_keys.get(thread_id, set()).discard(write_key)
+
+        # 只保留仍被剩余checkpoint引用的channel版本
+        referenced = set()
+        for saved, _, _ in checkpoints.values():
+            versions = self.serde.loads_typed(saved)["channel_versions"]
+            referenced.update(
+                (thread_id, checkpoint_ns, k, v) for k, v in versions.items()
+            )
+        blob_keys = self._blob_keys.get(thread_id, set())
+        for key in [k for k in blob_keys if k[1] == checkpoint_ns]:
+            if key not in referenced:
+                self.blobs.pop(key, None)
+                blob_keys.discard(key)
+
+    def _update_size(self, thread_id: str) -> None:
+        size = 0
+        for checkpoints in self.storage.get(thread_id, {}).values():
+            for saved, metadata, _ in checkpoints.values():
+                size += len(saved[1]) + len(metadata[1])
+        for key in self._blob_keys.get(thread_id, ()):
+            if key in self.blobs:
+                size += len(self.blobs[key][1])
+        for key in self._write_keys.get(thread_id, ()):
+            for _, _, value, _ in self.writes.get(key, {}).values():
+                size += len(value[1])
+        self._total_bytes += size - self._thread_bytes.get(thread_id, 0)
+        self._thread_bytes[thread_id] = size
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """按TTL和容量预算淘汰线程"""
+        if self.thread_ttl is not None:
+            deadline = time.monotonic() - self.thread_ttl
+            for thread_id, accessed_at in list(self._access.items()):
+                if accessed_at >= deadline:
+                    break
+                if thread_id != keep:
+                    self._evict_thread(thread_id)
+
+        def over_budget() -> bool:
+            if self.max_threads is not None and len(self._access) > self.max_threads:
+                return True
+            if self.max_bytes is not None:
+                return self._total_bytes > self.max_bytes
+            return False
+
+        for thread_id in list(self._access):
+            if not over_budget():
+                break
+            if thread_id != keep:
+                self._evict_thread(thread_id)
+
+    def _evict_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+        self.evicted_threads += 1
+        logger.debug(f"Evicted idle checkpoint thread {thread_id}")
@@ -1,3 +1,6 @@
+import time
+from contextlib import asynccontextmanager
+
 import aiosqlite
 
 
@@ -5,9 +8,39 @@ class DatabaseClient:
     def __init__(self, db_file: str = "resources/db/dev.db"):
         self.db_file = db_file
         self.connection = None
+        # 单连接上的查询在aiosqlite线程中串行执行，耗时包含排队等待
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.in_flight = 0
+
+    @asynccontextmanager
+    async def _track(self):
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.queries += 1
+            self.query_seconds += time.monotonic() - started
+
+    def stats(self) -> dict:
+        return {
+            "queries": self.queries,
+            "query_seconds": round(self.query_seconds, 3),
+            "in_flight": self.in_flight,
+        }
 
     async def connect(self):
-        self.connection = await aiosqlite.connect(self.db_file)
+        connection = await aiosqlite.connect(self.db_file)
+        if self.connection is not None:
+            # 并发的首次调用：其他协程已经建立了连接
+            await connection.close()
+            return
+        self.connection = connection
+        # WAL模式允许多个worker进程同时读写同一个数据库
+        async with connection.execute("PRAGMA journal_mode=WAL"):
+            pass
         # Ensure foreign key support is enabled if using them later (optional for now)
         # await self.connection.execute("PRAGMA foreign_keys = ON")
 
@@ -26,17 +59,24 @@ class DatabaseClient:
         # Reverting to a simpler model, assuming self.connection is managed outside.
         # For multiple operations, it's better to pass the connection around or ensure it's managed.
         # For now, let's assume self.connection is valid.
-        async with self.connection.cursor() as cursor:
+        async with self._track(), self.connection.cursor() as cursor:
             await cursor.execute(query, params)
             await self.connection.commit()  # Ensure changes are committed
 
     async def fetchone(self, query: str, params: tuple = ()):
         if not self.connection:
             await self.connect()
-        async with self.connection.cursor() as cursor:
+        async with self._track(), self.connection.cursor() as cursor:
             await cursor.execute(query, params)
             return await cursor.fetchone()
 
+    async def fetchall(self, query: str, params: tuple = ()):
+        if not self.connection:
+            await self.connect()
+        async with self._track(), self.connection.cursor() as cursor:
+            await cursor.execute(query, params)
+            return await cursor.fetchall()
+
     async def create_user_db_table(self, user_id: str): ...
 
     async def create_docs_metadata_table(self):
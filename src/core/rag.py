@@ -1,4 +1,6 @@
 import os
+import json
+import time
 from pathlib import Path
 from src.core.lark_sync import LarkSynchronizer
 from langchain_core.documents import Document
@@ -7,9 +9,30 @@ from langchain_community.vectorstores import FAISS
 from langchain_core.embeddings import Embeddings
 from langchain_community.embeddings import DashScopeEmbeddings
 from typing import Optional, List, Dict, Tuple
+from src.runtime.resilience import Resilience
+from src.runtime.tracing import span
 from src.utlis.logger_config import logger
 
 
+# 知识库目录中每个描述保留的字符数
+CATALOG_DESC_CHARS = 200
+
+
+def read_meta(kb_dir: Path) -> Dict:
+    """读取知识库的构建信息，旧版本构建的知识库没有meta.json时以索引文件修改时间作为构建时间"""
+    meta_path = kb_dir / "meta.json"
+    index_path = kb_dir / "index.faiss"
+    try:
+        if meta_path.exists():
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        if index_path.exists():
+            return {"built_at": index_path.stat().st_mtime}
+    except Exception as e:
+        logger.warning(f"Failed to read meta for {kb_dir.name}: {str(e)}")
+    return {}
+
+
 class KnowledgeBase:
     """单个RAG知识库，负责构建、保存、加载和查询"""
 
@@ -19,20 +42,35 @@ class KnowledgeBase:
         lark_sync: LarkSynchronizer,
         embeddings: Optional[Embeddings] = None,
         storage_folder: str = "resources/kb",
+        resilience: Optional[Resilience] = None,
+        embedding_timeout: Optional[float] = 10,
     ):
         self.space_id = space_id
         self.desc = ""
+        # query embedding经过熔断与对冲，embedding服务异常时降级为关键词检索
+        self.resilience = resilience
+        self.embedding_timeout = embedding_timeout
 
         self.lark_sync = lark_sync
         self.embeddings = embeddings or DashScopeEmbeddings(model="text-embedding-v4")
         self.vector_store: Optional[FAISS] = None
+        # 全部片段，构建与加载时记录，供关键词检索使用
+        self.chunks: List[Document] = []
         self.storage_folder = storage_folder
 
         self.is_built = False
+        # 构建信息，随索引一起保存到meta.json
+        self.num_documents: Optional[int] = None
+        self.built_at: Optional[float] = None
 
         # 尝试读取README.md文件作为描述
         self._load_description()
 
+    @property
+    def version(self) -> Optional[int]:
+        """知识库版本(构建时间)，与知识库目录中的version一致"""
+        return int(self.built_at) if self.built_at else None
+
     def _load_description(self) -> None:
         """从README.md文件加载知识库描述"""
         readme_path = os.path.join(self.storage_folder, self.space_id, "README.md")
@@ -90,7 +128,10 @@ class KnowledgeBase:
 
         # 创建向量存储
         self.vector_store = FAISS.from_documents(split_docs, self.embeddings)
+        self.chunks = split_docs
         self.is_built = True
+        self.num_documents = len(documents)
+        self.built_at = time.time()
 
         logger.info(f"Built knowledge base for space {self.space_id}")
         logger.info(f"Documents: {len(documents)}, Chunks: {len(split_docs)}")
@@ -101,7 +142,40 @@ class KnowledgeBase:
         if not self.is_built or not self.vector_store:
             raise ValueError("Knowledge base not built yet. Call build() first.")
 
-        return self.vector_store.similarity_search(query, k=top_k)
+        if self.resilience is None:
+            with span("similarity_search", "retrieval", space_id=self.space_id):
+                return self.vector_store.similarity_search(query, k=top_k)
+
+        try:
+            with span("embed_query", "embedding"):
+                vector = await self.resilience.call(
+                    "embedding",
+                    lambda: self.embeddings.aembed_query(query),
+                    deadline=self.embedding_timeout,
+                    hedge=True,
+                )
+        except Exception as e:
+            logger.warning(f"Embedding不可用，使用关键词检索: {str(e) or type(e).__name__}")
+            with span("keyword_search", "retrieval", space_id=self.space_id):
+                return self.keyword_search(query, top_k)
+        with span("vector_search", "retrieval", space_id=self.space_id):
+            return self.vector_store.similarity_search_by_vector(vector, k=top_k)
+
+    def keyword_search(self, query: str, top_k: int = 5) -> List[Document]:
+        """不依赖embedding的关键词检索：按查询中的词与中文二元组在文档中的出现次数排序"""
+        terms = set()
+        for word in query.lower().split():
+            terms.add(word)
+            terms.update(word[i : i + 2] for i in range(len(word) - 1))
+
+        scored = []
+        for doc in self.chunks:
+            content = doc.page_content.lower()
+            score = sum(content.count(term) for term in terms)
+            if score:
+                scored.append((score, doc))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [doc for _, doc in scored[:top_k]]
 
     def save(self, save_path: str) -> None:
         """保存知识库"""
@@ -112,8 +186,19 @@ class KnowledgeBase:
         self.vector_store.save_local(save_path)
         # 保存描述文件
         self._save_description(save_path)
+        self._save_meta(save_path)
         logger.info(f"Knowledge base saved to: {save_path}")
 
+    def _save_meta(self, save_path: str) -> None:
+        """保存构建信息到meta.json，供知识库目录读取规模与版本"""
+        meta = {
+            "chunks": len(self.vector_store.index_to_docstore_id),
+            "documents": self.num_documents,
+            "built_at": self.built_at or time.time(),
+        }
+        with open(os.path.join(save_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
     def load(self, load_path: str = None) -> None:
         """加载知识库"""
         if not load_path:
@@ -125,6 +210,13 @@ class KnowledgeBase:
         self.vector_store = FAISS.load_local(
             load_path, self.embeddings, allow_dangerous_deserialization=True
         )
+        self.chunks = [
+            self.vector_store.docstore.search(doc_id)
+            for doc_id in self.vector_store.index_to_docstore_id.values()
+        ]
+        meta = read_meta(Path(load_path))
+        self.num_documents = meta.get("documents")
+        self.built_at = meta.get("built_at")
         self.is_built = True
         # 重新加载描述
         self._load_description()
@@ -176,11 +268,18 @@ class LarkRAGManager:
         lark_sync: LarkSynchronizer,
         storage_folder: str = "resources/kb",
         embeddings: Optional[Embeddings] = None,
+        resilience: Optional[Resilience] = None,
+        embedding_timeout: Optional[float] = 10,
     ):
         self.storage_folder = Path(storage_folder)
         self.lark_sync = lark_sync
         self.embeddings = embeddings or DashScopeEmbeddings(model="text-embedding-v4")
+        self.resilience = resilience
+        self.embedding_timeout = embedding_timeout
         self.knowledge_bases: Dict[str, KnowledgeBase] = {}
+        # 知识库目录缓存，构建后刷新，读取时不再扫描磁盘
+        self._catalog: Optional[List[Dict]] = None
+        self._catalog_prompt: Optional[str] = None
 
         # 确保存储文件夹存在
         self.storage_folder.mkdir(parents=True, exist_ok=True)
@@ -189,7 +288,12 @@ class LarkRAGManager:
         """获取或创建知识库"""
         if space_id not in self.knowledge_bases:
             self.knowledge_bases[space_id] = KnowledgeBase(
-                space_id=space_id, lark_sync=self.lark_sync, embeddings=self.embeddings
+                space_id=space_id,
+                lark_sync=self.lark_sync,
+                embeddings=self.embeddings,
+                storage_folder=str(self.storage_folder),
+                resilience=self.resilience,
+                embedding_timeout=self.embedding_timeout,
             )
         return self.knowledge_bases[space_id]
 
@@ -201,19 +305,31 @@ class LarkRAGManager:
         await kb.build(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
         save_path = os.path.join(self.storage_folder, space_id)
         kb.save(save_path)
+        self.refresh_catalog()
         return kb
 
     def load_knowledge_base(self, space_id: str) -> KnowledgeBase:
-        """加载已保存的知识库"""
+        """加载已保存的知识库
+
+        已加载的直接返回；磁盘上的版本与已加载的不同(如被其他进程重新构建)时重新加载。
+        """
         kb = self.get_knowledge_base(space_id)
-        kb.load()
+        if not kb.is_built:
+            kb.load()
+            return kb
+
+        built_at = read_meta(self.storage_folder / space_id).get("built_at")
+        if built_at and int(built_at) != kb.version:
+            logger.info(f"Knowledge base {space_id} changed on disk, reloading")
+            kb.load()
+            self.refresh_catalog()
         return kb
 
-    def list_knowledge_bases(self) -> List[Tuple[str, str]]:
-        """列出所有可用的知识库，返回(space_id, description)元组列表"""
-        kb_list = []
+    def refresh_catalog(self) -> List[Dict]:
+        """扫描存储目录，重建知识库目录(space_id、描述、规模、版本)"""
+        catalog = []
 
-        for kb_dir in self.storage_folder.iterdir():
+        for kb_dir in sorted(self.storage_folder.iterdir()):
             if kb_dir.is_dir():
                 space_id = kb_dir.name
                 description = ""
@@ -230,9 +346,42 @@ class LarkRAGManager:
                     )
                     description = f"Description unavailable for {space_id}"
 
-                kb_list.append((space_id, description))
+                meta = read_meta(kb_dir)
+                catalog.append(
+                    {
+                        "space_id": space_id,
+                        "description": description,
+                        "chunks": meta.get("chunks"),
+                        "documents": meta.get("documents"),
+                        "version": int(meta["built_at"]) if meta.get("built_at") else None,
+                    }
+                )
 
-        return kb_list
+        self._catalog = catalog
+        self._catalog_prompt = None
+        logger.info(f"Knowledge base catalog refreshed: {len(catalog)} knowledge bases")
+        return catalog
+
+    def catalog(self) -> List[Dict]:
+        """知识库目录，首次读取时扫描一次"""
+        if self._catalog is None:
+            self.refresh_catalog()
+        return self._catalog
+
+    def list_knowledge_bases(self) -> List[Tuple[str, str]]:
+        """列出所有可用的知识库，返回(space_id, description)元组列表"""
+        return [(entry["space_id"], entry["description"]) for entry in self.catalog()]
+
+    def render_catalog(self) -> str:
+        """渲染供系统提示词使用的知识库目录，结果缓存到下次刷新"""
+        if self._catalog_prompt is None:
+            lines = []
+            for entry in self.catalog():
+                desc = " ".join(entry["description"].split())[:CATALOG_DESC_CHARS]
+                size = f"，{entry['chunks']}个片段" if entry["chunks"] else ""
+                lines.append(f"- {entry['space_id']}: {desc}{size}")
+            self._catalog_prompt = "\n".join(lines)
+        return self._catalog_prompt
 
     async def query(
         self,
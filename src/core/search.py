@@ -0,0 +1,165 @@
+import os
+import time
+import asyncio
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+
+from src.runtime.resilience import Resilience
+from src.runtime.tracing import span
+from src.utlis.logger_config import logger
+
+
+TAVILY_API_URL = "https://api.tavily.com"
+
+
+def _percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return round(values[min(int(len(values) * p), len(values) - 1)], 3)
+
+
+class SearchClients:
+    """长期复用的搜索客户端
+
+    所有HTTP搜索共享一个带连接池与keep-alive的httpx.AsyncClient，避免每次调用重新建连与TLS握手；
+    每个搜索引擎有独立的并发上限与超时，并记录调用耗时。
+    传入resilience时搜索请求经过熔断器，慢请求会被对冲。
+    """
+
+    def __init__(
+        self,
+        timeout: float = 15,
+        max_connections: int = 20,
+        concurrency: Optional[dict[str, int]] = None,
+        default_concurrency: int = 4,
+        latency_window: int = 200,
+        resilience: Optional[Resilience] = None,
+    ):
+        self.timeout = timeout
+        self.resilience = resilience
+        self.max_connections = max_connections
+        self.concurrency = concurrency or {}
+        self.default_concurrency = default_concurrency
+
+        self.http: Optional[httpx.AsyncClient] = None
+        self.slots: dict[str, asyncio.Semaphore] = {}
+        self.latencies: dict[str, deque] = defaultdict(lambda: deque(maxlen=latency_window))
+        self.calls: dict[str, int] = defaultdict(int)
+        self.errors: dict[str, int] = defaultdict(int)
+        # num_results -> DuckDuckGoSearchResults
+        self._duckduckgo: dict[int, Any] = {}
+
+    def _client(self) -> httpx.AsyncClient:
+        # 在事件循环中首次使用时创建
+        if self.http is None:
+            self.http = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60,
+                ),
+            )
+        return self.http
+
+    def _slots(self, engine: str) -> asyncio.Semaphore:
+        if engine not in self.slots:
+            self.slots[engine] = asyncio.Semaphore(
+                self.concurrency.get(engine, self.default_concurrency)
+            )
+        return self.slots[engine]
+
+    async def search(self, engine: str, query: str, max_results: int = 5) -> Any:
+        """调用指定搜索引擎，超时或出错时抛出异常"""
+        slots = self._slots(engine)
+        async with slots:
+            started = time.monotonic()
+            try:
+                with span(f"search:{engine}", "search"):
+                    if self.resilience is not None:
+                        # 搜索是幂等的，慢请求可以对冲
+                        return await self.resilience.call(
+                            f"search:{engine}",
+                            self._hedgeable(slots, engine, query, max_results),
+                            deadline=self.timeout,
+                            hedge=True,
+                            # 对冲请求同样受引擎并发上限约束，没有空闲名额时不对冲
+                            can_hedge=lambda: not slots.locked(),
+                        )
+                    # 整体超时同样约束在线程池中执行的同步搜索
+                    return await asyncio.wait_for(
+                        self._search(engine, query, max_results), timeout=self.timeout
+                    )
+            except Exception:
+                self.errors[engine] += 1
+                raise
+            finally:
+                self.calls[engine] += 1
+                self.latencies[engine].append(time.monotonic() - started)
+
+    def _hedgeable(
+        self, slots: asyncio.Semaphore, engine: str, query: str, max_results: int
+    ) -> Callable[[], Awaitable[Any]]:
+        """首次调用使用调用方已持有的名额，之后的对冲请求各自获取名额"""
+        attempts = 0
+
+        async def attempt() -> Any:
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                return await self._search(engine, query, max_results)
+            async with slots:
+                return await self._search(engine, query, max_results)
+
+        return attempt
+
+    async def _search(self, engine: str, query: str, max_results: int) -> Any:
+        if engine == "tavily":
+            return await self._tavily(query, max_results)
+        if engine == "duckduckgo":
+            return await self._duckduckgo_search(query, max_results)
+        raise ValueError(f"不支持的搜索引擎: {engine}")
+
+    async def _tavily(self, query: str, max_results: int) -> dict:
+        # Tavily Search - 专为AI优化的搜索引擎，直接调用REST接口以复用连接池
+        api_key = os.getenv("TAVILY_API_KEY")
+        if not api_key:
+            raise ValueError("未设置TAVILY_API_KEY")
+        base_url = os.getenv("TAVILY_API_BASE_URL", TAVILY_API_URL)
+        response = await self._client().post(
+            f"{base_url}/search",
+            json={"query": query, "max_results": max_results},
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _duckduckgo_search(self, query: str, max_results: int) -> str:
+        # DuckDuckGo Search - 免费隐私友好搜索，HTTP请求由duckduckgo_search库自行管理
+        tool = self._duckduckgo.get(max_results)
+        if tool is None:
+            from langchain_community.tools import DuckDuckGoSearchResults
+
+            tool = DuckDuckGoSearchResults(num_results=max_results)
+            self._duckduckgo[max_results] = tool
+        return await tool.ainvoke({"query": query})
+
+    def stats(self) -> dict:
+        return {
+            engine: {
+                "calls": self.calls[engine],
+                "errors": self.errors[engine],
+                "latency_p50": _percentile(self.latencies[engine], 0.5),
+                "latency_p95": _percentile(self.latencies[engine], 0.95),
+            }
+            for engine in self.calls
+        }
+
+    async def aclose(self):
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+            logger.info(f"Search clients closed: {self.stats()}")
@@ -1,51 +1,158 @@
 # Taro Lark Runner - 飞书端交互逻辑
 import os
-from typing import Literal, Optional, Any
-from pydantic import BaseModel
+import json
+import time
+import signal
+import asyncio
+from typing import Callable, Literal, Optional
 
-from easylark.conn import EasyLarkAPI, EasyLarkWsServer
-from easylark.client.lark_client import LarkClient
 from .utlis.config import Config, get_config
+from .utlis.card_renderer import CardRenderer
 from .utlis.logger_config import logger
 from .agents.agent import Agent
+from .core.db_client import DatabaseClient
+from .runtime.sessions import RuntimeConfig, SessionStore
+from .runtime.dedupe import DedupeCache
+from .runtime.admission import AdmissionController
+from .runtime.scheduler import FairScheduler
+from .runtime.jobs import ChatContext, JobManager, ResearchJob, current_chat
+from .runtime.tracing import JsonlSpanExporter, OtlpSpanExporter, Trace, Tracer
+from .runtime.metrics import Metric, MetricsRegistry, MetricsServer
+from .agents.toolkits import research_events
 
 
-class RuntimeConfig(BaseModel):
-    chat_title: str = None
-    thread_id: Optional[str] = None
-    tenant_id: Optional[str] = None
-
-    messages_len: int = 1
-    max_messages_len: int = 10
-    messages_queue: list[str] = []
-    take_interupt: Optional[bool] = None
-    processing: bool = False
+# 排队提示卡片的标题
+QUEUE_NOTICE_TITLE = "**排队中**"
 
 
 class LarkRunner:
     """飞书交互运行器 - 专注于飞书WebSocket连接和消息处理"""
 
-    def __init__(self, config: str | Config = "dev"):
+    def __init__(
+        self,
+        config: str | Config = "dev",
+        owns: Optional[Callable[[tuple[str, str]], bool]] = None,
+        lark_api=None,
+        lark_client=None,
+        metrics_port: Optional[int] = None,
+    ):
+        """
+        Args:
+            config: 配置或环境名称
+            owns: 多进程模式下判断会话是否由本进程负责，重启恢复时只恢复这些会话
+            lark_api: 飞书API，默认创建EasyLarkAPI（压测时可传入本地替身）
+            lark_client: 飞书卡片客户端，默认基于lark_api创建LarkClient
+            metrics_port: 指标端口，默认使用config.metrics_port
+        """
         if isinstance(config, str):
             self.config = get_config(config)
         else:
             self.config = config
+        self.config.ensure_directories()
 
         # 初始化飞书相关组件
-        self.lark_api = EasyLarkAPI(
-            app_id=os.getenv("LARK_APP_ID"),
-            app_secret=os.getenv("LARK_APP_SECRET"),
-            log_level="INFO",
-            auto_refresh=True,
-        )
-        self.lark_client = LarkClient(self.lark_api)
+        if lark_api is None:
+            from easylark.conn import EasyLarkAPI
+
+            lark_api = EasyLarkAPI(
+                app_id=os.getenv("LARK_APP_ID"),
+                app_secret=os.getenv("LARK_APP_SECRET"),
+                log_level="INFO",
+                auto_refresh=True,
+            )
+        if lark_client is None:
+            from easylark.client.lark_client import LarkClient
+
+            lark_client = LarkClient(lark_api)
+        self.lark_api = lark_api
+        self.lark_client = lark_client
         self.lark_ws = None
+        self.card_renderer = CardRenderer(
+            min_interval=self.config.card_update_interval,
+            global_rate=self.config.card_global_rate,
+        )
 
         # Agent实例 - 由外部设置
         self.agent: Optional[Agent] = None
 
-        # 运行时配置
-        self.runtime_configs: dict[str, RuntimeConfig] = {}
+        # 运行时配置：内存LRU + SQLite持久化
+        self.db_api = DatabaseClient(self.config.db_file)
+        self.runtime_configs = SessionStore(
+            self.db_api,
+            max_hot=self.config.session_max_hot,
+            idle_ttl=self.config.session_idle_ttl,
+        )
+
+        # 重复投递的消息/卡片事件去重
+        self.dedupe = DedupeCache(
+            self.db_api if self.config.dedupe_persist else None,
+            ttl=self.config.dedupe_ttl,
+            max_size=self.config.dedupe_max_size,
+        )
+
+        # 每个会话一个worker任务，由加权公平调度器按车道分配运行名额
+        self.workers: dict[tuple[str, str], asyncio.Task] = {}
+        self.worker_events: dict[tuple[str, str], asyncio.Event] = {}
+        self.scheduler = FairScheduler(
+            lanes=self.config.scheduler_lanes,
+            max_total=self.config.max_concurrent_runs,
+            weights=self.config.scheduler_weights,
+        )
+        # 会话近期轮次耗时(秒)的滑动平均，用于选择车道
+        self.admission = AdmissionController(
+            self.scheduler,
+            queue_threshold=self.config.admission_queue_threshold,
+            latency_threshold=self.config.admission_latency_threshold,
+            reject_threshold=self.config.admission_reject_threshold,
+        )
+        # 正在运行的轮次的停止信号，Stop时设置以取消agent任务
+        self.stop_events: dict[tuple[str, str], asyncio.Event] = {}
+        # 正在展示排队位置的会话
+        self.queue_notices: dict[tuple[str, str], asyncio.Task] = {}
+        # 后台深度研究任务，在会话轮次之外运行
+        self.jobs = JobManager(
+            self.db_api,
+            self.lark_client,
+            research=self._research,
+            card_renderer=self.card_renderer,
+            max_jobs_per_chat=self.config.research_max_jobs_per_chat,
+            # 深度研究占用research车道的名额，与普通对话的名额相互独立
+            slot=self._research_slot if "research" in self.scheduler.lanes else None,
+        )
+
+        # 每轮的耗时分解：排队、模型、工具、RAG与卡片推送
+        exporters = []
+        if self.config.tracing_jsonl:
+            exporters.append(JsonlSpanExporter(self.config.tracing_jsonl))
+        if self.config.tracing_otlp_endpoint:
+            exporters.append(OtlpSpanExporter(self.config.tracing_otlp_endpoint))
+        self.tracer = Tracer(exporters, enabled=self.config.tracing_enabled)
+        # 会话最早一条未处理消息的到达时间，用于统计排队耗时
+        self.enqueued_at: dict[tuple[str, str], float] = {}
+
+        # Prometheus指标：直方图在轮次结束时记录，其余指标抓取时读取各组件的统计
+        self.metrics = MetricsRegistry()
+        self.metrics.register(self._collect_metrics)
+        self.turn_seconds = self.metrics.histogram("taro_turn_duration_seconds", "每轮对话耗时")
+        self.queue_wait_seconds = self.metrics.histogram(
+            "taro_queue_wait_seconds", "消息到达至开始处理的等待时间"
+        )
+        self.tool_seconds = self.metrics.histogram("taro_tool_duration_seconds", "工具调用耗时")
+        self.ttft_seconds = self.metrics.histogram("taro_llm_ttft_seconds", "模型调用首token耗时")
+        if metrics_port is None:
+            metrics_port = self.config.metrics_port
+        self.metrics_server = None
+        if metrics_port is not None:
+            self.metrics_server = MetricsServer(
+                self.metrics, host=self.config.metrics_host, port=metrics_port
+            )
+        self._metrics_task: Optional[asyncio.Task] = None
+
+        # 优雅停机：draining后不再启动新的轮次，新消息只入队持久化，重启后恢复
+        self.draining = False
+        self.owns = owns
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._resume_task: Optional[asyncio.Task] = None
 
     def set_agent(self, agent: Agent):
         """设置Agent实例
@@ -55,6 +162,15 @@ class LarkRunner:
         """
         self.agent = agent
 
+    def _research(self, query: str, **params):
+        """后台研究任务，与agent的工具共享结果缓存"""
+        return research_events(
+            query,
+            max_concurrent=self.config.research_max_concurrent,
+            cache=getattr(self.agent, "tool_cache", None),
+            **params,
+        )
+
     async def call_back_hello(
         self, open_id, chat_id, recv_id_id_type: Literal["open_id", "chat_id"]
     ):
@@ -66,19 +182,29 @@ class LarkRunner:
 
     async def callback_card_action(self, open_id: str, chat_id: str, actions: dict):
         """处理卡片点击事件的回调"""
-        if (open_id, chat_id) not in self.runtime_configs:
-            self.runtime_configs[(open_id, chat_id)] = RuntimeConfig()
+        self.ensure_started()
+        if await self.dedupe.is_duplicate(actions.get("event_id"), "card_action"):
+            return {}
 
-        runtime_config = self.runtime_configs[(open_id, chat_id)]
+        runtime_config = await self.runtime_configs.get((open_id, chat_id))
 
         if actions["name"] == "stop":
             runtime_config.take_interupt = True
+            stop_event = self.stop_events.get((open_id, chat_id))
+            if stop_event is not None:
+                stop_event.set()
             card_content = {"toast": {"type": "info", "content": "已停止生成"}}
+        elif actions["name"] == "cancel_research":
+            if await self.jobs.cancel(actions.get("job_id"), (open_id, chat_id)):
+                card_content = {"toast": {"type": "info", "content": "已取消研究任务"}}
+            else:
+                card_content = {"toast": {"type": "info", "content": "研究任务已结束"}}
         elif actions["name"] == "retry":
             card_content = {"toast": {"type": "info", "content": "已重试"}}
         elif actions["name"] == "new_chat":
             card_content = {"toast": {"type": "info", "content": "已清除上下文"}}
             self._clear_chat_context(runtime_config)
+            await self.runtime_configs.save((open_id, chat_id))
         elif actions["name"] == "setting":
             card_content = {
                 "toast": {"type": "info", "content": "抱歉，现在还不支持设置～"}
@@ -96,70 +222,460 @@ class LarkRunner:
         content: str,
         recv_id_type: Literal["open_id", "chat_id"],
     ):
-        """处理飞书消息回复"""
-        # 获取或创建运行时配置
-        if (open_id, chat_id) not in self.runtime_configs:
-            self.runtime_configs[(open_id, chat_id)] = RuntimeConfig()
+        """处理飞书消息回复：入队后立即返回，由会话的worker任务异步处理"""
+        self.ensure_started()
+        # 飞书重连或ack超时会重复投递同一消息
+        if await self.dedupe.is_duplicate(msg_id, "message"):
+            return
+
+        key = (open_id, chat_id)
 
-        runtime_config = self.runtime_configs[(open_id, chat_id)]
+        # 准入控制：过载时拒绝或告知排队位置
+        decision = self.admission.decide(self._queued_messages() + 1)
+        if decision == "reject":
+            await self._send_reject(open_id, chat_id, recv_id_type)
+            return
+
+        # 获取或恢复运行时配置
+        runtime_config = await self.runtime_configs.get(key)
 
         # 添加消息到队列
         runtime_config.messages_queue.append(content)
+        self.enqueued_at.setdefault(key, time.time())
 
         # 初始化会话
         if runtime_config.thread_id is None:
             runtime_config.thread_id = msg_id
             runtime_config.chat_title = f"**{content}**"
+        runtime_config.recv_id_type = recv_id_type
+
+        await self.runtime_configs.save(key)
+        if self.draining:
+            logger.info(f"Draining, message from {open_id} queued for restart")
+            return
+        self._ensure_worker(open_id, chat_id, recv_id_type)
+
+        # 会话自身正在处理时，新消息等待的是上一轮而非全局名额，不发送排队卡片
+        if (
+            decision == "queue"
+            and not runtime_config.processing
+            and key not in self.queue_notices
+        ):
+            self.queue_notices[key] = asyncio.create_task(
+                self._send_queue_notice(open_id, chat_id, recv_id_type)
+            )
+
+    def _research_slot(self, job: ResearchJob):
+        """研究任务在research车道按会话所属的flow获取运行名额"""
+        key = (job.open_id, job.chat_id)
+        runtime_config = self.runtime_configs.peek(key)
+        flow = self._flow(key, runtime_config) if runtime_config else job.open_id
+        return self.scheduler.slot(key, flow, "research")
+
+    def _flow(self, key: tuple[str, str], runtime_config: RuntimeConfig):
+        """公平调度的单位：有租户时按租户，否则按用户"""
+        return runtime_config.tenant_id or key[0]
+
+    def _queued_messages(self) -> int:
+        return sum(
+            len(runtime_config.messages_queue)
+            for runtime_config in self.runtime_configs.hot.values()
+        )
+
+    async def _send_reject(
+        self, open_id: str, chat_id: str, recv_id_type: Literal["open_id", "chat_id"]
+    ):
+        retry_after = self.admission.retry_after()
+        logger.warning(f"Rejected message from {open_id}: {self.admission.stats()}")
+        content = json.dumps(
+            {"text": f"当前使用人数过多，请约{retry_after}秒后重试～"},
+            ensure_ascii=False,
+        )
+        sent_id = open_id if recv_id_type == "open_id" else chat_id
+        await self.lark_api.do_send_msg(sent_id, content, "text", recv_id_type)
+
+    async def _send_queue_notice(
+        self, open_id: str, chat_id: str, recv_id_type: Literal["open_id", "chat_id"]
+    ):
+        """发送排队卡片，排队位置变化时更新，轮到该会话时结束"""
+        key = (open_id, chat_id)
+
+        async def frames():
+            last_position = None
+            while True:
+                runtime_config = self.runtime_configs.peek(key)
+                if (
+                    not runtime_config
+                    or runtime_config.processing
+                    or not runtime_config.messages_queue
+                ):
+                    break
+                position = self.admission.position(key)
+                if position != last_position:
+                    last_position = position
+                    yield {"type": "text", "text": f"当前排队人数较多，排在第{position}位…\n"}
+                await self.admission.wait_changed(timeout=5)
+            yield {"type": "text", "text": "已开始处理，请稍候。"}
+
+        try:
+            await self.lark_client.send_card_pipeline(
+                self.card_renderer.render(frames()),
+                open_id,
+                chat_id,
+                recv_id_type,
+                injection_config={"chat_title": QUEUE_NOTICE_TITLE},
+            )
+        except Exception as e:
+            logger.error(f"发送排队卡片出错: {e}")
+        finally:
+            self.queue_notices.pop(key, None)
 
-        # 如果当前没有正在处理的消息，开始处理
-        if not runtime_config.processing:
-            await self._process_message_queue(open_id, chat_id, recv_id_type)
+    def _ensure_worker(
+        self, open_id: str, chat_id: str, recv_id_type: Literal["open_id", "chat_id"]
+    ):
+        """确保会话存在worker任务，并唤醒它处理新消息"""
+        key = (open_id, chat_id)
+        if key not in self.worker_events:
+            self.worker_events[key] = asyncio.Event()
+        self.worker_events[key].set()
+
+        worker = self.workers.get(key)
+        if worker is None or worker.done():
+            self.workers[key] = asyncio.create_task(
+                self._chat_worker(open_id, chat_id, recv_id_type)
+            )
 
-    async def _process_message_queue(
+    async def _chat_worker(
         self, open_id: str, chat_id: str, recv_id_type: Literal["open_id", "chat_id"]
     ):
-        """处理消息队列中的消息"""
-        runtime_config = self.runtime_configs.get((open_id, chat_id))
-        if not runtime_config or not runtime_config.messages_queue:
+        """会话worker：串行消费该会话的消息队列，空闲超时后退出"""
+        key = (open_id, chat_id)
+        event = self.worker_events[key]
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(
+                        event.wait(), timeout=self.config.worker_idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    runtime_config = self.runtime_configs.peek(key)
+                    if not runtime_config or not runtime_config.messages_queue:
+                        return
+                event.clear()
+                if self.draining:
+                    return
+
+                # 会话从空闲被唤醒：等待突发的后续消息一并处理
+                await self._wait_for_burst(key, event)
+
+                while True:
+                    runtime_config = self.runtime_configs.peek(key)
+                    if not runtime_config or not runtime_config.messages_queue:
+                        break
+                    flow = self._flow(key, runtime_config)
+                    async with self.admission.slot(key, flow):
+                        # 停机期间不再开始新的轮次，排队消息留待重启后处理
+                        if self.draining:
+                            return
+                        await self._process_message(
+                            runtime_config, open_id, chat_id, recv_id_type
+                        )
+        finally:
+            if self.workers.get(key) is asyncio.current_task():
+                self.workers.pop(key, None)
+                self.worker_events.pop(key, None)
+
+    async def _wait_for_burst(self, key: tuple[str, str], event: asyncio.Event):
+        """合并窗口：窗口内持续有新消息则继续等待，直到窗口期无新消息或达到合并上限"""
+        window = self.config.coalesce_window
+        if not window:
             return
 
+        while True:
+            runtime_config = self.runtime_configs.peek(key)
+            if (
+                not runtime_config
+                or len(runtime_config.messages_queue)
+                >= self.config.coalesce_max_messages
+            ):
+                return
+            try:
+                await asyncio.wait_for(event.wait(), timeout=window)
+            except asyncio.TimeoutError:
+                return
+            event.clear()
+
+    async def _process_message(
+        self,
+        runtime_config: RuntimeConfig,
+        open_id: str,
+        chat_id: str,
+        recv_id_type: Literal["open_id", "chat_id"],
+    ):
+        """将队列前coalesce_max_messages条消息合并为一轮对话处理
+
+        本轮的消息在卡片创建完成、agent开始运行时才从队列中取出，
+        排队等待名额与创建卡片期间到达的消息同样合并进本轮。
+        """
+        key = (open_id, chat_id)
         runtime_config.processing = True
+        started = time.monotonic()
+        stop_event = asyncio.Event()
+        self.stop_events[key] = stop_event
+        batch: list[str] = []
+
+        trace = self.tracer.start(thread_id=runtime_config.thread_id, open_id=open_id)
+        enqueued_at = self.enqueued_at.pop(key, None)
+        if enqueued_at is not None:
+            self.queue_wait_seconds.observe(time.time() - enqueued_at)
+            if trace is not None:
+                trace.add_span("queue_wait", "queue", enqueued_at, trace.root.start)
+
+        def take_batch():
+            batch.extend(runtime_config.messages_queue[: self.config.coalesce_max_messages])
+            if trace is not None:
+                trace.root.attrs["messages"] = len(batch)
 
         try:
-            content = runtime_config.messages_queue[0]
-
             # 定义中断检查函数
             def check_interrupt():
                 return runtime_config.take_interupt is True
 
-            # 通过invoke_lark接口运行agent
-            await self.lark_client.send_card_pipeline(
-                self.agent.invoke2lark(
-                    query=content,
+            # 工具据此将深度研究提交为本会话的后台任务
+            current_chat.set(ChatContext(self.jobs, open_id, chat_id, recv_id_type))
+
+            async def frames():
+                take_batch()
+                if len(batch) > 1:
+                    logger.info(f"Coalesced {len(batch)} messages into one turn")
+                async for frame in self.agent.invoke2lark(
+                    query="\n".join(batch),
                     thread_id=runtime_config.thread_id,
                     interrupt=check_interrupt,
                     chunk_size=30,
                     recursion_limit=25,
-                ),
+                    stop_event=stop_event,
+                ):
+                    yield frame
+
+            def card_sent(start: float, end: float):
+                if trace is not None and not trace.finished:
+                    trace.add_span("card_send", "card", start, end)
+
+            # 通过invoke_lark接口运行agent，经渲染层限速后推送卡片
+            await self.lark_client.send_card_pipeline(
+                self.card_renderer.render(frames(), on_sent=card_sent),
                 open_id,
                 chat_id,
                 recv_id_type,
                 injection_config=runtime_config.model_dump(),
             )
 
+            logger.debug(f"Card renderer stats: {self.card_renderer.stats()}")
+            logger.debug(f"Admission stats: {self.admission.stats()}")
+            logger.debug(f"Session stats: {self.runtime_configs.stats()}")
+            if getattr(self.agent, "tool_cache", None) is not None:
+                logger.debug(f"Tool cache stats: {self.agent.tool_cache.stats()}")
+            if getattr(self.agent, "resilience", None) is not None:
+                logger.debug(f"Resilience stats: {self.agent.resilience.stats()}")
+            if getattr(self.agent, "router", None) is not None:
+                logger.debug(f"Model routing stats: {self.agent.router.stats()}")
+            if getattr(self.agent, "speculator", None) is not None:
+                logger.debug(f"Speculation stats: {self.agent.speculator.stats()}")
+
             # 更新状态
             runtime_config.messages_len += 1
-            runtime_config.messages_queue.pop(0)
-            runtime_config.take_interupt = None
 
         except Exception as e:
             logger.error(f"处理消息时出错: {e}")
         finally:
+            # 出错的消息同样出队，避免反复重试
+            if not batch:
+                take_batch()
+            for message in batch:
+                if runtime_config.messages_queue and runtime_config.messages_queue[0] is message:
+                    runtime_config.messages_queue.pop(0)
+            runtime_config.take_interupt = None
             runtime_config.processing = False
+            if self.stop_events.get(key) is stop_event:
+                self.stop_events.pop(key)
+
+            cost = time.monotonic() - started
+            await self.runtime_configs.save((open_id, chat_id))
+            await self.tracer.finish(trace)
+            self._observe_turn(cost, trace)
+
+    def _observe_turn(self, cost: float, trace: Optional[Trace]):
+        """记录本轮耗时，工具与模型耗时取自trace"""
+        self.turn_seconds.observe(cost)
+        if trace is None:
+            return
+        for span in trace.spans:
+            if span.kind == "tool":
+                self.tool_seconds.observe(span.duration, tool=span.name.removeprefix("tool:"))
+            elif span.kind == "llm" and "ttft" in span.attrs:
+                self.ttft_seconds.observe(span.attrs["ttft"], model=span.name.removeprefix("llm:"))
+
+    def _collect_metrics(self) -> list[Metric]:
+        """抓取时读取的gauge与counter"""
+        active = Metric("taro_active_chats", "gauge", "有worker任务的会话数")
+        active.add(sum(1 for task in self.workers.values() if not task.done()))
+        queued = Metric("taro_queued_messages", "gauge", "所有会话排队中的消息数")
+        queued.add(self._queued_messages())
+        depth = Metric("taro_chat_queue_depth", "gauge", "各会话排队中的消息数（只列出非空队列）")
+        for (open_id, chat_id), runtime_config in self.runtime_configs.hot.items():
+            if runtime_config.messages_queue:
+                depth.add(len(runtime_config.messages_queue), open_id=open_id, chat_id=chat_id)
+
+        session_stats = self.runtime_configs.stats()
+        hot_sessions = Metric("taro_hot_sessions", "gauge", "内存中的会话数")
+        hot_sessions.add(session_stats["hot"])
+        evicted_sessions = Metric(
+            "taro_evicted_sessions_total", "counter", "空闲或超出容量被移出内存的会话数"
+        )
+        evicted_sessions.add(session_stats["evicted"])
+        restored_sessions = Metric(
+            "taro_restored_sessions_total", "counter", "从数据库重新加载到内存的会话数"
+        )
+        restored_sessions.add(session_stats["restored"])
+        duplicates = Metric("taro_duplicate_events_total", "counter", "丢弃的重复投递事件数")
+        for kind in ("message", "card_action"):
+            duplicates.add(self.dedupe.duplicates.get(kind, 0), kind=kind)
+
+        job_stats = self.jobs.stats()
+        research_jobs = Metric("taro_research_jobs", "gauge", "进行中的后台研究任务数")
+        research_jobs.add(job_stats["running"], state="running")
+        research_jobs.add(job_stats["queued"], state="queued")
+        finished_jobs = Metric(
+            "taro_research_jobs_finished_total", "counter", "已结束的后台研究任务数（含取消）"
+        )
+        finished_jobs.add(job_stats["finished"])
+        cancelled_jobs = Metric(
+            "taro_research_jobs_cancelled_total", "counter", "被取消的后台研究任务数"
+        )
+        cancelled_jobs.add(job_stats["cancelled"])
+
+        stats = self.admission.stats()
+        in_flight = Metric("taro_inflight_runs", "gauge", "正在运行的agent轮次")
+        in_flight.add(stats["in_flight"])
+        lane_in_use = Metric("taro_lane_in_use", "gauge", "各调度车道占用的运行名额")
+        lane_waiting = Metric("taro_lane_waiting", "gauge", "各调度车道等待名额的会话数")
+        for lane, lane_stats in stats["lanes"].items():
+            lane_in_use.add(lane_stats["in_use"], lane=lane)
+            lane_waiting.add(lane_stats["waiting"], lane=lane)
+        rejected = Metric("taro_rejected_messages_total", "counter", "过载拒绝的消息数")
+        rejected.add(stats["rejected"])
+
+        card_updates = Metric("taro_card_updates_total", "counter", "推送的卡片更新次数")
+        card_updates.add(self.card_renderer.updates)
+        merged = Metric("taro_card_merged_frames_total", "counter", "限速期间合并掉的帧数")
+        merged.add(self.card_renderer.merged_frames)
+
+        db_queries = Metric("taro_db_queries_total", "counter", "数据库查询次数")
+        db_seconds = Metric(
+            "taro_db_query_seconds_total", "counter", "数据库查询耗时（含单连接上的排队等待）"
+        )
+        db_in_flight = Metric("taro_db_in_flight", "gauge", "进行中与等待中的数据库查询")
+        clients = [("runner", self.db_api)]
+        if getattr(self.agent, "db_api", None) is not None:
+            clients.append(("agent", self.agent.db_api))
+        for name, db_api in clients:
+            db_queries.add(db_api.queries, client=name)
+            db_seconds.add(db_api.query_seconds, client=name)
+            db_in_flight.add(db_api.in_flight, client=name)
+
+        metrics = [
+            active,
+            queued,
+            depth,
+            hot_sessions,
+            evicted_sessions,
+            restored_sessions,
+            duplicates,
+            research_jobs,
+            finished_jobs,
+            cancelled_jobs,
+            in_flight,
+            lane_in_use,
+            lane_waiting,
+            rejected,
+            card_updates,
+            merged,
+            db_queries,
+            db_seconds,
+            db_in_flight,
+        ]
+        if self.agent is not None:
+            metrics += self._collect_agent_metrics()
+        return metrics
+
+    def _collect_agent_metrics(self) -> list[Metric]:
+        agent = self.agent
+        metrics = []
+
+        rag_manager = getattr(agent, "rag_manager", None)
+        if rag_manager is not None:
+            loaded = [kb for kb in rag_manager.knowledge_bases.values() if kb.is_built]
+            metrics.append(
+                Metric("taro_kb_loaded", "gauge", "内存中已加载的知识库数").add(len(loaded))
+            )
+            metrics.append(
+                Metric("taro_kb_loaded_chunks", "gauge", "内存中已加载的知识库片段数").add(
+                    sum(len(kb.vector_store.index_to_docstore_id) for kb in loaded)
+                )
+            )
 
-        # 继续处理队列中的下一条消息
-        if runtime_config.messages_queue:
-            await self._process_message_queue(open_id, chat_id, recv_id_type)
+        tool_cache = getattr(agent, "tool_cache", None)
+        if tool_cache is not None:
+            lookups = Metric("taro_tool_cache_lookups_total", "counter", "工具结果缓存查询次数")
+            hit_ratio = Metric("taro_tool_cache_hit_ratio", "gauge", "工具结果缓存命中率")
+            for tool, counter in tool_cache.stats().items():
+                for result in ("hits", "coalesced", "misses"):
+                    lookups.add(counter[result], tool=tool, result=result)
+                hit_ratio.add(counter["hit_rate"], tool=tool)
+            metrics += [lookups, hit_ratio]
+
+        speculator = getattr(agent, "speculator", None)
+        if speculator is not None:
+            stats = speculator.stats()
+            metrics.append(
+                Metric("taro_speculation_total", "counter", "投机检索次数")
+                .add(stats["hits"], result="hit")
+                .add(stats["started"] - stats["hits"], result="not_used")
+            )
+            metrics.append(
+                Metric("taro_speculation_hit_ratio", "gauge", "投机检索命中率").add(
+                    stats["hit_rate"]
+                )
+            )
+
+        resilience = getattr(agent, "resilience", None)
+        if resilience is not None:
+            circuit = Metric("taro_circuit_open", "gauge", "熔断器是否打开（含半开）")
+            for service, stats in resilience.stats().items():
+                circuit.add(int(stats["state"] != "closed"), service=service)
+            metrics.append(circuit)
+
+        checkpoint = getattr(agent, "checkpointer_stats", lambda: {})()
+        if "bytes" in checkpoint:
+            metrics.append(
+                Metric("taro_checkpoint_store_bytes", "gauge", "checkpoint数据大小").add(
+                    checkpoint["bytes"]
+                )
+            )
+        if "threads" in checkpoint:
+            metrics.append(
+                Metric("taro_checkpoint_threads", "gauge", "checkpoint中的会话数").add(
+                    checkpoint["threads"]
+                )
+            )
+        return metrics
+
+    async def _start_metrics(self):
+        try:
+            await self.metrics_server.start()
+        except OSError as e:
+            logger.error(f"指标服务启动失败: {e}")
 
     def _clear_chat_context(self, runtime_config: RuntimeConfig):
         """清除会话上下文"""
@@ -170,11 +686,113 @@ class LarkRunner:
         runtime_config.take_interupt = None
         runtime_config.processing = False
 
+    def ensure_started(self):
+        """记录事件循环，并在首次调用时启动指标服务、恢复上次停机时未处理的会话
+
+        由start()在事件循环启动时调用，supervisor的worker启动时同样调用；
+        飞书回调中也会调用，重复调用没有影响。
+        """
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        if self._resume_task is None:
+            self._resume_task = asyncio.create_task(self.resume_pending())
+        if self.metrics_server is not None and self._metrics_task is None:
+            self._metrics_task = asyncio.create_task(self._start_metrics())
+
+    async def resume_pending(self) -> int:
+        """为仍有排队消息的会话启动worker"""
+        count = 0
+        for key in await self.runtime_configs.pending():
+            if self.owns is not None and not self.owns(key):
+                continue
+            runtime_config = await self.runtime_configs.get(key)
+            self._ensure_worker(key[0], key[1], runtime_config.recv_id_type or "open_id")
+            count += 1
+        if count:
+            logger.info(f"Resumed {count} chats with pending messages")
+        await self.jobs.recover(self.owns)
+        return count
+
+    async def shutdown(self, timeout: Optional[float] = None):
+        """优雅停机
+
+        1. 不再开始新的轮次，新消息只入队持久化
+        2. 等待进行中的轮次完成，超过timeout则停止生成（部分回答写入checkpoint）
+        3. 持久化所有会话的排队消息与运行时状态
+        4. 关闭checkpointer与数据库连接，刷新日志
+        """
+        if timeout is None:
+            timeout = self.config.shutdown_timeout
+        self.draining = True
+        logger.info(f"Draining: {self.admission.stats()}")
+
+        # 尚未开始轮次的worker(空闲、合并窗口或等待名额中)直接退出，消息留在队列中
+        pending = []
+        cancelled = []
+        for key, task in list(self.workers.items()):
+            runtime_config = self.runtime_configs.peek(key)
+            if runtime_config and runtime_config.processing:
+                pending.append(task)
+            else:
+                task.cancel()
+                cancelled.append(task)
+
+        if pending:
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+        if pending:
+            logger.warning(f"{len(pending)} turns exceeded the drain deadline, stopping")
+            for stop_event in list(self.stop_events.values()):
+                stop_event.set()
+            _, pending = await asyncio.wait(
+                pending, timeout=self.config.shutdown_stop_grace
+            )
+            for task in pending:
+                task.cancel()
+            cancelled.extend(pending)
+
+        for task in list(self.queue_notices.values()):
+            task.cancel()
+            cancelled.append(task)
+        # 等待被取消的任务执行完清理逻辑（关闭卡片、保存会话）后再关闭数据库
+        if cancelled:
+            await asyncio.wait(cancelled, timeout=self.config.shutdown_stop_grace)
+        # 未完成的研究任务保持排队状态，重启后重新运行
+        await self.jobs.shutdown(timeout=self.config.shutdown_stop_grace)
+
+        await self.runtime_configs.save_all()
+        if self.agent:
+            await self.agent.aclose()
+        await self.tracer.aclose()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        await self.db_api.close()
+        logger.info("Shutdown complete")
+        await logger.complete()
+
+    def _handle_signal(self, signum, frame):
+        if self.draining:
+            # 再次收到信号时强制退出
+            raise SystemExit(1)
+        logger.info(f"Received signal {signum}, shutting down gracefully")
+        self.draining = True
+
+        loop = self.loop
+        if loop is None or not loop.is_running():
+            raise SystemExit(0)
+
+        def schedule():
+            task = loop.create_task(self.shutdown())
+            task.add_done_callback(lambda _: loop.stop())
+
+        loop.call_soon_threadsafe(schedule)
+
     def start(self):
         """启动WebSocket服务器"""
         if not self.agent:
             raise ValueError("请先调用set_agent()来指定agent")
 
+        from easylark.conn import EasyLarkWsServer
+
         # 初始化WebSocket服务器
         self.lark_ws = EasyLarkWsServer(
             app_id=os.getenv("LARK_APP_ID"),
@@ -184,9 +802,21 @@ class LarkRunner:
             callback_hello=self.call_back_hello,
         )
 
+        # 飞书WebSocket客户端在当前线程的事件循环中运行，启动后立即恢复上次停机时
+        # 未处理的会话与研究任务，不必等到第一条新事件
+        asyncio.get_event_loop().call_soon(self.ensure_started)
+
         # 启动服务器
         self.lark_ws.start()
 
     def run(self):
         """启动服务 - 入口方法"""
-        self.start()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self._handle_signal)
+        try:
+            self.start()
+        except RuntimeError:
+            # shutdown完成后停止事件循环，WebSocket服务器随之退出
+            if not self.draining:
+                raise
+        logger.info("Taro stopped")
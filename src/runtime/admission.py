@@ -0,0 +1,117 @@
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Hashable, Literal, Optional
+
+from src.runtime.sessions import SessionKey
+from src.runtime.scheduler import FairScheduler
+
+
+Decision = Literal["admit", "queue", "reject"]
+
+
+class AdmissionController:
+    """准入控制：通过调度器分配运行名额，并在过载时提前告知用户
+
+    根据车道是否有空闲名额、全局排队消息数和最近轮次耗时的p95判断负载：
+    - admit：直接入队，不打扰用户
+    - queue：入队，但立即告知用户排队位置
+    - reject：不入队，提示用户稍后重试
+    """
+
+    def __init__(
+        self,
+        scheduler: FairScheduler,
+        queue_threshold: int = 8,
+        latency_threshold: Optional[float] = 60,
+        reject_threshold: Optional[int] = 200,
+        latency_window: int = 200,
+    ):
+        self.scheduler = scheduler
+        self.queue_threshold = queue_threshold
+        self.latency_threshold = latency_threshold
+        self.reject_threshold = reject_threshold
+
+        # 最近轮次的耗时(秒)
+        self.latencies: deque[float] = deque(maxlen=latency_window)
+
+        self.queued_notices = 0
+        self.rejected = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def in_flight(self) -> int:
+        return self.scheduler.in_flight
+
+    def decide(self, queued: int, lane: str = "interactive") -> Decision:
+        """queued为当前全局排队的消息数（含新消息），lane为该会话将进入的车道"""
+        if self.reject_threshold is not None and queued > self.reject_threshold:
+            self.rejected += 1
+            return "reject"
+
+        if self.scheduler.has_capacity(lane):
+            return "admit"
+
+        p95 = self.latency_p95()
+        if queued > self.queue_threshold or (
+            self.latency_threshold is not None and p95 >= self.latency_threshold
+        ):
+            self.queued_notices += 1
+            return "queue"
+        return "admit"
+
+    def position(self, key: SessionKey, lane: str = "interactive") -> int:
+        """会话在车道等待队列中的位置(从1开始)，尚未开始等待的会话排在队尾"""
+        position = self.scheduler.position(key, lane)
+        if position is None:
+            return self.scheduler.waiting_count() + 1
+        return position
+
+    def retry_after(self) -> int:
+        """建议用户重试的等待秒数"""
+        p95 = self.latency_p95() or 30
+        rounds = self.scheduler.waiting_count() / max(self.scheduler.capacity, 1) + 1
+        return int(p95 * rounds)
+
+    @asynccontextmanager
+    async def slot(self, key: SessionKey, flow: Hashable, lane: str = "interactive"):
+        """从调度器获取运行名额，并记录本轮耗时"""
+        try:
+            async with self.scheduler.slot(key, flow, lane):
+                self._notify()
+                started = time.monotonic()
+                try:
+                    yield
+                finally:
+                    self.latencies.append(time.monotonic() - started)
+        finally:
+            self._notify()
+
+    async def wait_changed(self, timeout: Optional[float] = None):
+        """等待排队状态发生变化"""
+        event = self._changed
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def latency_p95(self) -> float:
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.scheduler.waiting_count(),
+            "latency_p95": round(self.latency_p95(), 3),
+            "queued_notices": self.queued_notices,
+            "rejected": self.rejected,
+            "lanes": self.scheduler.stats(),
+        }
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
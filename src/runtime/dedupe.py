@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from src.core.db_client import DatabaseClient
+from src.utlis.logger_config import logger
+
+
+class DedupeCache:
+    """事件去重缓存
+
+    飞书在重连或ack过慢时会重复投递事件。缓存在ttl时间窗内见过的事件ID，
+    内存中最多保留max_size条（LRU）；传入db_api时同时持久化到SQLite，重启后依然生效。
+    """
+
+    def __init__(
+        self,
+        db_api: Optional[DatabaseClient] = None,
+        ttl: float = 600,
+        max_size: int = 10000,
+        sweep_interval: float = 60,
+    ):
+        self.db_api = db_api
+        self.ttl = ttl
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+
+        # 事件ID -> 首次出现的时间戳
+        self.seen: OrderedDict[str, float] = OrderedDict()
+        # 事件类型 -> 丢弃的重复事件数
+        self.duplicates: dict[str, int] = {}
+
+        self._table_ready = False
+        self._last_sweep = 0.0
+
+    async def _ensure_table(self):
+        if self._table_ready:
+            return
+        await self.db_api.execute(
+            """
+            CREATE TABLE IF NOT EXISTS event_dedupe (
+                event_id TEXT PRIMARY KEY,
+                seen_at REAL NOT NULL
+            )
+            """
+        )
+        self._table_ready = True
+
+    async def is_duplicate(self, event_id: Optional[str], kind: str = "message") -> bool:
+        """检查并记录事件ID，时间窗内重复出现时返回True，kind用于分类统计"""
+        if not event_id:
+            return False
+
+        now = time.time()
+        self._expire(now)
+
+        seen_at = self.seen.get(event_id)
+        if seen_at is not None:
+            return self._drop(event_id, kind)
+
+        # 先写入内存，并发到达的同一事件在查询数据库期间也能被拦截
+        self.seen[event_id] = now
+        while len(self.seen) > self.max_size:
+            self.seen.popitem(last=False)
+
+        if self.db_api is None:
+            return False
+
+        await self._ensure_table()
+        row = await self.db_api.fetchone(
+            "SELECT seen_at FROM event_dedupe WHERE event_id = ?", (event_id,)
+        )
+        if row and row[0] >= now - self.ttl:
+            return self._drop(event_id, kind)
+
+        await self.db_api.execute(
+            "INSERT OR REPLACE INTO event_dedupe (event_id, seen_at) VALUES (?, ?)",
+            (event_id, now),
+        )
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            await self.db_api.execute(
+                "DELETE FROM event_dedupe WHERE seen_at < ?", (now - self.ttl,)
+            )
+        return False
+
+    def stats(self) -> dict:
+        return {"cached": len(self.seen), "duplicates": dict(self.duplicates)}
+
+    def _drop(self, event_id: str, kind: str) -> bool:
+        self.duplicates[kind] = self.duplicates.get(kind, 0) + 1
+        logger.info(f"Dropped duplicate {kind} event {event_id}")
+        return True
+
+    def _expire(self, now: float):
+        deadline = now - self.ttl
+        while self.seen:
+            event_id, seen_at = next(iter(self.seen.items()))
+            if seen_at >= deadline:
+                break
+            self.seen.popitem(last=False)
@@ -0,0 +1,322 @@
+import time
+import uuid
+import asyncio
+from contextlib import nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import AsyncContextManager, AsyncIterator, Callable, Literal, Optional
+
+from pydantic import BaseModel
+
+from src.core.db_client import DatabaseClient
+from src.runtime.sessions import SessionKey
+from src.utlis.logger_config import logger
+
+
+JobStatus = Literal["queued", "running", "done", "failed", "cancelled"]
+# 研究函数：产出{"type": "progress" | "report", "text": ...}事件
+ResearchFn = Callable[..., AsyncIterator[dict]]
+# 运行名额：返回在研究期间持有的异步上下文管理器（如调度器research车道的名额）
+SlotFn = Callable[["ResearchJob"], AsyncContextManager]
+
+
+class ResearchJob(BaseModel):
+    job_id: str
+    open_id: str
+    chat_id: str
+    recv_id_type: str = "open_id"
+    query: str
+    params: dict = {}
+    status: JobStatus = "queued"
+    created_at: float
+    finished_at: Optional[float] = None
+    report: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+
+class _Stopped(Exception):
+    """任务被取消或停机"""
+
+
+@dataclass
+class ChatContext:
+    """当前轮次所属的会话，工具据此在后台创建任务"""
+
+    jobs: "JobManager"
+    open_id: str
+    chat_id: str
+    recv_id_type: str = "open_id"
+
+
+# 由runner在运行agent前设置，agent内的工具调用继承该上下文
+current_chat: ContextVar[Optional[ChatContext]] = ContextVar("current_chat", default=None)
+
+
+class JobManager:
+    """后台研究任务
+
+    研究任务在会话轮次之外运行，会话可以继续对话。每个任务持久化到SQLite，
+    计划与步骤进度推送到单独的卡片，完成后在同一卡片中发送最终报告。
+    传入slot时任务在获得运行名额后才开始研究，之前保持排队状态。
+    停机时未完成的任务保持排队状态，重启后重新运行。
+    """
+
+    def __init__(
+        self,
+        db_api: DatabaseClient,
+        lark_client,
+        research: ResearchFn,
+        card_renderer=None,
+        max_jobs_per_chat: int = 2,
+        slot: Optional[SlotFn] = None,
+    ):
+        self.db_api = db_api
+        self.lark_client = lark_client
+        self.research = research
+        self.card_renderer = card_renderer
+        self.max_jobs_per_chat = max_jobs_per_chat
+        self.slot = slot
+
+        # 进行中的任务
+        self.jobs: dict[str, ResearchJob] = {}
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.cancel_events: dict[str, asyncio.Event] = {}
+        self.closing = False
+        self.finished = 0
+        self.cancelled = 0
+
+        self._table_ready = False
+
+    async def _ensure_table(self):
+        if self._table_ready:
+            return
+        await self.db_api.execute(
+            """
+            CREATE TABLE IF NOT EXISTS research_jobs (
+                job_id TEXT PRIMARY KEY,
+                open_id TEXT NOT NULL,
+                chat_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                state TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._table_ready = True
+
+    async def _save(self, job: ResearchJob):
+        await self._ensure_table()
+        await self.db_api.execute(
+            """
+            INSERT INTO research_jobs (job_id, open_id, chat_id, status, state, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(job_id) DO UPDATE SET
+            status = excluded.status, state = excluded.state
+            """,
+            (
+                job.job_id,
+                job.open_id,
+                job.chat_id,
+                job.status,
+                job.model_dump_json(),
+                job.created_at,
+            ),
+        )
+
+    async def submit(
+        self,
+        open_id: str,
+        chat_id: str,
+        recv_id_type: str,
+        query: str,
+        **params,
+    ) -> Optional[ResearchJob]:
+        """创建并启动研究任务，会话进行中的任务已达上限时返回None"""
+        if len(self.active((open_id, chat_id))) >= self.max_jobs_per_chat:
+            return None
+
+        job = ResearchJob(
+            job_id=uuid.uuid4().hex[:8],
+            open_id=open_id,
+            chat_id=chat_id,
+            recv_id_type=recv_id_type,
+            query=query,
+            params=params,
+            created_at=time.time(),
+        )
+        await self._save(job)
+        self._start(job)
+        logger.info(f"Research job {job.job_id} submitted: {query}")
+        return job
+
+    def active(self, key: SessionKey) -> list[ResearchJob]:
+        """会话进行中的任务"""
+        return [job for job in self.jobs.values() if (job.open_id, job.chat_id) == key]
+
+    async def get(self, job_id: str) -> Optional[ResearchJob]:
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job
+        await self._ensure_table()
+        row = await self.db_api.fetchone(
+            "SELECT state FROM research_jobs WHERE job_id = ?", (job_id,)
+        )
+        return ResearchJob.model_validate_json(row[0]) if row else None
+
+    async def cancel(self, job_id: str, key: Optional[SessionKey] = None) -> bool:
+        """取消进行中的任务，指定key时只能取消该会话的任务"""
+        job = self.jobs.get(job_id)
+        if job is None or (key is not None and (job.open_id, job.chat_id) != key):
+            return False
+        self.cancel_events[job_id].set()
+        return True
+
+    async def recover(self, owns: Optional[Callable[[SessionKey], bool]] = None) -> int:
+        """重新运行上次停机时未完成的任务"""
+        await self._ensure_table()
+        rows = await self.db_api.fetchall(
+            "SELECT state FROM research_jobs WHERE status IN ('queued', 'running')"
+        )
+        count = 0
+        for (state,) in rows:
+            job = ResearchJob.model_validate_json(state)
+            if job.job_id in self.jobs:
+                continue
+            if owns is not None and not owns((job.open_id, job.chat_id)):
+                continue
+            job.status = "queued"
+            self._start(job)
+            count += 1
+        if count:
+            logger.info(f"Recovered {count} research jobs")
+        return count
+
+    async def shutdown(self, timeout: float = 5):
+        """停止所有任务，任务保持排队状态，重启后重新运行"""
+        self.closing = True
+        for event in self.cancel_events.values():
+            event.set()
+        tasks = list(self.tasks.values())
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "active": len(self.jobs),
+            "running": sum(1 for job in self.jobs.values() if job.status == "running"),
+            "queued": sum(1 for job in self.jobs.values() if job.status == "queued"),
+            "finished": self.finished,
+            "cancelled": self.cancelled,
+        }
+
+    def _start(self, job: ResearchJob):
+        self.jobs[job.job_id] = job
+        self.cancel_events[job.job_id] = asyncio.Event()
+        self.tasks[job.job_id] = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: ResearchJob):
+        frames = self._frames(job)
+        if self.card_renderer is not None:
+            frames = self.card_renderer.render(frames)
+        try:
+            await self.lark_client.send_card_pipeline(
+                frames,
+                job.open_id,
+                job.chat_id,
+                job.recv_id_type,
+                injection_config={"chat_title": f"**深度研究：{job.query[:30]}**"},
+            )
+        except Exception as e:
+            logger.error(f"研究任务 {job.job_id} 发送卡片出错: {e}")
+            if job.active and not self.closing:
+                job.status = "failed"
+                job.error = str(e)
+        finally:
+            if not job.active:
+                job.finished_at = time.time()
+                self.finished += 1
+            await self._save(job)
+            self.jobs.pop(job.job_id, None)
+            self.tasks.pop(job.job_id, None)
+            self.cancel_events.pop(job.job_id, None)
+
+    async def _frames(self, job: ResearchJob) -> AsyncIterator[dict]:
+        """研究进度卡片的内容：进度逐条追加，最后是报告或结束原因"""
+        if self.slot is not None:
+            yield {"type": "text", "text": f"研究任务 {job.job_id} 已提交，等待运行名额…\n"}
+
+        started = time.monotonic()
+        try:
+            async for event in self._events(job):
+                if event["type"] == "started":
+                    job.status = "running"
+                    await self._save(job)
+                    yield {"type": "text", "text": f"研究任务 {job.job_id} 已开始\n"}
+                elif event["type"] == "report":
+                    job.report = event["text"]
+                    yield {"type": "text", "text": f"\n{job.report}"}
+                else:
+                    yield {"type": "text", "text": event["text"]}
+        except _Stopped:
+            if self.closing:
+                job.status = "queued"
+                yield {"type": "text", "text": "\n服务重启中，研究任务将在重启后重新开始。"}
+            else:
+                job.status = "cancelled"
+                self.cancelled += 1
+                yield {"type": "text", "text": "\n研究任务已取消。"}
+        except Exception as e:
+            logger.error(f"研究任务 {job.job_id} 执行失败: {e}")
+            job.status = "failed"
+            job.error = str(e)
+            yield {"type": "text", "text": f"\n研究失败：{e}"}
+        else:
+            if job.report:
+                job.status = "done"
+            else:
+                job.status = "failed"
+                job.error = "研究过程中未能生成最终报告"
+                yield {"type": "text", "text": f"\n{job.error}"}
+        logger.info(
+            f"Research job {job.job_id} {job.status} in {time.monotonic() - started:.1f}s"
+        )
+
+    async def _events(self, job: ResearchJob) -> AsyncIterator[dict]:
+        """在独立任务中获取运行名额并运行研究，取消信号到达时立即停止并抛出_Stopped"""
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                async with self.slot(job) if self.slot is not None else nullcontext():
+                    queue.put_nowait({"type": "started"})
+                    async for event in self.research(job.query, **job.params):
+                        queue.put_nowait(event)
+            finally:
+                queue.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        stopper = asyncio.create_task(self.cancel_events[job.job_id].wait())
+        try:
+            while True:
+                getter = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait(
+                    {getter, stopper}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if getter not in done:
+                    getter.cancel()
+                    raise _Stopped()
+                event = getter.result()
+                if event is None:
+                    # 研究出错时在此抛出
+                    producer.result()
+                    return
+                yield event
+        finally:
+            producer.cancel()
+            stopper.cancel()
@@ -0,0 +1,165 @@
+import math
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, Optional
+
+from src.utlis.logger_config import logger
+
+
+# 默认直方图分桶(秒)，覆盖卡片推送到深度研究的耗时范围
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+@dataclass
+class Metric:
+    """一个gauge或counter及其各标签组合的取值，抓取时由collector生成"""
+
+    name: str
+    type: str
+    help: str
+    samples: list[tuple[dict, float]] = field(default_factory=list)
+
+    def add(self, value: float, **labels) -> "Metric":
+        self.samples.append((labels, value))
+        return self
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        lines += [f"{self.name}{_labels(l)} {_value(v)}" for l, v in self.samples]
+        return "\n".join(lines)
+
+
+class Histogram:
+    """累计分桶直方图，按标签组合分别统计"""
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.counts: dict[tuple, list[int]] = defaultdict(lambda: [0] * len(self.buckets))
+        self.sums: dict[tuple, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        counts = self.counts[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.sums[key] += value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, counts in self.counts.items():
+            labels = dict(key)
+            for bound, count in zip(self.buckets, counts):
+                le = _labels({**labels, "le": _value(bound)})
+                lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_value(self.sums[key])}")
+            lines.append(f"{self.name}_count{_labels(labels)} {counts[-1]}")
+        return "\n".join(lines)
+
+
+class MetricsRegistry:
+    """Prometheus文本格式的指标
+
+    直方图在事件发生时记录；gauge与counter由collector在抓取时从各组件的统计中读取，
+    不在热路径上增加开销。需要异步读取的统计(如数据库查询)由refresher在抓取前更新。
+    """
+
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+        self.collectors: list[Callable[[], Iterable[Metric]]] = []
+        self.refreshers: list[Callable[[], Awaitable[None]]] = []
+
+    def histogram(
+        self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        if name not in self.histograms:
+            self.histograms[name] = Histogram(name, help, buckets)
+        return self.histograms[name]
+
+    def register(self, collector: Callable[[], Iterable[Metric]]):
+        self.collectors.append(collector)
+
+    def register_refresher(self, refresher: Callable[[], Awaitable[None]]):
+        self.refreshers.append(refresher)
+
+    async def refresh(self):
+        for refresher in self.refreshers:
+            try:
+                await refresher()
+            except Exception as e:
+                logger.warning(f"刷新指标出错: {str(e)}")
+
+    def render(self) -> str:
+        blocks = []
+        for collector in self.collectors:
+            try:
+                blocks += [metric.render() for metric in collector() if metric.samples]
+            except Exception as e:
+                logger.warning(f"收集指标出错: {str(e)}")
+        blocks += [h.render() for h in self.histograms.values() if h.counts]
+        return "\n".join(blocks) + "\n"
+
+
+class MetricsServer:
+    """只提供GET /metrics的最小HTTP服务"""
+
+    def __init__(self, registry: MetricsRegistry, host: str = "0.0.0.0", port: int = 9100):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server: Optional[asyncio.Server] = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Metrics endpoint: http://{self.host}:{self.port}/metrics")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # 读完请求头
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, content_type = "200 OK", CONTENT_TYPE
+                await self.registry.refresh()
+                body = self.registry.render().encode("utf-8")
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
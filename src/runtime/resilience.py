@@ -0,0 +1,214 @@
+import time
+import asyncio
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from src.utlis.logger_config import logger
+
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """服务熔断中，调用被直接拒绝"""
+
+
+class CircuitBreaker:
+    """熔断器
+
+    连续失败failure_threshold次后打开，打开期间直接拒绝调用；
+    recovery_timeout秒后放行一次探测调用(half_open)，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.recovery_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """调用被取消，既不算成功也不算失败"""
+        self.probing = False
+
+
+class Resilience:
+    """模型、embedding与搜索调用共享的容错层
+
+    - 每次调用可设置超时
+    - 幂等调用(query embedding、搜索)可对冲：首次请求超过该服务近期耗时的分位数仍未返回时，
+      再发出一个相同请求，取先成功的结果
+    - 每个服务一个熔断器，熔断时快速失败或走降级逻辑
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30,
+        hedge_quantile: float = 0.95,
+        hedge_min_delay: float = 0.05,
+        hedge_default_delay: float = 1.0,
+        min_samples: int = 20,
+        latency_window: int = 200,
+    ):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+        self.min_samples = min_samples
+
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.latencies: dict[str, deque] = defaultdict(lambda: deque(maxlen=latency_window))
+        self.counters: dict[str, dict[str, int]] = defaultdict(
+            lambda: {
+                "calls": 0,
+                "failures": 0,
+                "rejected": 0,
+                "fallbacks": 0,
+                "hedged": 0,
+                "hedge_wins": 0,
+            }
+        )
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        if name not in self.breakers:
+            self.breakers[name] = CircuitBreaker(
+                self.failure_threshold, self.recovery_timeout
+            )
+        return self.breakers[name]
+
+    def hedge_delay(self, name: str) -> float:
+        """对冲延迟：样本足够时取近期耗时的分位数"""
+        latencies = self.latencies[name]
+        if len(latencies) < self.min_samples:
+            return self.hedge_default_delay
+        ordered = sorted(latencies)
+        index = min(int(len(ordered) * self.hedge_quantile), len(ordered) - 1)
+        return max(ordered[index], self.hedge_min_delay)
+
+    def record_latency(self, name: str, latency: float):
+        self.latencies[name].append(latency)
+
+    async def call(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[T]],
+        deadline: Optional[float] = None,
+        hedge: bool = False,
+        fallback: Optional[Callable[[], Awaitable[T]]] = None,
+        can_hedge: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        """通过熔断器调用fn
+
+        Args:
+            name: 服务名，每个服务独立统计与熔断
+            fn: 每次调用返回一个新的awaitable（对冲时会调用两次）
+            deadline: 超时(秒)，包括对冲请求
+            hedge: 是否对冲，只用于幂等调用
+            fallback: 熔断或失败时的降级调用，None时抛出异常
+            can_hedge: 发起对冲前检查（如是否有空闲的并发名额），返回False时不对冲
+        """
+        counter = self.counters[name]
+        breaker = self.breaker(name)
+        if not breaker.allow():
+            counter["rejected"] += 1
+            if fallback is not None:
+                counter["fallbacks"] += 1
+                return await fallback()
+            raise CircuitOpenError(f"{name}服务暂时不可用")
+
+        counter["calls"] += 1
+        try:
+            coro = self._hedged(name, fn, can_hedge) if hedge else self._attempt(name, fn)
+            result = await asyncio.wait_for(coro, deadline)
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception as e:
+            counter["failures"] += 1
+            breaker.record_failure()
+            if fallback is None:
+                raise
+            logger.warning(f"{name}调用失败，使用降级逻辑: {str(e) or type(e).__name__}")
+            counter["fallbacks"] += 1
+            return await fallback()
+
+        breaker.record_success()
+        return result
+
+    async def _attempt(self, name: str, fn: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        result = await fn()
+        self.record_latency(name, time.monotonic() - started)
+        return result
+
+    async def _hedged(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[T]],
+        can_hedge: Optional[Callable[[], bool]] = None,
+    ) -> T:
+        tasks = [asyncio.create_task(self._attempt(name, fn))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(name))
+            if not done and (can_hedge is None or can_hedge()):
+                self.counters[name]["hedged"] += 1
+                tasks.append(asyncio.create_task(self._attempt(name, fn)))
+
+            error = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1 and task is tasks[1]:
+                            self.counters[name]["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                **counter,
+                "state": self.breaker(name).state,
+                "hedge_delay": round(self.hedge_delay(name), 3),
+            }
+            for name, counter in self.counters.items()
+        }
@@ -0,0 +1,178 @@
+import time
+import heapq
+import asyncio
+import itertools
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Hashable, Optional
+
+from src.runtime.sessions import SessionKey
+
+
+class Lane:
+    """调度车道：独立的并发容量、等待队列与等待时间统计"""
+
+    def __init__(self, name: str, capacity: int, wait_window: int = 1000):
+        self.name = name
+        self.capacity = capacity
+        self.in_use = 0
+        # 车道虚拟时钟：最近一次被调度请求的标签
+        self.vclock = 0.0
+        # 本车道轮次耗时的滑动平均，用于估计新flow的开销
+        self.avg_cost: Optional[float] = None
+        # (tag, seq, key, flow, future)
+        self.waiters: list[tuple] = []
+        self.wait_times: deque[float] = deque(maxlen=wait_window)
+        self.granted = 0
+
+    def waiting(self) -> list[tuple]:
+        return sorted(w for w in self.waiters if not w[4].done())
+
+    def stats(self) -> dict:
+        wait_times = sorted(self.wait_times)
+
+        def percentile(p: float) -> float:
+            if not wait_times:
+                return 0.0
+            return round(wait_times[min(int(len(wait_times) * p), len(wait_times) - 1)], 3)
+
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "waiting": len(self.waiting()),
+            "granted": self.granted,
+            "wait_p50": percentile(0.5),
+            "wait_p95": percentile(0.95),
+        }
+
+
+class FairScheduler:
+    """加权公平调度器
+
+    按flow(租户或会话)做加权公平排队(start-time fair queuing)：
+    每个flow维护虚拟时间，入队时按预估耗时/权重预先累加，结束后按实际耗时修正，
+    等待中标签最小的请求先被调度。
+    持续发起长任务的flow虚拟时间增长更快，不会饿死其他用户。
+    不同车道(如interactive/research)容量相互独立，max_total限制所有车道的总并发。
+    """
+
+    def __init__(
+        self,
+        lanes: dict[str, int],
+        max_total: Optional[int] = None,
+        weights: Optional[dict[Hashable, float]] = None,
+        max_flows: int = 10000,
+    ):
+        self.lanes = {name: Lane(name, capacity) for name, capacity in lanes.items()}
+        self.max_total = max_total
+        self.weights = weights or {}
+        # flow -> 虚拟时间
+        self.vtime: dict[Hashable, float] = {}
+        # flow -> 轮次耗时的滑动平均
+        self.flow_cost: dict[Hashable, float] = {}
+        self.max_flows = max_flows
+        self._seq = itertools.count()
+
+    @property
+    def in_flight(self) -> int:
+        return sum(lane.in_use for lane in self.lanes.values())
+
+    @property
+    def capacity(self) -> int:
+        capacity = sum(lane.capacity for lane in self.lanes.values())
+        return min(capacity, self.max_total) if self.max_total else capacity
+
+    def has_capacity(self, lane: str) -> bool:
+        return self._can_grant(self.lanes[lane]) and not self.lanes[lane].waiting()
+
+    def position(self, key: SessionKey, lane: Optional[str] = None) -> Optional[int]:
+        """会话在所在车道(或指定车道)等待队列中的位置(从1开始)，未在等待时返回None"""
+        lanes = [self.lanes[lane]] if lane else self.lanes.values()
+        for lane_obj in lanes:
+            for i, waiter in enumerate(lane_obj.waiting()):
+                if waiter[2] == key:
+                    return i + 1
+        return None
+
+    def waiting_count(self) -> int:
+        return sum(len(lane.waiting()) for lane in self.lanes.values())
+
+    @asynccontextmanager
+    async def slot(self, key: SessionKey, flow: Hashable, lane: str = "interactive"):
+        """在指定车道获取运行名额，退出时按本轮耗时为flow记账"""
+        lane_obj = self.lanes[lane]
+        weight = self.weights.get(flow, 1.0)
+        estimate = self.flow_cost.get(flow, lane_obj.avg_cost or 0.0)
+        tag = max(lane_obj.vclock, self.vtime.get(flow, 0.0))
+        self.vtime[flow] = tag + estimate / weight
+
+        enqueued = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(lane_obj.waiters, (tag, next(self._seq), key, flow, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 未运行的请求不计入虚拟时间；已被调度但随即取消时归还名额
+            self.vtime[flow] = self.vtime.get(flow, tag) - estimate / weight
+            if future.done() and not future.cancelled():
+                self._release(lane_obj)
+            raise
+
+        lane_obj.wait_times.append(time.monotonic() - enqueued)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            cost = time.monotonic() - started
+            self.vtime[flow] = self.vtime.get(flow, tag) + (cost - estimate) / weight
+            self.flow_cost[flow] = self._smooth(self.flow_cost.get(flow), cost)
+            lane_obj.avg_cost = self._smooth(lane_obj.avg_cost, cost)
+            self._release(lane_obj)
+            if len(self.vtime) > self.max_flows:
+                self._prune_flows()
+
+    def stats(self) -> dict:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def _prune_flows(self):
+        """虚拟时间落后于所有车道时钟的flow与新flow等价，可以丢弃"""
+        floor = min(lane.vclock for lane in self.lanes.values())
+        self.vtime = {flow: v for flow, v in self.vtime.items() if v > floor}
+        self.flow_cost = {flow: self.flow_cost[flow] for flow in self.vtime if flow in self.flow_cost}
+
+    @staticmethod
+    def _smooth(average: Optional[float], value: float, alpha: float = 0.3) -> float:
+        return value if average is None else alpha * value + (1 - alpha) * average
+
+    def _can_grant(self, lane: Lane) -> bool:
+        if lane.in_use >= lane.capacity:
+            return False
+        return not self.max_total or self.in_flight < self.max_total
+
+    def _release(self, lane: Lane):
+        lane.in_use -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """按标签从小到大调度各车道中等待的请求"""
+        progressed = True
+        while progressed:
+            progressed = False
+            # 总并发受限时，优先调度标签最小的车道
+            candidates = []
+            for lane in self.lanes.values():
+                while lane.waiters and lane.waiters[0][4].done():
+                    heapq.heappop(lane.waiters)
+                if lane.waiters and self._can_grant(lane):
+                    candidates.append((lane.waiters[0][0], lane.name))
+            if not candidates:
+                return
+
+            lane = self.lanes[min(candidates)[1]]
+            tag, _, _, _, future = heapq.heappop(lane.waiters)
+            lane.vclock = max(lane.vclock, tag)
+            lane.in_use += 1
+            lane.granted += 1
+            future.set_result(None)
+            progressed = True
@@ -0,0 +1,184 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from pydantic import BaseModel
+
+from src.core.db_client import DatabaseClient
+from src.utlis.logger_config import logger
+
+
+SessionKey = tuple[str, str]  # (open_id, chat_id)
+
+
+class RuntimeConfig(BaseModel):
+    chat_title: Optional[str] = None
+    thread_id: Optional[str] = None
+    tenant_id: Optional[str] = None
+    recv_id_type: Optional[str] = None
+
+    messages_len: int = 1
+    max_messages_len: int = 10
+    messages_queue: list[str] = []
+    take_interupt: Optional[bool] = None
+    processing: bool = False
+
+
+class SessionStore:
+    """会话运行时配置存储
+
+    内存中保留最近活跃的会话(LRU)，状态持久化到SQLite。
+    空闲超过idle_ttl或超出max_hot的会话被移出内存，下一条消息到达时再从数据库恢复。
+    正在处理或仍有排队消息的会话不会被淘汰。
+    """
+
+    def __init__(
+        self,
+        db_api: DatabaseClient,
+        max_hot: int = 1000,
+        idle_ttl: Optional[float] = 3600,
+        sweep_interval: float = 60,
+    ):
+        self.db_api = db_api
+        self.max_hot = max_hot
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+
+        self.hot: OrderedDict[SessionKey, RuntimeConfig] = OrderedDict()
+        self.last_access: dict[SessionKey, float] = {}
+        self.evicted = 0
+        self.restored = 0
+
+        self._table_ready = False
+        self._last_sweep = time.monotonic()
+
+    async def _ensure_table(self):
+        if self._table_ready:
+            return
+        await self.db_api.execute(
+            """
+            CREATE TABLE IF NOT EXISTS runtime_sessions (
+                open_id TEXT NOT NULL,
+                chat_id TEXT NOT NULL,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (open_id, chat_id)
+            )
+            """
+        )
+        self._table_ready = True
+
+    def peek(self, key: SessionKey) -> Optional[RuntimeConfig]:
+        """只查询内存中的会话，不触发恢复"""
+        return self.hot.get(key)
+
+    async def get(self, key: SessionKey) -> RuntimeConfig:
+        """获取会话，不在内存中则从数据库恢复或新建"""
+        runtime_config = self.hot.get(key)
+        if runtime_config is None:
+            loaded = await self._load(key)
+            # 加载期间可能已有同一会话的并发请求完成了恢复
+            runtime_config = self.hot.get(key)
+            if runtime_config is None:
+                runtime_config = loaded or RuntimeConfig()
+                if loaded:
+                    self.restored += 1
+                self.hot[key] = runtime_config
+
+        self._touch(key)
+        await self._maybe_evict(keep=key)
+        return runtime_config
+
+    async def save(self, key: SessionKey):
+        """持久化会话状态（中断与处理中标记不持久化）"""
+        runtime_config = self.hot.get(key)
+        if runtime_config is None:
+            return
+        await self._ensure_table()
+        state = runtime_config.model_dump_json(exclude={"take_interupt", "processing"})
+        await self.db_api.execute(
+            """
+            INSERT INTO runtime_sessions (open_id, chat_id, state, updated_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(open_id, chat_id) DO UPDATE SET
+            state = excluded.state, updated_at = excluded.updated_at
+            """,
+            (key[0], key[1], state, time.time()),
+        )
+
+    async def save_all(self):
+        """持久化所有内存中的会话"""
+        for key in list(self.hot):
+            await self.save(key)
+
+    async def pending(self) -> list[SessionKey]:
+        """所有仍有排队消息的会话（含已持久化但不在内存中的），用于重启后恢复处理"""
+        await self._ensure_table()
+        keys = [key for key, c in self.hot.items() if c.messages_queue]
+        rows = await self.db_api.fetchall(
+            """
+            SELECT open_id, chat_id FROM runtime_sessions
+            WHERE json_array_length(state, '$.messages_queue') > 0
+            """
+        )
+        keys.extend(key for key in map(tuple, rows) if key not in self.hot)
+        return keys
+
+    async def evict_idle(self) -> int:
+        """淘汰空闲超时的会话，返回淘汰数量"""
+        if self.idle_ttl is None:
+            return 0
+        deadline = time.monotonic() - self.idle_ttl
+        count = 0
+        for key in list(self.hot):
+            if self.last_access.get(key, 0) >= deadline:
+                break
+            count += await self._evict(key)
+        return count
+
+    def stats(self) -> dict:
+        return {
+            "hot": len(self.hot),
+            "evicted": self.evicted,
+            "restored": self.restored,
+        }
+
+    def _touch(self, key: SessionKey):
+        self.last_access[key] = time.monotonic()
+        self.hot.move_to_end(key)
+
+    async def _maybe_evict(self, keep: SessionKey):
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = time.monotonic()
+            await self.evict_idle()
+
+        for key in list(self.hot):
+            if len(self.hot) <= self.max_hot:
+                break
+            if key != keep:
+                await self._evict(key)
+
+    async def _evict(self, key: SessionKey) -> int:
+        runtime_config = self.hot[key]
+        if runtime_config.processing or runtime_config.messages_queue:
+            return 0
+        accessed_at = self.last_access.get(key)
+        await self.save(key)
+        # 持久化期间会话被再次访问则保留
+        if key not in self.hot or self.last_access.get(key) != accessed_at:
+            return 0
+        del self.hot[key]
+        self.last_access.pop(key, None)
+        self.evicted += 1
+        logger.debug(f"Evicted idle session {key}")
+        return 1
+
+    async def _load(self, key: SessionKey) -> Optional[RuntimeConfig]:
+        await self._ensure_table()
+        row = await self.db_api.fetchone(
+            "SELECT state FROM runtime_sessions WHERE open_id = ? AND chat_id = ?",
+            key,
+        )
+        if not row:
+            return None
+        return RuntimeConfig.model_validate_json(row[0])
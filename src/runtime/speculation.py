@@ -0,0 +1,128 @@
+import asyncio
+import unicodedata
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+from src.utlis.logger_config import logger
+
+
+# 知识库检索：query -> 按space_id分组的检索结果
+RetrieveFn = Callable[[str], Awaitable[dict]]
+# 渲染预取结果：(检索结果, space_id) -> 工具输出，space_id为None时渲染全部知识库
+RenderFn = Callable[[dict, Optional[str]], str]
+
+
+def _grams(text: str) -> set[str]:
+    """归一化后的字符二元组，中英文都适用"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = "".join(ch for ch in text if ch.isalnum())
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i : i + 2] for i in range(len(text) - 1)}
+
+
+def similarity(a: str, b: str) -> float:
+    """两个查询的二元组Jaccard相似度"""
+    grams_a, grams_b = _grams(a), _grams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+class Speculation:
+    """一轮对话中用原始问题预取的知识库检索结果"""
+
+    def __init__(self, retriever: "SpeculativeRetriever", query: str, task: asyncio.Task):
+        self.retriever = retriever
+        self.query = query
+        self.task = task
+        self.used = False
+        self.closed = False
+
+    async def take(self, query: str, space_id: Optional[str] = None) -> Optional[str]:
+        """模型发起的检索与预取足够接近时返回预取结果，否则返回None
+
+        指定space_id时只使用该知识库的预取结果，预取未覆盖该知识库时返回None
+        """
+        if self.closed:
+            return None
+        score = similarity(self.query, query)
+        if score < self.retriever.threshold:
+            self.retriever.misses += 1
+            logger.debug(f"Speculation miss ({score:.2f}): {query!r} vs {self.query!r}")
+            return None
+        try:
+            results = await asyncio.shield(self.task)
+        except Exception as e:
+            self.retriever.misses += 1
+            logger.warning(f"预取的知识库检索失败: {str(e)}")
+            return None
+        if space_id is not None and space_id not in results:
+            self.retriever.misses += 1
+            logger.debug(f"Speculation miss: knowledge base {space_id} was not prefetched")
+            return None
+        if not self.used:
+            self.retriever.hits += 1
+            self.used = True
+        return self.retriever.render(results, space_id)
+
+    def close(self):
+        """本轮结束，取消未完成的预取"""
+        if self.closed:
+            return
+        self.closed = True
+        if not self.used:
+            self.retriever.unused += 1
+        if not self.task.done():
+            self.task.cancel()
+
+
+# 由Agent在运行本轮前设置，search_docs工具据此使用预取结果
+current_speculation: ContextVar[Optional[Speculation]] = ContextVar(
+    "current_speculation", default=None
+)
+
+
+class SpeculativeRetriever:
+    """投机检索
+
+    收到消息时就用原始问题开始知识库检索，与第一次模型调用并行；
+    模型随后调用search_docs且查询与原始问题足够接近时直接使用预取结果，省去检索等待；
+    模型指定了space_id(如根据提示词中的知识库目录)时，使用预取结果中该知识库的部分。
+    """
+
+    def __init__(
+        self,
+        retrieve: RetrieveFn,
+        render: RenderFn,
+        threshold: float = 0.5,
+        min_query_chars: int = 4,
+    ):
+        self.retrieve = retrieve
+        self.render = render
+        self.threshold = threshold
+        self.min_query_chars = min_query_chars
+
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.unused = 0
+
+    def start(self, query: str) -> Optional[Speculation]:
+        """开始预取并设置为当前轮次的预取结果，问题过短时不预取"""
+        if len(query.strip()) < self.min_query_chars:
+            current_speculation.set(None)
+            return None
+        self.started += 1
+        speculation = Speculation(self, query, asyncio.create_task(self.retrieve(query)))
+        current_speculation.set(speculation)
+        return speculation
+
+    def stats(self) -> dict:
+        return {
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "unused": self.unused,
+            "hit_rate": round(self.hits / self.started, 3) if self.started else 0.0,
+        }
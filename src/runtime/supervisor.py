@@ -0,0 +1,342 @@
+import os
+import time
+import queue
+import uuid
+import signal
+import asyncio
+import bisect
+import hashlib
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future
+from typing import Callable, Literal, Optional
+
+from src.utlis.config import Config
+from src.utlis.logger_config import logger
+
+
+class HashRing:
+    """一致性哈希环：同一会话总是路由到同一个worker，worker数量变化时只迁移少量会话"""
+
+    def __init__(self, nodes: list[int], replicas: int = 64):
+        self.ring: list[tuple[int, int]] = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas)
+        )
+        self.hashes = [h for h, _ in self.ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        # 内置hash()在不同进程间不稳定，使用md5
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def get(self, key: str) -> int:
+        index = bisect.bisect(self.hashes, self._hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+
+def _worker_main(
+    worker_id: int,
+    num_workers: int,
+    config: Config,
+    agent_factory: Callable,
+    inbox: mp.Queue,
+    outbox: mp.Queue,
+):
+    """worker进程入口：在独立事件循环中运行LarkRunner，处理supervisor转发的事件"""
+    # 停机由supervisor统一协调（向inbox发送None），worker忽略终端与部署发来的信号
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(
+        _worker_loop(worker_id, num_workers, config, agent_factory, inbox, outbox)
+    )
+
+
+async def _worker_loop(
+    worker_id: int,
+    num_workers: int,
+    config: Config,
+    agent_factory: Callable,
+    inbox: mp.Queue,
+    outbox: mp.Queue,
+):
+    from src.runner import LarkRunner
+
+    ring = HashRing(list(range(num_workers)))
+    runner = LarkRunner(
+        config,
+        owns=lambda key: ring.get(f"{key[0]}:{key[1]}") == worker_id,
+        # 每个worker进程暴露自己的指标端口
+        metrics_port=config.metrics_port + 1 + worker_id if config.metrics_port else None,
+    )
+    runner.set_agent(agent_factory(config))
+    runner.ensure_started()
+    loop = asyncio.get_running_loop()
+    logger.info(f"Worker {worker_id} started (pid {os.getpid()})")
+
+    async def heartbeat():
+        while True:
+            outbox.put(("heartbeat", worker_id, None))
+            await asyncio.sleep(config.worker_heartbeat_interval)
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        while True:
+            event = await loop.run_in_executor(None, inbox.get)
+            if event is None:
+                break
+
+            kind, event_id, args = event
+            try:
+                # 按到达顺序逐个处理，保证同一会话内的消息顺序
+                if kind == "message":
+                    await runner.callback_reply_message(*args)
+                elif kind == "card_action":
+                    result = await runner.callback_card_action(*args)
+                    outbox.put(("result", event_id, result))
+                elif kind == "hello":
+                    await runner.call_back_hello(*args)
+            except Exception as e:
+                logger.error(f"Worker {worker_id} 处理事件 {kind} 出错: {e}")
+                if kind == "card_action":
+                    outbox.put(
+                        ("result", event_id, {"toast": {"type": "error", "content": "操作失败"}})
+                    )
+            finally:
+                outbox.put(("ack", worker_id, event_id))
+        await runner.shutdown()
+    finally:
+        heartbeat_task.cancel()
+        logger.info(f"Worker {worker_id} stopped")
+
+
+class Supervisor:
+    """多进程运行模式
+
+    supervisor进程持有唯一的飞书WebSocket连接，按(open_id, chat_id)的一致性哈希
+    将事件转发给N个worker进程，每个worker运行独立的LarkRunner与事件循环，
+    会话状态与checkpoint通过同一个SQLite数据库共享。
+    supervisor负责监控worker心跳，进程退出或心跳超时时重启该worker。
+    被终止的进程可能持有队列的内部锁(阻塞在inbox.get()中，或正在写outbox)，
+    因此每个进程使用新的outbox，重启时换用新的inbox，
+    并把worker尚未确认(ack)的事件按原顺序重新投递；重复投递的消息由worker的去重处理。
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        agent_factory: Callable[[Config], object],
+        workers: Optional[int] = None,
+    ):
+        self.config = config
+        self.agent_factory = agent_factory
+        self.num_workers = workers or config.runner_workers
+        self.ring = HashRing(list(range(self.num_workers)))
+
+        self.ctx = mp.get_context("spawn")
+        self.inboxes = [self.ctx.Queue() for _ in range(self.num_workers)]
+        self.outboxes: list[Optional[mp.Queue]] = [None] * self.num_workers
+        # 已投递但worker尚未确认的事件：event_id -> event，重启worker时重新投递
+        self.unacked: list[dict[str, tuple]] = [{} for _ in range(self.num_workers)]
+        self._inbox_lock = threading.Lock()
+        self.processes: list[Optional[mp.Process]] = [None] * self.num_workers
+        # None表示worker尚未完成启动（导入模块、构建agent可能较慢）
+        self.heartbeats: list[Optional[float]] = [None] * self.num_workers
+        self.spawned_at = [0.0] * self.num_workers
+        self.restarts = [0] * self.num_workers
+
+        # 卡片操作需要同步返回toast，等待worker回传结果
+        self.pending: dict[str, Future] = {}
+        self.lark_ws = None
+        self._stopping = threading.Event()
+
+    def route(self, open_id: str, chat_id: str) -> int:
+        return self.ring.get(f"{open_id}:{chat_id}")
+
+    def _forward(self, worker_id: int, kind: str, args: tuple, event_id: Optional[str] = None):
+        event = (kind, event_id or uuid.uuid4().hex, args)
+        with self._inbox_lock:
+            self.unacked[worker_id][event[1]] = event
+            self.inboxes[worker_id].put(event)
+
+    async def callback_reply_message(
+        self,
+        open_id: str,
+        chat_id: str,
+        msg_id: str,
+        content: str,
+        recv_id_type: Literal["open_id", "chat_id"],
+    ):
+        worker_id = self.route(open_id, chat_id)
+        self._forward(worker_id, "message", (open_id, chat_id, msg_id, content, recv_id_type))
+
+    async def callback_card_action(self, open_id: str, chat_id: str, actions: dict):
+        worker_id = self.route(open_id, chat_id)
+        request_id = uuid.uuid4().hex
+        future = Future()
+        self.pending[request_id] = future
+        self._forward(worker_id, "card_action", (open_id, chat_id, actions), request_id)
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout=self.config.card_action_timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Worker {worker_id} 响应卡片操作超时")
+            return {"toast": {"type": "info", "content": "处理中，请稍候"}}
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def call_back_hello(
+        self, open_id, chat_id, recv_id_id_type: Literal["open_id", "chat_id"]
+    ):
+        worker_id = self.route(open_id, chat_id)
+        self._forward(worker_id, "hello", (open_id, chat_id, recv_id_id_type))
+
+    def start_workers(self):
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def stop_workers(self, timeout: Optional[float] = None):
+        """通知所有worker优雅停机并等待"""
+        if timeout is None:
+            # 留出worker排空进行中轮次与持久化状态的时间
+            timeout = self.config.shutdown_timeout + self.config.shutdown_stop_grace + 10
+        self._stopping.set()
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            if process is not None:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            f"worker-{i}": {
+                "alive": bool(process and process.is_alive()),
+                "pid": process.pid if process else None,
+                "heartbeat_age": (
+                    None if self.heartbeats[i] is None else round(now - self.heartbeats[i], 1)
+                ),
+                "restarts": self.restarts[i],
+            }
+            for i, process in enumerate(self.processes)
+        }
+
+    def _spawn(self, worker_id: int):
+        outbox = self.ctx.Queue()
+        process = self.ctx.Process(
+            target=_worker_main,
+            args=(
+                worker_id,
+                self.num_workers,
+                self.config,
+                self.agent_factory,
+                self.inboxes[worker_id],
+                outbox,
+            ),
+            name=f"taro-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[worker_id] = process
+        self.outboxes[worker_id] = outbox
+        self.heartbeats[worker_id] = None
+        self.spawned_at[worker_id] = time.monotonic()
+        threading.Thread(
+            target=self._read_outbox, args=(worker_id, outbox), daemon=True
+        ).start()
+
+    def _replace_inbox(self, worker_id: int):
+        """换用新的队列，并按原顺序重新投递未确认的事件"""
+        with self._inbox_lock:
+            old = self.inboxes[worker_id]
+            # 旧队列的锁可能被已终止的进程持有，剩余数据直接丢弃，不等待feeder线程
+            old.cancel_join_thread()
+            old.close()
+            self.inboxes[worker_id] = self.ctx.Queue()
+            for event in self.unacked[worker_id].values():
+                self.inboxes[worker_id].put(event)
+            if self.unacked[worker_id]:
+                logger.info(
+                    f"Redelivering {len(self.unacked[worker_id])} events to worker {worker_id}"
+                )
+
+    def _read_outbox(self, worker_id: int, outbox: mp.Queue):
+        """读取一个worker进程的心跳、确认与结果，进程被替换后退出"""
+        while not self._stopping.is_set() and self.outboxes[worker_id] is outbox:
+            try:
+                kind, key, value = outbox.get(timeout=1)
+            except queue.Empty:
+                continue
+            if kind == "heartbeat":
+                self.heartbeats[key] = time.monotonic()
+            elif kind == "ack":
+                with self._inbox_lock:
+                    self.unacked[key].pop(value, None)
+            elif kind == "result":
+                future = self.pending.get(key)
+                if future is not None and not future.done():
+                    future.set_result(value)
+
+    def _monitor(self):
+        """进程退出或心跳超时(事件循环被阻塞)时重启worker"""
+        while not self._stopping.wait(self.config.worker_heartbeat_interval):
+            for worker_id, process in enumerate(self.processes):
+                if self._stopping.is_set():
+                    return
+                dead = process is None or not process.is_alive()
+                last_heartbeat = self.heartbeats[worker_id]
+                if last_heartbeat is None:
+                    stale = (
+                        time.monotonic() - self.spawned_at[worker_id]
+                        > self.config.worker_startup_timeout
+                    )
+                else:
+                    stale = (
+                        time.monotonic() - last_heartbeat
+                        > self.config.worker_heartbeat_timeout
+                    )
+                if not dead and not stale:
+                    continue
+
+                reason = "exited" if dead else "heartbeat timeout"
+                logger.warning(f"Restarting worker {worker_id}: {reason}")
+                if not dead:
+                    process.terminate()
+                    process.join(5)
+                self.restarts[worker_id] += 1
+                self._replace_inbox(worker_id)
+                self._spawn(worker_id)
+
+    def start(self):
+        """启动worker进程与WebSocket服务器"""
+        from easylark.conn import EasyLarkWsServer
+
+        self.start_workers()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, self._handle_signal)
+        self.lark_ws = EasyLarkWsServer(
+            app_id=os.getenv("LARK_APP_ID"),
+            app_secret=os.getenv("LARK_APP_SECRET"),
+            callback_reply_message=self.callback_reply_message,
+            callback_card_action=self.callback_card_action,
+            callback_hello=self.call_back_hello,
+        )
+        try:
+            self.lark_ws.start()
+        except SystemExit:
+            pass
+        finally:
+            self.stop_workers()
+        logger.info("Supervisor stopped")
+
+    def _handle_signal(self, signum, frame):
+        # 退出WebSocket服务器，不再接收新事件；worker随后在stop_workers中排空
+        logger.info(f"Received signal {signum}, stopping workers")
+        raise SystemExit(0)
+
+    def run(self):
+        """启动服务 - 入口方法"""
+        self.start()
@@ -0,0 +1,199 @@
+import json
+import time
+import asyncio
+import hashlib
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Awaitable, Callable, Optional
+
+from src.core.db_client import DatabaseClient
+from src.utlis.logger_config import logger
+
+
+class ToolResultCache:
+    """工具结果缓存
+
+    以归一化后的查询与参数为键缓存web_search、deep_research等外部调用的结果，
+    每个工具有独立的ttl；传入db_api时持久化到SQLite，重启后依然生效。
+    同一键的并发调用只执行一次，其余调用等待其结果(single-flight)。
+    """
+
+    def __init__(
+        self,
+        db_api: Optional[DatabaseClient] = None,
+        ttls: Optional[dict[str, float]] = None,
+        default_ttl: float = 600,
+        max_size: int = 1000,
+        sweep_interval: float = 300,
+    ):
+        self.db_api = db_api
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+
+        # 键 -> (过期时间戳, 结果)
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # 进行中的调用
+        self.inflight: dict[str, asyncio.Future] = {}
+        self.counters: dict[str, dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0}
+        )
+
+        self._table_ready = False
+        self._last_sweep = 0.0
+
+    @staticmethod
+    def make_key(tool: str, query: str, **params) -> str:
+        """归一化查询(全半角、大小写、空白、句末标点)并与参数一起哈希"""
+        normalized = unicodedata.normalize("NFKC", query).lower()
+        normalized = " ".join(normalized.split()).rstrip("?!.。？！")
+        payload = json.dumps([normalized, params], sort_keys=True, ensure_ascii=False)
+        return f"{tool}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+    def ttl(self, tool: str) -> float:
+        return self.ttls.get(tool, self.default_ttl)
+
+    async def _ensure_table(self):
+        if self._table_ready:
+            return
+        await self.db_api.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tool_cache (
+                cache_key TEXT PRIMARY KEY,
+                tool TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+            """
+        )
+        self._table_ready = True
+
+    async def get(self, key: str) -> Optional[str]:
+        """查询未过期的缓存结果，不影响命中统计"""
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.entries.move_to_end(key)
+                return entry[1]
+            del self.entries[key]
+
+        if self.db_api is None:
+            return None
+        await self._ensure_table()
+        row = await self.db_api.fetchone(
+            "SELECT value, expires_at FROM tool_cache WHERE cache_key = ?", (key,)
+        )
+        if not row or row[1] <= now:
+            return None
+        self._remember(key, row[1], row[0])
+        return row[0]
+
+    async def set(self, tool: str, key: str, value: str):
+        expires_at = time.time() + self.ttl(tool)
+        self._remember(key, expires_at, value)
+        if self.db_api is None:
+            return
+        await self._ensure_table()
+        await self.db_api.execute(
+            "INSERT OR REPLACE INTO tool_cache (cache_key, tool, value, expires_at) VALUES (?, ?, ?, ?)",
+            (key, tool, value, expires_at),
+        )
+        now = time.time()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            await self.db_api.execute("DELETE FROM tool_cache WHERE expires_at <= ?", (now,))
+
+    async def join(self, tool: str, key: str) -> Optional[str]:
+        """命中缓存或等待进行中的相同调用；都没有时返回None"""
+        value = await self.get(key)
+        if value is not None:
+            self.counters[tool]["hits"] += 1
+            return value
+        flight = self.inflight.get(key)
+        if flight is None:
+            return None
+        self.counters[tool]["coalesced"] += 1
+        try:
+            return await asyncio.shield(flight)
+        except asyncio.CancelledError:
+            # 执行调用的任务被取消时，等待者自行调用
+            if not flight.cancelled() or asyncio.current_task().cancelling():
+                raise
+            return None
+
+    def begin(self, tool: str, key: str, bypass: bool = False) -> asyncio.Future:
+        """登记一次实际调用，之后相同键的调用会等待它的结果"""
+        self.counters[tool]["bypassed" if bypass else "misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight.setdefault(key, future)
+        return future
+
+    async def finish(
+        self,
+        tool: str,
+        key: str,
+        future: asyncio.Future,
+        value: Optional[str] = None,
+        error: Optional[BaseException] = None,
+    ):
+        """结束调用：value为None时不缓存（如调用失败），等待者收到相同的结果或异常"""
+        if error is None and value is not None:
+            # 先写入缓存再移除进行中标记，期间到达的相同调用仍会等待
+            try:
+                await self.set(tool, key, value)
+            except Exception as e:
+                logger.error(f"写入工具缓存出错: {e}")
+
+        if self.inflight.get(key) is future:
+            del self.inflight[key]
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            # 调用被取消（或流式调用未读完就关闭），等待者自行重新调用
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+            # 没有等待者时避免"exception was never retrieved"警告
+            future.exception()
+        else:
+            future.set_result(value)
+
+    async def get_or_call(
+        self,
+        tool: str,
+        key: str,
+        call: Callable[[], Awaitable[Optional[str]]],
+        bypass: bool = False,
+    ) -> Optional[str]:
+        """返回缓存结果，未命中时执行call；bypass时忽略已有缓存并刷新"""
+        if not bypass:
+            value = await self.join(tool, key)
+            if value is not None:
+                return value
+
+        future = self.begin(tool, key, bypass=bypass)
+        try:
+            value = await call()
+        except BaseException as e:
+            await self.finish(tool, key, future, error=e)
+            raise
+        await self.finish(tool, key, future, value=value)
+        return value
+
+    def stats(self) -> dict:
+        result = {}
+        for tool, counter in self.counters.items():
+            lookups = counter["hits"] + counter["coalesced"] + counter["misses"]
+            result[tool] = {
+                **counter,
+                "hit_rate": round((counter["hits"] + counter["coalesced"]) / lookups, 3)
+                if lookups
+                else 0.0,
+            }
+        return result
+
+    def _remember(self, key: str, expires_at: float, value: str):
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
@@ -0,0 +1,384 @@
+import json
+import time
+import uuid
+import asyncio
+import secrets
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Optional, Protocol
+from uuid import UUID
+
+import httpx
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from src.utlis.logger_config import logger
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    end: Optional[float] = None
+    attrs: dict = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "duration": round(self.duration, 4)}
+
+
+class SpanExporter(Protocol):
+    async def export(self, spans: list[Span]): ...
+
+    async def aclose(self): ...
+
+
+class JsonlSpanExporter:
+    """每个span一行追加写入本地JSONL文件"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _write(self, lines: list[str]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+
+    async def export(self, spans: list[Span]):
+        lines = [json.dumps(s.to_dict(), ensure_ascii=False) + "\n" for s in spans]
+        await asyncio.to_thread(self._write, lines)
+
+    async def aclose(self):
+        pass
+
+
+class OtlpSpanExporter:
+    """以OTLP/HTTP JSON格式发送到collector（POST {endpoint}/v1/traces）"""
+
+    def __init__(self, endpoint: str, service_name: str = "taro", timeout: float = 5):
+        self.endpoint = endpoint.rstrip("/")
+        self.service_name = service_name
+        self.timeout = timeout
+        self.http: Optional[httpx.AsyncClient] = None
+
+    @staticmethod
+    def _attributes(attrs: dict) -> list[dict]:
+        result = []
+        for key, value in attrs.items():
+            if isinstance(value, bool):
+                typed = {"boolValue": value}
+            elif isinstance(value, int):
+                typed = {"intValue": str(value)}
+            elif isinstance(value, float):
+                typed = {"doubleValue": value}
+            else:
+                typed = {"stringValue": str(value)}
+            result.append({"key": key, "value": typed})
+        return result
+
+    def payload(self, spans: list[Span]) -> dict:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": self._attributes({"service.name": self.service_name})
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "taro"},
+                            "spans": [
+                                {
+                                    "traceId": s.trace_id,
+                                    "spanId": s.span_id,
+                                    "parentSpanId": s.parent_id or "",
+                                    "name": s.name,
+                                    "kind": 1,
+                                    "startTimeUnixNano": str(int(s.start * 1e9)),
+                                    "endTimeUnixNano": str(int((s.end or s.start) * 1e9)),
+                                    "attributes": self._attributes({"kind": s.kind, **s.attrs}),
+                                }
+                                for s in spans
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    async def export(self, spans: list[Span]):
+        if self.http is None:
+            self.http = httpx.AsyncClient(timeout=self.timeout)
+        response = await self.http.post(f"{self.endpoint}/v1/traces", json=self.payload(spans))
+        response.raise_for_status()
+
+    async def aclose(self):
+        if self.http is not None:
+            await self.http.aclose()
+            self.http = None
+
+
+class Trace:
+    """一轮对话的所有span，根span覆盖整轮"""
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex
+        self.spans: list[Span] = []
+        self.root = self.start_span(name, kind="turn", parent=None, **attrs)
+        self.handler = TraceCallbackHandler(self)
+
+    @property
+    def finished(self) -> bool:
+        return self.root.end is not None
+
+    def start_span(
+        self,
+        name: str,
+        kind: str,
+        parent: Optional[Span] = None,
+        start: Optional[float] = None,
+        **attrs,
+    ) -> Span:
+        span = Span(
+            name=name,
+            kind=kind,
+            trace_id=self.trace_id,
+            span_id=secrets.token_hex(8),
+            parent_id=parent.span_id if parent else None,
+            start=start or time.time(),
+            attrs=attrs,
+        )
+        self.spans.append(span)
+        return span
+
+    def add_span(self, name: str, kind: str, start: float, end: float, **attrs) -> Span:
+        """记录已经结束的一段耗时"""
+        span = self.start_span(name, kind, parent=self.root, start=start, **attrs)
+        span.end = end
+        return span
+
+    def current(self) -> Span:
+        """当前上下文中本轮次的span，没有时返回根span"""
+        span = current_span.get()
+        return span if span is not None and span.trace_id == self.trace_id else self.root
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attrs) -> Iterator[Span]:
+        span = self.start_span(name, kind, parent=self.current(), **attrs)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            span.end = time.time()
+            current_span.reset(token)
+
+    def summary(self) -> dict:
+        """按类别汇总耗时"""
+        result: dict[str, Any] = {"total": round(self.root.duration, 3)}
+        llm = [s for s in self.spans if s.kind == "llm"]
+        if llm:
+            tokens = sum(s.attrs.get("tokens", 0) for s in llm)
+            generating = sum(s.duration - s.attrs.get("ttft", 0) for s in llm)
+            result["llm"] = {
+                "calls": len(llm),
+                "time": round(sum(s.duration for s in llm), 3),
+                "ttft": llm[0].attrs.get("ttft"),
+                "tokens": tokens,
+                "tokens_per_sec": round(tokens / generating, 1) if generating > 0 else 0.0,
+            }
+        for kind in ("queue", "tool", "search", "embedding", "retrieval", "card"):
+            spans = [s for s in self.spans if s.kind == kind]
+            if spans:
+                result[kind] = {
+                    "calls": len(spans),
+                    "time": round(sum(s.duration for s in spans), 3),
+                }
+        return result
+
+    def summary_line(self) -> str:
+        summary = self.summary()
+        parts = [f"total={summary['total']}s"]
+        for kind, value in summary.items():
+            if kind == "total":
+                continue
+            part = f"{kind}={value['time']}s/{value['calls']}"
+            if kind == "llm":
+                part += f" ttft={value['ttft']}s {value['tokens_per_sec']}tok/s"
+            parts.append(part)
+        return " ".join(parts)
+
+
+class TraceCallbackHandler(AsyncCallbackHandler):
+    """把LangChain的模型与工具调用记录为当前轮次的span
+
+    包装类模型（熔断、路由）只转发调用，不单独记录，只记录实际请求模型服务的调用。
+    """
+
+    run_inline: bool = True
+    WRAPPER_TYPES = ("resilient", "routed")
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        self.runs: dict[UUID, Span] = {}
+
+    def _parent(self, parent_run_id: Optional[UUID]) -> Span:
+        return self.runs.get(parent_run_id) or self.trace.current()
+
+    async def on_chat_model_start(
+        self,
+        serialized: dict,
+        messages: list,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[dict] = None,
+        invocation_params: Optional[dict] = None,
+        **kwargs: Any,
+    ):
+        params = invocation_params or kwargs.get("invocation_params") or {}
+        # 本轮结束后仍在运行的后台任务（如深度研究）继承了上下文，不再记录
+        if self.trace.finished or params.get("_type") in self.WRAPPER_TYPES:
+            return
+        model = (metadata or {}).get("ls_model_name") or params.get("model") or params.get("_type")
+        self.runs[run_id] = self.trace.start_span(
+            f"llm:{model}", "llm", parent=self._parent(parent_run_id), tokens=0
+        )
+
+    async def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        span = self.runs.get(run_id)
+        if span is None:
+            return
+        if "ttft" not in span.attrs:
+            span.attrs["ttft"] = round(time.time() - span.start, 4)
+        if token:
+            span.attrs["tokens"] += 1
+
+    async def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        span = self.runs.pop(run_id, None)
+        if span is None:
+            return
+        span.end = time.time()
+        try:
+            usage = response.generations[0][0].message.usage_metadata
+        except (AttributeError, IndexError):
+            usage = None
+        if usage and usage.get("output_tokens"):
+            span.attrs["tokens"] = usage["output_tokens"]
+        span.attrs.setdefault("ttft", round(span.duration, 4))
+        generating = span.duration - span.attrs["ttft"]
+        if generating > 0:
+            span.attrs["tokens_per_sec"] = round(span.attrs["tokens"] / generating, 1)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        span = self.runs.pop(run_id, None)
+        if span is not None:
+            span.end = time.time()
+            span.attrs["error"] = type(error).__name__
+
+    async def on_tool_start(
+        self,
+        serialized: dict,
+        input_str: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ):
+        if self.trace.finished:
+            return
+        name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+        span = self.trace.start_span(f"tool:{name}", "tool", parent=self._parent(parent_run_id))
+        self.runs[run_id] = span
+        # run_inline时在工具自身的上下文中执行，工具内部的span（embedding、检索）挂在工具span下
+        current_span.set(span)
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        span = self.runs.pop(run_id, None)
+        if span is not None:
+            span.end = time.time()
+
+    async def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        span = self.runs.pop(run_id, None)
+        if span is not None:
+            span.end = time.time()
+            span.attrs["error"] = type(error).__name__
+
+
+# 由Tracer在每轮开始时设置，agent、工具与RAG中的span记录到该轮次
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+# 设置后LangChain的所有回调管理器自动加入该handler
+_trace_handler: ContextVar[Optional[TraceCallbackHandler]] = ContextVar(
+    "trace_handler", default=None
+)
+register_configure_hook(_trace_handler, inheritable=True)
+
+
+@contextmanager
+def span(name: str, kind: str, **attrs) -> Iterator[Optional[Span]]:
+    """在当前轮次中记录一段耗时，不在轮次中时什么也不做"""
+    trace = current_trace.get()
+    if trace is None or trace.finished:
+        yield None
+        return
+    with trace.span(name, kind, **attrs) as s:
+        yield s
+
+
+class Tracer:
+    """每轮对话一个trace：结束时输出一行耗时汇总，并导出到JSONL文件或OTLP collector"""
+
+    def __init__(self, exporters: Optional[list[SpanExporter]] = None, enabled: bool = True):
+        self.exporters = exporters or []
+        self.enabled = enabled
+        self._exports: set[asyncio.Task] = set()
+
+    def start(self, name: str = "turn", **attrs) -> Optional[Trace]:
+        """开始一轮trace并设置为当前上下文的trace"""
+        if not self.enabled:
+            return None
+        trace = Trace(name, **attrs)
+        current_trace.set(trace)
+        current_span.set(None)
+        _trace_handler.set(trace.handler)
+        return trace
+
+    async def finish(self, trace: Optional[Trace]):
+        if trace is None:
+            return
+        trace.root.end = time.time()
+        if current_trace.get() is trace:
+            current_trace.set(None)
+            _trace_handler.set(None)
+        logger.info(f"Turn {trace.root.attrs.get('thread_id')}: {trace.summary_line()}")
+
+        # 导出在后台进行，不占用会话的运行名额
+        if self.exporters:
+            task = asyncio.create_task(self._export(trace.spans))
+            self._exports.add(task)
+            task.add_done_callback(self._exports.discard)
+
+    async def _export(self, spans: list[Span]):
+        for exporter in self.exporters:
+            try:
+                await exporter.export(spans)
+            except Exception as e:
+                logger.warning(f"导出trace失败 {type(exporter).__name__}: {str(e)}")
+
+    async def aclose(self):
+        """等待未完成的导出并关闭exporter"""
+        if self._exports:
+            await asyncio.gather(*self._exports, return_exceptions=True)
+        for exporter in self.exporters:
+            await exporter.aclose()
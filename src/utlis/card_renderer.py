@@ -0,0 +1,157 @@
+import time
+import asyncio
+from collections import deque
+from typing import AsyncIterator, AsyncGenerator, Callable, Optional
+
+
+class TokenBucket:
+    """令牌桶限流器：平均每秒rate次，最多突发burst次"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """获取一个令牌，返回等待的秒数"""
+        waited = 0.0
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class CardRenderer:
+    """Agent流与send_card_pipeline之间的渲染层
+
+    后台任务持续读取agent输出并合并到“最新卡片状态”中（相邻文本帧合并），
+    输出端按单卡最小间隔和全局令牌桶推送更新。卡片更新跟不上时中间帧被合并掉，
+    但内容不会丢失，最后一帧总会被推送。
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 0.3,
+        global_rate: float = 20.0,
+        global_burst: int = 20,
+        latency_window: int = 1000,
+    ):
+        self.min_interval = min_interval
+        self.global_limiter = TokenBucket(global_rate, global_burst)
+
+        self.updates = 0
+        self.merged_frames = 0
+        # 帧产生到被推送之间的延迟(秒)
+        self.latencies: deque[float] = deque(maxlen=latency_window)
+
+    async def render(
+        self,
+        frames: AsyncIterator[dict],
+        on_sent: Optional[Callable[[float, float], None]] = None,
+    ) -> AsyncGenerator[dict, None]:
+        """on_sent(start, end): 每帧被消费方处理（推送卡片）完成后回调，用于记录耗时"""
+        pending: list[dict] = []
+        # 每个pending帧最早一段内容到达的时间
+        arrived: list[float] = []
+        changed = asyncio.Event()
+        done = asyncio.Event()
+        finished = False
+        error: Optional[BaseException] = None
+
+        async def pump():
+            nonlocal finished, error
+            try:
+                async for frame in frames:
+                    if (
+                        pending
+                        and frame["type"] == "text"
+                        and pending[-1]["type"] == "text"
+                    ):
+                        pending[-1] = {
+                            "type": "text",
+                            "text": pending[-1]["text"] + frame["text"],
+                        }
+                        self.merged_frames += 1
+                    else:
+                        pending.append(dict(frame))
+                        arrived.append(time.monotonic())
+                    changed.set()
+            except Exception as e:
+                error = e
+            finally:
+                finished = True
+                done.set()
+                changed.set()
+
+        task = asyncio.create_task(pump())
+        last_update = 0.0
+        try:
+            while True:
+                await changed.wait()
+                changed.clear()
+
+                if pending and not finished:
+                    # 单卡限速：等待期间新到达的帧会继续合并，生成结束则立即推送
+                    delay = self.min_interval - (time.monotonic() - last_update)
+                    if delay > 0:
+                        try:
+                            await asyncio.wait_for(done.wait(), timeout=delay)
+                        except asyncio.TimeoutError:
+                            pass
+
+                if pending:
+                    batch, pending[:] = list(pending), []
+                    times, arrived[:] = list(arrived), []
+                    for frame, arrived_at in zip(batch, times):
+                        await self.global_limiter.acquire()
+                        self.latencies.append(time.monotonic() - arrived_at)
+                        self.updates += 1
+                        sent_at = time.time()
+                        yield frame
+                        # 消费方处理完该帧（推送卡片）后才会继续迭代
+                        if on_sent is not None:
+                            on_sent(sent_at, time.time())
+                    last_update = time.monotonic()
+
+                if finished and not pending:
+                    break
+
+            if error is not None:
+                raise error
+        finally:
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            # 提前结束时关闭源生成器，执行其清理逻辑（如agent的finally）
+            aclose = getattr(frames, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)], 3)
+
+        return {
+            "updates": self.updates,
+            "merged_frames": self.merged_frames,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+        }
@@ -2,7 +2,7 @@ import os
 import yaml
 from pathlib import Path
 from typing import Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict, field
 
 
 @dataclass
@@ -18,6 +18,119 @@ class Config:
     app_name: str = "Taro"
     debug: bool = False
 
+    # Checkpointer配置: memory | sqlite
+    checkpointer: str = "sqlite"
+    checkpoint_keep_last: Optional[int] = 20
+    checkpoint_thread_ttl: Optional[int] = 7 * 24 * 3600
+    checkpoint_maintenance_interval: Optional[int] = 3600
+    # 后台统计checkpoint存储规模的间隔(秒)，指标读取缓存的结果
+    checkpoint_stats_interval: Optional[int] = 60
+    # 仅memory模式生效
+    checkpoint_memory_keep_last: Optional[int] = 1
+    checkpoint_memory_max_threads: Optional[int] = 1000
+    checkpoint_memory_max_bytes: Optional[int] = 256 * 1024 * 1024
+
+    # 对话历史token预算，None表示不裁剪
+    history_max_tokens: Optional[int] = 8000
+    history_tool_result_tokens: int = 800
+
+    # 卡片更新限速：单卡最小间隔(秒)与全局每秒更新次数
+    card_update_interval: float = 0.3
+    card_global_rate: float = 20.0
+
+    # Runner并发：所有车道合计同时运行的agent数量上限、会话worker空闲退出时间(秒)
+    max_concurrent_runs: int = 8
+    worker_idle_timeout: float = 600
+
+    # 多进程模式：worker进程数(1表示单进程)、心跳间隔与超时、启动超时、卡片操作等待worker响应的时间(秒)
+    runner_workers: int = 1
+    worker_heartbeat_interval: float = 5
+    worker_heartbeat_timeout: float = 60
+    worker_startup_timeout: float = 120
+    card_action_timeout: float = 2.5
+
+    # 优雅停机：等待进行中轮次的时间、超时后停止生成再等待的时间(秒)
+    shutdown_timeout: float = 60
+    shutdown_stop_grace: float = 5
+
+    # 调度车道容量：interactive处理普通对话，research处理后台深度研究任务
+    scheduler_lanes: dict = field(
+        default_factory=lambda: {"interactive": 6, "research": 2}
+    )
+    # 公平调度权重：tenant_id或open_id -> 权重，默认为1
+    scheduler_weights: dict = field(default_factory=dict)
+
+    # 突发消息合并：窗口(秒，0表示关闭)与单轮最多合并的消息数
+    coalesce_window: float = 1.0
+    coalesce_max_messages: int = 4
+
+    # 会话存储：内存中最多保留的会话数、空闲淘汰时间(秒)
+    session_max_hot: int = 1000
+    session_idle_ttl: Optional[int] = 3600
+
+    # 事件去重：时间窗(秒)、内存中最多缓存的事件ID数、是否持久化到数据库
+    dedupe_ttl: float = 600
+    dedupe_max_size: int = 10000
+    dedupe_persist: bool = True
+
+    # 准入控制：运行名额占满且排队消息数或轮次耗时p95(秒)超过阈值时发送排队卡片，
+    # 排队消息数超过拒绝阈值时直接拒绝(None表示不拒绝)
+    admission_queue_threshold: int = 8
+    admission_latency_threshold: Optional[float] = 60
+    admission_reject_threshold: Optional[int] = 200
+
+    # 深度研究：是否向agent提供后台研究工具、进程内同时运行的研究数、每个会话进行中的任务上限
+    research_enabled: bool = False
+    research_max_concurrent: int = 2
+    research_max_jobs_per_chat: int = 2
+
+    # 工具结果缓存：各工具的有效期(秒)、内存中最多缓存的结果数、是否持久化到数据库
+    tool_cache_ttls: dict = field(
+        default_factory=lambda: {"web_search": 900, "deep_research": 86400}
+    )
+    tool_cache_max_size: int = 1000
+    tool_cache_persist: bool = True
+
+    # 网络搜索：单次搜索超时(秒)、共享连接池大小、各引擎同时进行的搜索数
+    search_timeout: float = 15
+    search_max_connections: int = 20
+    search_engine_concurrency: dict = field(
+        default_factory=lambda: {"tavily": 8, "duckduckgo": 4}
+    )
+
+    # 容错：模型调用整体超时与首token超时、query embedding超时(秒)，
+    # 连续失败多少次后熔断、熔断多久(秒)后放行探测请求，对冲延迟取近期耗时的分位数
+    llm_timeout: Optional[float] = 120
+    llm_first_token_timeout: Optional[float] = 30
+    embedding_timeout: Optional[float] = 10
+    breaker_failure_threshold: int = 5
+    breaker_recovery_timeout: float = 30
+    hedge_quantile: float = 0.95
+
+    # 快慢模型路由：问题长度、对话历史长度(字符)达到阈值，或单轮工具调用超过次数时使用慢模型
+    router_long_query_chars: int = 80
+    router_long_history_chars: int = 6000
+    router_max_fast_tool_rounds: int = 1
+
+    # 投机检索：是否在第一次模型调用的同时用原始问题预取知识库，
+    # 模型查询与原始问题的相似度达到阈值时使用预取结果，问题短于min_query_chars时不预取
+    speculative_retrieval: bool = False
+    speculative_match_threshold: float = 0.5
+    speculative_min_query_chars: int = 4
+
+    # 是否把知识库目录（构建时更新）写入系统提示词，模型可直接指定space_id检索
+    kb_catalog_in_prompt: bool = False
+
+    # 链路追踪：每轮记录排队、模型、工具、RAG与卡片推送的耗时并输出一行汇总，
+    # span可导出到本地JSONL文件或OTLP collector(http://host:4318)
+    tracing_enabled: bool = True
+    tracing_jsonl: Optional[str] = None
+    tracing_otlp_endpoint: Optional[str] = None
+
+    # Prometheus指标：HTTP端口(None表示不开启)与监听地址，多进程模式下worker i使用port+1+i
+    metrics_port: Optional[int] = None
+    metrics_host: str = "0.0.0.0"
+
     @classmethod
     def load_from_yaml(
         cls, config_path: Optional[str] = None, env: str = "dev"
@@ -72,13 +185,7 @@ class Config:
         config_path = Path(config_path)
         config_path.parent.mkdir(parents=True, exist_ok=True)
 
-        config_dict = {
-            "db_file": self.db_file,
-            "kb_folder": self.kb_folder,
-            "log_level": self.log_level,
-            "app_name": self.app_name,
-            "debug": self.debug,
-        }
+        config_dict = asdict(self)
 
         with open(config_path, "w", encoding="utf-8") as f:
             yaml.dump(config_dict, f, default_flow_style=False, allow_unicode=True)
@@ -104,6 +211,14 @@ class Config:
             print("错误: kb_folder不能为空")
             return False
 
+        if self.checkpointer not in ("memory", "sqlite"):
+            print("错误: checkpointer必须是 memory 或 sqlite")
+            return False
+
+        if "interactive" not in self.scheduler_lanes:
+            print("错误: scheduler_lanes必须包含 interactive 车道")
+            return False
+
         return True
 
     def ensure_directories(self) -> None:
@@ -1,8 +1,120 @@
+import time
+import asyncio
 from typing import Optional, Callable
 
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from langgraph.graph.graph import CompiledGraph
 
+from src.utlis.logger_config import logger
+
+
+STOPPED_NOTICE = "[已停止生成]"
+
+
+class StreamCoalescer:
+    """流式文本合并器：按“最大延迟”或“大小阈值”先到者输出一帧
+
+    大小阈值根据测得的文本速率自适应：速率越快阈值越大（帧数越少），
+    速率慢时由max_latency兜底，保证文本不会滞留在缓冲区。
+    """
+
+    def __init__(
+        self,
+        max_latency: float = 0.8,
+        min_size: int = 30,
+        max_size: int = 600,
+        smoothing: float = 0.3,
+    ):
+        self.max_latency = max_latency
+        self.min_size = min_size
+        self.max_size = max_size
+        self.smoothing = smoothing
+
+        self.buffer = ""
+        self.buffer_started: Optional[float] = None
+        self.rate: Optional[float] = None  # 字符/秒
+
+        self.frames = 0
+        self.total_chars = 0
+
+    @property
+    def size_threshold(self) -> int:
+        if not self.rate:
+            return self.min_size
+        return int(min(max(self.rate * self.max_latency, self.min_size), self.max_size))
+
+    def add(self, text: str) -> Optional[str]:
+        """追加文本，达到大小阈值时返回需要输出的文本"""
+        if not text:
+            return None
+        if not self.buffer:
+            self.buffer_started = time.monotonic()
+        self.buffer += text
+        if len(self.buffer) >= self.size_threshold:
+            return self.flush()
+        return None
+
+    def time_to_deadline(self) -> Optional[float]:
+        """距离强制输出还剩多少秒，缓冲区为空时返回None"""
+        if not self.buffer:
+            return None
+        elapsed = time.monotonic() - self.buffer_started
+        return max(self.max_latency - elapsed, 0.0)
+
+    def flush(self) -> str:
+        """输出缓冲区全部内容并更新速率估计"""
+        text, self.buffer = self.buffer, ""
+        if not text:
+            return text
+
+        elapsed = time.monotonic() - self.buffer_started
+        if elapsed > 0:
+            observed = len(text) / elapsed
+            self.rate = (
+                observed
+                if self.rate is None
+                else self.smoothing * observed + (1 - self.smoothing) * self.rate
+            )
+        self.buffer_started = None
+        self.frames += 1
+        self.total_chars += len(text)
+        return text
+
+    def count_frame(self):
+        """记录一个不经过缓冲区的帧(如工具调用)"""
+        self.frames += 1
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "chars": self.total_chars,
+            "rate": round(self.rate or 0.0, 1),
+            "size_threshold": self.size_threshold,
+        }
+
+
+async def save_stopped_turn(agent: CompiledGraph, config: dict, partial: str):
+    """将被停止的一轮写入checkpoint：补齐未完成的工具调用结果，并保存已输出的部分回答"""
+    state = await agent.aget_state(config)
+    messages = state.values.get("messages", [])
+    answered = {m.tool_call_id for m in messages if isinstance(m, ToolMessage)}
+
+    updates = []
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            break
+        if isinstance(msg, AIMessage):
+            for tool_call in msg.tool_calls:
+                if tool_call["id"] not in answered:
+                    updates.append(
+                        ToolMessage(content="已取消", tool_call_id=tool_call["id"])
+                    )
+            break
+
+    content = f"{partial}\n\n{STOPPED_NOTICE}" if partial else STOPPED_NOTICE
+    updates.append(AIMessage(content=content))
+    await agent.aupdate_state(config, {"messages": updates}, as_node="agent")
+
 
 async def invoke_lark(
     agent: CompiledGraph,
@@ -11,7 +123,15 @@ async def invoke_lark(
     interrupt: Optional[Callable] = None,
     chunk_size: int = 30,
     recursion_limit: Optional[int] = 25,
+    max_latency: float = 0.8,
+    coalescer: Optional[StreamCoalescer] = None,
+    stop_event: Optional[asyncio.Event] = None,
 ):
+    """运行agent并按合并策略输出卡片帧
+
+    stop_event被设置时立即取消agent任务(包括进行中的模型调用与工具调用)，
+    已输出的部分回答写入checkpoint后正常结束。
+    """
     config = {}
     if thread_id:
         config = {"configurable": {"thread_id": thread_id}}
@@ -23,6 +143,9 @@ async def invoke_lark(
     if recursion_limit:
         config["recursion_limit"] = recursion_limit
 
+    if coalescer is None:
+        coalescer = StreamCoalescer(max_latency=max_latency, min_size=chunk_size)
+
     with_subgraphs = True
     events = agent.astream(
         invoked_state,
@@ -31,49 +154,102 @@ async def invoke_lark(
         subgraphs=with_subgraphs,
     )
 
-    accumulated_content = ""
+    # 由单独的任务消费agent事件，主循环可以在等待事件时按截止时间输出缓冲文本
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
 
-    async for event in events:
-        if interrupt and interrupt():
-            return
+    async def produce():
+        try:
+            async for event in events:
+                await queue.put(event)
+        finally:
+            await queue.put(done)
 
-        if with_subgraphs:
-            node_meta_data, (msg, metadata) = event
-        else:
-            msg, metadata = event
+    producer = asyncio.create_task(produce())
+    stopper = None
+    if stop_event is not None:
+        stopper = asyncio.create_task(stop_event.wait())
+        stopper.add_done_callback(lambda _: producer.cancel())
 
-        yields = []
-        if isinstance(msg, AIMessage):
-            if msg.content:
-                accumulated_content += msg.content
-                if len(accumulated_content) >= chunk_size:
-                    yields.append({"type": "text", "text": accumulated_content})
-                    accumulated_content = ""
-            # elif msg.additional_kwargs.get("reasoning_content"):
-            #     accumulated_content += msg.additional_kwargs.get("reasoning_content")
-            #     if len(accumulated_content) >= chunk_size:
-            #         yields.append({"type": "text", "text": accumulated_content})
-            #         accumulated_content = ""
-
-            elif msg.tool_calls:
-                if accumulated_content:
-                    yields.append({"type": "text", "text": accumulated_content})
-                    accumulated_content = ""
-
-                for tool_call in msg.tool_calls:
-                    if tool_call["name"]:
-                        yields.append({"type": "tool_call", "text": tool_call["name"]})
-        elif isinstance(msg, ToolMessage):
-            if accumulated_content:
-                yields.append({"type": "text", "text": accumulated_content})
-                accumulated_content = ""
-            # Not yield tool message.
-
-        else:
-            pass
-
-        if yields:
-            yield yields
-
-    if accumulated_content:
-        yield [{"type": "text", "text": accumulated_content}]
+    # 当前这段尚未写入checkpoint的回答文本
+    partial = ""
+
+    def text_frame(text: str) -> dict:
+        return {"type": "text", "text": text}
+
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    queue.get(), timeout=coalescer.time_to_deadline()
+                )
+            except asyncio.TimeoutError:
+                yield [text_frame(coalescer.flush())]
+                continue
+
+            if event is done:
+                break
+
+            if interrupt and interrupt():
+                producer.cancel()
+                break
+
+            if with_subgraphs:
+                node_meta_data, (msg, metadata) = event
+            else:
+                msg, metadata = event
+
+            yields = []
+            if isinstance(msg, AIMessage):
+                if msg.content:
+                    partial += msg.content
+                    text = coalescer.add(msg.content)
+                    if text:
+                        yields.append(text_frame(text))
+
+                elif msg.tool_calls:
+                    partial = ""
+                    if coalescer.buffer:
+                        yields.append(text_frame(coalescer.flush()))
+
+                    for tool_call in msg.tool_calls:
+                        if tool_call["name"]:
+                            coalescer.count_frame()
+                            yields.append({"type": "tool_call", "text": tool_call["name"]})
+            elif isinstance(msg, ToolMessage):
+                partial = ""
+                if coalescer.buffer:
+                    yields.append(text_frame(coalescer.flush()))
+                # Not yield tool message.
+
+            else:
+                pass
+
+            if yields:
+                yield yields
+
+        stopped = False
+        try:
+            # 生产者异常(如模型调用失败)需要向上抛出
+            await producer
+        except asyncio.CancelledError:
+            # 外部取消(如关闭服务)继续向上抛出，只有stop导致的取消视为正常结束
+            if not producer.cancelled() or asyncio.current_task().cancelling():
+                raise
+            stopped = True
+
+        if stopped:
+            coalescer.add(f"\n\n{STOPPED_NOTICE}")
+            if thread_id:
+                try:
+                    await save_stopped_turn(agent, config, partial)
+                except Exception as e:
+                    logger.error(f"保存被停止的对话失败: {e}")
+
+        if coalescer.buffer:
+            yield [text_frame(coalescer.flush())]
+    finally:
+        if not producer.done():
+            producer.cancel()
+        if stopper is not None and not stopper.done():
+            stopper.cancel()
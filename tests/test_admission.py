@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from src.runtime.admission import AdmissionController
+from src.runtime.scheduler import FairScheduler
+
+
+@pytest.mark.asyncio
+async def test_decide_by_slots_queue_and_latency():
+    admission = AdmissionController(
+        FairScheduler({"interactive": 1}),
+        queue_threshold=2,
+        latency_threshold=10,
+        reject_threshold=5,
+    )
+    assert admission.decide(queued=3) == "admit"
+
+    async with admission.slot(("u1", "c1"), "u1"):
+        assert admission.decide(queued=1) == "admit"
+        assert admission.decide(queued=3) == "queue"
+        assert admission.decide(queued=6) == "reject"
+
+        admission.latencies.extend([20.0] * 10)
+        assert admission.decide(queued=1) == "queue"
+
+    assert admission.stats()["queued_notices"] == 2
+    assert admission.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_positions_drain_in_order():
+    admission = AdmissionController(FairScheduler({"interactive": 1}))
+    release = asyncio.Event()
+    order = []
+
+    async def run(key):
+        async with admission.slot(key, key[0]):
+            order.append(key)
+            await release.wait()
+
+    tasks = [asyncio.create_task(run((f"u{i}", "c"))) for i in range(3)]
+    await asyncio.sleep(0)
+    assert admission.in_flight == 1
+    assert admission.position(("u1", "c")) == 1
+    assert admission.position(("u2", "c")) == 2
+    assert admission.position(("u9", "c")) == 3
+
+    changed = asyncio.create_task(admission.wait_changed(timeout=1))
+    release.set()
+    await asyncio.wait_for(changed, timeout=1)
+    await asyncio.gather(*tasks)
+
+    assert order == [("u0", "c"), ("u1", "c"), ("u2", "c")]
+    assert admission.stats()["waiting"] == 0
+    assert len(admission.latencies) == 3
@@ -0,0 +1,101 @@
+import time
+import asyncio
+
+import pytest
+
+from src.utlis.card_renderer import CardRenderer, TokenBucket
+
+
+async def frames(items, delay=0.0):
+    for item in items:
+        await asyncio.sleep(delay)
+        yield item
+
+
+async def collect(renderer, source, consume_delay=0.0):
+    out = []
+    async for frame in renderer.render(source):
+        out.append(frame)
+        await asyncio.sleep(consume_delay)
+    return out
+
+
+@pytest.mark.asyncio
+async def test_slow_consumer_gets_merged_latest_state():
+    renderer = CardRenderer(min_interval=0.05)
+    items = [{"type": "text", "text": str(i)} for i in range(20)]
+    items.insert(10, {"type": "tool_call", "text": "search_docs"})
+
+    out = await collect(renderer, frames(items, delay=0.005), consume_delay=0.05)
+
+    texts = "".join(f["text"] for f in out if f["type"] == "text")
+    assert texts == "".join(str(i) for i in range(20))
+    assert [f["text"] for f in out if f["type"] == "tool_call"] == ["search_docs"]
+    assert len(out) < len(items)
+    assert renderer.stats()["updates"] == len(out)
+    assert renderer.stats()["merged_frames"] > 0
+
+
+@pytest.mark.asyncio
+async def test_final_frame_is_never_dropped():
+    renderer = CardRenderer(min_interval=10)
+    out = await collect(renderer, frames([{"type": "text", "text": "a"}] * 3))
+    assert "".join(f["text"] for f in out) == "aaa"
+
+
+@pytest.mark.asyncio
+async def test_source_errors_are_raised_after_flush():
+    async def failing():
+        yield {"type": "text", "text": "partial"}
+        raise RuntimeError("boom")
+
+    renderer = CardRenderer(min_interval=0)
+    out = []
+    with pytest.raises(RuntimeError):
+        async for frame in renderer.render(failing()):
+            out.append(frame)
+    assert out == [{"type": "text", "text": "partial"}]
+
+
+@pytest.mark.asyncio
+async def test_early_exit_closes_source():
+    closed = asyncio.Event()
+
+    async def endless():
+        try:
+            while True:
+                yield {"type": "tool_call", "text": "search_docs"}
+                await asyncio.sleep(0.01)
+        finally:
+            closed.set()
+
+    renderer = CardRenderer(min_interval=0)
+    sent = []
+    render = renderer.render(endless(), on_sent=lambda start, end: sent.append(end - start))
+    async for _ in render:
+        break
+    await render.aclose()
+    assert closed.is_set()
+    assert sent == []
+
+
+@pytest.mark.asyncio
+async def test_on_sent_called_after_each_frame():
+    renderer = CardRenderer(min_interval=0)
+    sent = []
+    async for _ in renderer.render(
+        frames([{"type": "tool_call", "text": "a"}, {"type": "tool_call", "text": "b"}]),
+        on_sent=lambda start, end: sent.append((start, end)),
+    ):
+        await asyncio.sleep(0.01)
+    assert len(sent) == 2
+    assert all(end - start >= 0.01 for start, end in sent)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=100, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+    assert time.monotonic() - start >= 0.04
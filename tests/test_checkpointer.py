@@ -0,0 +1,171 @@
+import pytest
+
+from langgraph.graph import StateGraph, MessagesState, START
+
+from src.core.checkpointer import PrunedSqliteSaver, BoundedMemorySaver
+
+
+def build_graph(checkpointer):
+    builder = StateGraph(MessagesState)
+    builder.add_node("echo", lambda state: {"messages": [("ai", "ok")]})
+    builder.add_edge(START, "echo")
+    return builder.compile(checkpointer=checkpointer)
+
+
+async def count_checkpoints(saver, thread_id):
+    async with saver.conn.execute(
+        "SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,)
+    ) as cursor:
+        return (await cursor.fetchone())[0]
+
+
+@pytest.mark.asyncio
+async def test_keep_last_prunes_history(tmp_path):
+    saver = PrunedSqliteSaver.from_db_file(str(tmp_path / "cp.db"), keep_last=2)
+    graph = build_graph(saver)
+    config = {"configurable": {"thread_id": "t1"}}
+    for i in range(5):
+        await graph.ainvoke({"messages": [("user", f"hi {i}")]}, config)
+
+    assert await count_checkpoints(saver, "t1") == 2
+    state = await graph.aget_state(config)
+    assert len(state.values["messages"]) == 10
+
+    # 统计由后台任务刷新，stats()只读取缓存
+    assert saver.stats() == {}
+    stats = await saver.refresh_stats()
+    assert stats["threads"] == 1
+    assert stats["checkpoints"] == 2
+    assert 0 < stats["bytes"] < (tmp_path / "cp.db").stat().st_size + 1_000_000
+    assert saver.stats() == stats
+    await saver.close()
+
+
+@pytest.mark.asyncio
+async def test_stats_refreshed_in_background(tmp_path):
+    import asyncio
+
+    saver = PrunedSqliteSaver.from_db_file(str(tmp_path / "cp.db"), stats_interval=0.05)
+    graph = build_graph(saver)
+    await graph.ainvoke({"messages": [("user", "hi")]}, {"configurable": {"thread_id": "t1"}})
+    saver.start_maintenance()
+    await asyncio.sleep(0.02)
+    assert saver.stats()["threads"] == 1
+
+    await graph.ainvoke({"messages": [("user", "hi")]}, {"configurable": {"thread_id": "t2"}})
+    await asyncio.sleep(0.1)
+    assert saver.stats()["threads"] == 2
+    assert saver.stats()["bytes"] > 0
+    await saver.close()
+
+
+@pytest.mark.asyncio
+async def test_state_survives_reopen(tmp_path):
+    db_file = str(tmp_path / "cp.db")
+    config = {"configurable": {"thread_id": "t1"}}
+
+    saver = PrunedSqliteSaver.from_db_file(db_file)
+    await build_graph(saver).ainvoke({"messages": [("user", "hi")]}, config)
+    await saver.close()
+
+    saver = PrunedSqliteSaver.from_db_file(db_file)
+    state = await build_graph(saver).aget_state(config)
+    assert [m.content for m in state.values["messages"]] == ["hi", "ok"]
+    await saver.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_setup_waits_for_threads_table(tmp_path, monkeypatch):
+    import asyncio
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    base_setup = AsyncSqliteSaver.setup
+
+    async def slow_setup(self):
+        # 父类建表后让出事件循环，模拟并发调用插入的时机
+        await base_setup(self)
+        await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(AsyncSqliteSaver, "setup", slow_setup)
+    saver = PrunedSqliteSaver.from_db_file(str(tmp_path / "cp.db"), thread_ttl=3600)
+    first = asyncio.create_task(saver.setup())
+    await asyncio.sleep(0.01)
+    assert await saver.expire_idle_threads() == 0
+    await first
+    await saver.close()
+
+
+@pytest.mark.asyncio
+async def test_expire_idle_threads_and_vacuum(tmp_path):
+    saver = PrunedSqliteSaver.from_db_file(str(tmp_path / "cp.db"), thread_ttl=3600)
+    graph = build_graph(saver)
+    await graph.ainvoke({"messages": [("user", "a")]}, {"configurable": {"thread_id": "old"}})
+    await graph.ainvoke({"messages": [("user", "b")]}, {"configurable": {"thread_id": "new"}})
+
+    async with saver.conn.execute(
+        "UPDATE checkpoint_threads SET updated_at = 0 WHERE thread_id = 'old'"
+    ):
+        await saver.conn.commit()
+
+    assert await saver.expire_idle_threads() == 1
+    await saver.vacuum()
+    assert await count_checkpoints(saver, "old") == 0
+    assert await count_checkpoints(saver, "new") > 0
+    await saver.close()
+
+
+@pytest.mark.asyncio
+async def test_bounded_memory_keeps_latest_checkpoint():
+    saver = BoundedMemorySaver()
+    graph = build_graph(saver)
+    config = {"configurable": {"thread_id": "t1"}}
+    for i in range(3):
+        await graph.ainvoke({"messages": [("user", f"hi {i}")]}, config)
+
+    state = await graph.aget_state(config)
+    assert len(state.values["messages"]) == 6
+    stats = saver.stats()
+    assert stats["threads"] == 1
+    assert stats["checkpoints"] == 1
+    assert stats["bytes"] > 0
+
+
+@pytest.mark.asyncio
+async def test_bounded_memory_evicts_lru_threads():
+    saver = BoundedMemorySaver(max_threads=2)
+    graph = build_graph(saver)
+    for thread_id in ("a", "b", "c"):
+        await graph.ainvoke(
+            {"messages": [("user", "hi")]}, {"configurable": {"thread_id": thread_id}}
+        )
+
+    assert saver.stats()["threads"] == 2
+    assert saver.stats()["evicted_threads"] == 1
+    state = await graph.aget_state({"configurable": {"thread_id": "a"}})
+    assert not state.values
+
+
+@pytest.mark.asyncio
+async def test_bounded_memory_evicts_idle_threads():
+    saver = BoundedMemorySaver(thread_ttl=60)
+    graph = build_graph(saver)
+    await graph.ainvoke({"messages": [("user", "hi")]}, {"configurable": {"thread_id": "a"}})
+    saver._access["a"] -= 120
+    await graph.ainvoke({"messages": [("user", "hi")]}, {"configurable": {"thread_id": "b"}})
+
+    assert list(saver._access) == ["b"]
+    assert not any(key[0] == "a" for key in saver.blobs)
+
+
+@pytest.mark.asyncio
+async def test_closed_saver_is_not_reused(tmp_path):
+    saver = PrunedSqliteSaver.from_db_file(str(tmp_path / "cp.db"))
+    graph = build_graph(saver)
+    config = {"configurable": {"thread_id": "t1"}}
+    await graph.ainvoke({"messages": [("user", "hi")]}, config)
+    await saver.close()
+
+    with pytest.raises(RuntimeError, match="已关闭"):
+        await graph.aget_state(config)
+    # 重复关闭不报错
+    await saver.close()
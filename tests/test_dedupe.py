@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from src.core.db_client import DatabaseClient
+from src.runtime.dedupe import DedupeCache
+
+
+@pytest_asyncio.fixture
+async def db_api(tmp_path):
+    db_api = DatabaseClient(str(tmp_path / "dedupe.db"))
+    yield db_api
+    await db_api.close()
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_dropped_within_window():
+    cache = DedupeCache(ttl=60, max_size=2)
+    assert not await cache.is_duplicate("m1")
+    assert await cache.is_duplicate("m1")
+    assert not await cache.is_duplicate(None)
+
+    # 超出容量后最早的ID被淘汰
+    assert not await cache.is_duplicate("m2")
+    assert not await cache.is_duplicate("m3")
+    assert not await cache.is_duplicate("m1")
+    assert cache.stats() == {"cached": 2, "duplicates": {"message": 1}}
+
+
+@pytest.mark.asyncio
+async def test_expired_ids_are_accepted_again():
+    cache = DedupeCache(ttl=60)
+    assert not await cache.is_duplicate("m1")
+    cache.seen["m1"] -= 120
+    assert not await cache.is_duplicate("m1")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_and_persisted_duplicates(db_api):
+    cache = DedupeCache(db_api, ttl=60)
+    results = await asyncio.gather(*(cache.is_duplicate("m1") for _ in range(3)))
+    assert sorted(results) == [False, True, True]
+
+    # 新实例（模拟重启）仍能识别已处理过的事件
+    restarted = DedupeCache(db_api, ttl=60)
+    assert await restarted.is_duplicate("m1")
+    assert not await restarted.is_duplicate("m2")
+    assert restarted.stats()["duplicates"] == {"message": 1}
+
+
+@pytest.mark.asyncio
+async def test_runner_exports_duplicates_by_kind(tmp_path):
+    from src.bench.fake_lark import FakeLarkAPI, FakeLarkClient, FakeLarkServer
+    from src.runner import LarkRunner
+    from src.utlis.config import Config
+
+    class EchoAgent:
+        async def invoke2lark(self, query, **kwargs):
+            yield {"type": "text", "text": query}
+
+        async def aclose(self):
+            pass
+
+    config = Config(db_file=str(tmp_path / "runner.db"), kb_folder=str(tmp_path / "kb"))
+    config.coalesce_window = 0
+    lark_api = FakeLarkAPI(FakeLarkServer(api_latency=0, rate_limit=None))
+    runner = LarkRunner(config, lark_api=lark_api, lark_client=FakeLarkClient(lark_api))
+    runner.set_agent(EchoAgent())
+    try:
+        # 飞书重复投递同一条消息与同一次卡片点击
+        for _ in range(3):
+            await runner.callback_reply_message("ou_1", "oc_1", "om_1", "你好", "open_id")
+        for _ in range(2):
+            await runner.callback_card_action("ou_1", "oc_1", {"name": "stop", "event_id": "ev_1"})
+
+        text = runner.metrics.render()
+        assert 'taro_duplicate_events_total{kind="message"} 2' in text
+        assert 'taro_duplicate_events_total{kind="card_action"} 1' in text
+    finally:
+        await runner.shutdown(timeout=5)
@@ -0,0 +1,157 @@
+import pytest
+
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+from langgraph.prebuilt.chat_agent_executor import AgentState
+
+from src.agents.history import HistoryTrimmer
+
+
+class State(AgentState):
+    summary: str
+    summary_failed_at: int
+
+
+def fake_model(*responses):
+    return GenericFakeChatModel(messages=iter([AIMessage(content=r) for r in responses]))
+
+
+def tool_turn(i, result):
+    return [
+        HumanMessage(content=f"question {i}"),
+        AIMessage(
+            content="",
+            tool_calls=[{"id": f"call-{i}", "name": "search_docs", "args": {"query": "q"}}],
+        ),
+        ToolMessage(content=result, tool_call_id=f"call-{i}"),
+        AIMessage(content=f"answer {i}"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_under_budget_is_noop():
+    trimmer = HistoryTrimmer(max_tokens=1000, token_counter=len)
+    update = await trimmer({"messages": tool_turn(0, "short")}, {})
+    assert update == {}
+    assert trimmer.stats[-1]["before"] == trimmer.stats[-1]["after"]
+
+
+@pytest.mark.asyncio
+async def test_truncates_old_tool_results():
+    trimmer = HistoryTrimmer(max_tokens=400, tool_result_tokens=50, token_counter=len)
+    messages = tool_turn(0, "x" * 500) + [HumanMessage(content="next")]
+    update = await trimmer({"messages": messages}, {})
+
+    kept = update["messages"][1:]
+    assert len(kept) == len(messages)
+    assert len(kept[2].content) < 100
+    assert trimmer.stats[-1]["after"] < trimmer.stats[-1]["before"]
+    assert not trimmer.stats[-1]["summarized"]
+
+
+@pytest.mark.asyncio
+async def test_summarizes_old_turns():
+    trimmer = HistoryTrimmer(
+        summary_model=fake_model("rolling summary"),
+        max_tokens=300,
+        keep_tokens=150,
+        tool_result_tokens=100,
+        token_counter=len,
+    )
+    messages = [m for i in range(4) for m in tool_turn(i, "y" * 100)]
+    messages.append(HumanMessage(content="latest question"))
+    update = await trimmer({"messages": messages, "summary": ""}, {})
+
+    assert update["summary"] == "rolling summary"
+    kept = update["messages"][1:]
+    assert kept[-1].content == "latest question"
+    assert isinstance(kept[0], HumanMessage)
+    assert trimmer.stats[-1]["summarized"]
+
+
+@pytest.mark.asyncio
+async def test_failed_summary_keeps_old_turns():
+    class BrokenModel(GenericFakeChatModel):
+        async def ainvoke(self, *args, **kwargs):
+            raise RuntimeError("summary model unavailable")
+
+    trimmer = HistoryTrimmer(
+        summary_model=BrokenModel(messages=iter([])),
+        max_tokens=300,
+        keep_tokens=150,
+        tool_result_tokens=50,
+        token_counter=len,
+    )
+    messages = [m for i in range(4) for m in tool_turn(i, "y" * 100)]
+    messages.append(HumanMessage(content="latest question"))
+    update = await trimmer({"messages": messages, "summary": "old summary"}, {})
+
+    # 只截断工具结果，较早的轮次仍然保留
+    assert update["summary"] == "old summary"
+    kept = update["messages"][1:]
+    assert len(kept) == len(messages)
+    assert kept[0].content == "question 0"
+    assert not trimmer.stats[-1]["summarized"]
+    assert update["summary_failed_at"] > 300
+
+
+@pytest.mark.asyncio
+async def test_failed_summary_backs_off_until_history_grows():
+    calls = []
+
+    class BrokenModel(GenericFakeChatModel):
+        async def ainvoke(self, *args, **kwargs):
+            calls.append(1)
+            raise RuntimeError("summary model unavailable")
+
+    trimmer = HistoryTrimmer(
+        summary_model=BrokenModel(messages=iter([])),
+        max_tokens=300,
+        keep_tokens=150,
+        tool_result_tokens=50,
+        retry_tokens=200,
+        token_counter=len,
+    )
+    messages = [m for i in range(4) for m in tool_turn(i, "y" * 100)]
+    messages.append(HumanMessage(content="latest question"))
+    update = await trimmer({"messages": messages, "summary": ""}, {})
+    assert len(calls) == 1
+
+    # 历史增长不足retry_tokens时不再请求摘要
+    state = {
+        "messages": update["messages"][1:] + [AIMessage(content="a" * 50)],
+        "summary": "",
+        "summary_failed_at": update["summary_failed_at"],
+    }
+    assert await trimmer(state, {}) == {}
+    assert len(calls) == 1
+
+    # 增长超过retry_tokens后重试
+    state["messages"] = state["messages"] + tool_turn(5, "z" * 50) + tool_turn(6, "z" * 50)
+    update = await trimmer(state, {})
+    assert len(calls) == 2
+    assert update["summary_failed_at"] > state["summary_failed_at"]
+
+
+@pytest.mark.asyncio
+async def test_hook_persists_compacted_history():
+    trimmer = HistoryTrimmer(
+        summary_model=fake_model("summary"), max_tokens=60, token_counter=len
+    )
+    agent = create_react_agent(
+        model=fake_model(*[f"answer {i} " * 5 for i in range(4)]),
+        tools=[],
+        pre_model_hook=trimmer,
+        state_schema=State,
+        checkpointer=MemorySaver(),
+    )
+    config = {"configurable": {"thread_id": "t1"}}
+    for i in range(4):
+        await agent.ainvoke({"messages": [HumanMessage(content=f"question {i}")]}, config)
+
+    state = await agent.aget_state(config)
+    assert state.values["summary"] == "summary"
+    assert len(state.values["messages"]) < 8
+    assert all(s["thread_id"] == "t1" for s in trimmer.stats)
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from src.bench.fake_lark import FakeLarkAPI, FakeLarkClient, FakeLarkServer
+from src.core.db_client import DatabaseClient
+from src.runtime.jobs import JobManager
+
+
+async def fake_research(query, steps=3, delay=0.01):
+    for i in range(steps):
+        await asyncio.sleep(delay)
+        yield {"type": "progress", "text": f"步骤{i}\n"}
+    yield {"type": "report", "text": f"{query}的报告"}
+
+
+@pytest_asyncio.fixture
+async def db_api(tmp_path):
+    db_api = DatabaseClient(str(tmp_path / "jobs.db"))
+    yield db_api
+    await db_api.close()
+
+
+def make_manager(db_api, server, research=fake_research):
+    client = FakeLarkClient(FakeLarkAPI(server))
+    return JobManager(db_api, client, research=research, max_jobs_per_chat=1)
+
+
+async def wait_idle(manager):
+    while manager.tasks:
+        await asyncio.gather(*manager.tasks.values())
+
+
+@pytest.mark.asyncio
+async def test_job_streams_progress_and_delivers_report(db_api):
+    server = FakeLarkServer(api_latency=0, rate_limit=None)
+    manager = make_manager(db_api, server)
+
+    job = await manager.submit("ou_1", "oc_1", "open_id", "量子计算")
+    # 会话进行中的任务达到上限
+    assert await manager.submit("ou_1", "oc_1", "open_id", "另一个问题") is None
+    await wait_idle(manager)
+
+    stored = await manager.get(job.job_id)
+    assert stored.status == "done"
+    assert stored.report == "量子计算的报告"
+    assert stored.finished_at is not None
+
+    [card] = server.cards
+    assert "步骤2" in card.text
+    assert card.text.endswith("量子计算的报告")
+    assert card.finished_at is not None
+
+
+@pytest.mark.asyncio
+async def test_cancel_stops_job_and_finishes_card(db_api):
+    server = FakeLarkServer(api_latency=0, rate_limit=None)
+    manager = make_manager(
+        db_api, server, research=lambda query: fake_research(query, steps=100, delay=0.05)
+    )
+
+    job = await manager.submit("ou_1", "oc_1", "open_id", "量子计算")
+    await asyncio.sleep(0.1)
+    assert not await manager.cancel(job.job_id, ("ou_2", "oc_2"))
+    assert await manager.cancel(job.job_id, ("ou_1", "oc_1"))
+    await wait_idle(manager)
+
+    stored = await manager.get(job.job_id)
+    assert stored.status == "cancelled"
+    assert stored.report is None
+    assert server.cards[0].text.endswith("研究任务已取消。")
+    assert manager.stats()["cancelled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unfinished_jobs_resume_after_restart(db_api):
+    server = FakeLarkServer(api_latency=0, rate_limit=None)
+    manager = make_manager(
+        db_api, server, research=lambda query: fake_research(query, steps=100, delay=0.05)
+    )
+    job = await manager.submit("ou_1", "oc_1", "open_id", "量子计算")
+    await asyncio.sleep(0.1)
+    await manager.shutdown()
+    assert (await manager.get(job.job_id)).status == "queued"
+
+    restarted = make_manager(db_api, server)
+    assert await restarted.recover(owns=lambda key: key == ("ou_2", "oc_2")) == 0
+    assert await restarted.recover() == 1
+    await wait_idle(restarted)
+
+    stored = await restarted.get(job.job_id)
+    assert stored.status == "done"
+    assert len(server.cards) == 2
+
+
+@pytest.mark.asyncio
+async def test_jobs_wait_for_research_lane(db_api):
+    from src.runtime.scheduler import FairScheduler
+
+    server = FakeLarkServer(api_latency=0, rate_limit=None)
+    scheduler = FairScheduler({"interactive": 1, "research": 1})
+    manager = JobManager(
+        db_api,
+        FakeLarkClient(FakeLarkAPI(server)),
+        research=lambda query: fake_research(query, steps=5, delay=0.02),
+        slot=lambda job: scheduler.slot((job.open_id, job.chat_id), job.open_id, "research"),
+    )
+
+    first = await manager.submit("ou_1", "oc_1", "open_id", "量子计算")
+    second = await manager.submit("ou_2", "oc_2", "open_id", "核聚变")
+    await asyncio.sleep(0.03)
+    # research车道只有一个名额，第二个任务排队，普通对话的车道不受影响
+    assert manager.stats()["running"] == 1
+    assert manager.stats()["queued"] == 1
+    assert scheduler.stats()["research"]["waiting"] == 1
+    assert scheduler.has_capacity("interactive")
+
+    await wait_idle(manager)
+    assert (await manager.get(first.job_id)).status == "done"
+    assert (await manager.get(second.job_id)).status == "done"
+    assert scheduler.stats()["research"]["granted"] == 2
+    assert scheduler.stats()["research"]["in_use"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_queued_job_releases_its_place(db_api):
+    from src.runtime.scheduler import FairScheduler
+
+    server = FakeLarkServer(api_latency=0, rate_limit=None)
+    scheduler = FairScheduler({"interactive": 1, "research": 1})
+    manager = JobManager(
+        db_api,
+        FakeLarkClient(FakeLarkAPI(server)),
+        research=lambda query: fake_research(query, steps=5, delay=0.02),
+        slot=lambda job: scheduler.slot((job.open_id, job.chat_id), job.open_id, "research"),
+    )
+
+    await manager.submit("ou_1", "oc_1", "open_id", "量子计算")
+    queued = await manager.submit("ou_2", "oc_2", "open_id", "核聚变")
+    await asyncio.sleep(0.03)
+    assert await manager.cancel(queued.job_id)
+    await wait_idle(manager)
+
+    assert (await manager.get(queued.job_id)).status == "cancelled"
+    assert scheduler.stats()["research"]["waiting"] == 0
+    assert scheduler.stats()["research"]["granted"] == 1
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.prebuilt import create_react_agent
+
+from src.utlis.lark_utils import STOPPED_NOTICE, StreamCoalescer, invoke_lark
+
+
+class FakeAgent:
+    """按给定间隔输出AIMessageChunk的假agent"""
+
+    def __init__(self, pieces, delay=0.0):
+        self.pieces = pieces
+        self.delay = delay
+
+    async def astream(self, state, stream_mode, config, subgraphs):
+        for piece in self.pieces:
+            await asyncio.sleep(self.delay)
+            yield (), (AIMessageChunk(content=piece), {})
+
+
+async def collect(agent, coalescer):
+    frames = []
+    async for chunks in invoke_lark(agent, "hi", coalescer=coalescer):
+        frames.extend(chunks)
+    return frames
+
+
+def test_coalescer_flushes_on_size():
+    coalescer = StreamCoalescer(min_size=5)
+    assert coalescer.add("abc") is None
+    assert coalescer.add("def") == "abcdef"
+    assert coalescer.frames == 1
+    assert coalescer.buffer == ""
+
+
+def test_coalescer_adapts_threshold_to_rate():
+    coalescer = StreamCoalescer(max_latency=1.0, min_size=5, max_size=100)
+    coalescer.rate = 50.0
+    assert coalescer.size_threshold == 50
+    coalescer.rate = 1000.0
+    assert coalescer.size_threshold == 100
+
+
+@pytest.mark.asyncio
+async def test_fast_stream_is_coalesced():
+    coalescer = StreamCoalescer(max_latency=0.5, min_size=20)
+    frames = await collect(FakeAgent(["ab"] * 50), coalescer)
+
+    assert "".join(f["text"] for f in frames) == "ab" * 50
+    # 速率很快时阈值上调，帧数少于按min_size固定切分的5帧
+    assert len(frames) == coalescer.frames < 5
+
+
+@pytest.mark.asyncio
+async def test_slow_stream_flushes_on_deadline():
+    coalescer = StreamCoalescer(max_latency=0.05, min_size=1000)
+    agent = FakeAgent(["a", "b", "c"], delay=0.1)
+    frames = await collect(agent, coalescer)
+
+    assert [f["text"] for f in frames] == ["a", "b", "c"]
+    assert coalescer.stats()["frames"] == 3
+
+
+class ToolCallingFakeModel(BaseChatModel):
+    """按顺序返回预设消息（可包含tool_calls）的假模型"""
+
+    responses: list
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-tool-calling"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return ChatResult(generations=[ChatGeneration(message=self.responses.pop(0))])
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+@pytest.mark.asyncio
+async def test_stop_cancels_running_tool_and_saves_partial_turn():
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    @tool
+    async def slow_search(query: str) -> str:
+        """slow search"""
+        started.set()
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+        return "never"
+
+    model = ToolCallingFakeModel(
+        responses=[
+            AIMessage(
+                content="",
+                tool_calls=[{"id": "call-1", "name": "slow_search", "args": {"query": "q"}}],
+            ),
+            AIMessage(content="second answer"),
+        ]
+    )
+    agent = create_react_agent(model, [slow_search], checkpointer=MemorySaver())
+    stop_event = asyncio.Event()
+
+    async def stop_when_tool_starts():
+        await started.wait()
+        stop_event.set()
+
+    stopper = asyncio.create_task(stop_when_tool_starts())
+    frames = []
+    async for chunks in invoke_lark(agent, "hi", thread_id="t1", stop_event=stop_event):
+        frames.extend(chunks)
+    await stopper
+
+    assert cancelled.is_set()
+    assert STOPPED_NOTICE in frames[-1]["text"]
+
+    config = {"configurable": {"thread_id": "t1"}}
+    messages = (await agent.aget_state(config)).values["messages"]
+    assert isinstance(messages[-2], ToolMessage)
+    assert messages[-1].content == STOPPED_NOTICE
+
+    # 补齐工具结果后，下一轮对话可以正常进行
+    async for _ in invoke_lark(agent, "again", thread_id="t1"):
+        pass
+    messages = (await agent.aget_state(config)).values["messages"]
+    assert messages[-1].content == "second answer"
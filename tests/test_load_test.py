@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from src.bench.fake_lark import FakeLarkServer
+from src.bench.load_test import percentile, run_load_test
+from src.utlis.config import Config
+
+
+class EchoAgent:
+    """只实现invoke2lark与aclose的agent替身"""
+
+    async def invoke2lark(self, query, **kwargs):
+        for i in range(5):
+            await asyncio.sleep(0.01)
+            yield {"type": "text", "text": f"{query}-{i}"}
+
+    async def aclose(self):
+        pass
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([3.0, 1.0, 2.0], 0.5) == 2.0
+    assert percentile([1.0, 2.0, 3.0], 0.99) == 3.0
+
+
+@pytest.mark.asyncio
+async def test_load_test_runs_every_turn(tmp_path):
+    config = Config(db_file=str(tmp_path / "bench.db"), kb_folder=str(tmp_path / "kb"))
+    config.coalesce_window = 0.01
+    server = FakeLarkServer(api_latency=0.001, rate_limit=None)
+
+    report = await run_load_test(
+        chats=4, turns_per_chat=2, think_time=0.01, turn_timeout=10,
+        config=config, server=server, agent=EchoAgent(),
+    )
+
+    assert report["turns"] == 8
+    assert report["failed"] == 0
+    assert report["e2e_p50"] > 0
+    assert report["card_updates"] > 0
+    answers = [card for card in server.cards if card.finished_at is not None]
+    assert len(answers) == 8
+    assert all(card.text.startswith("第") for card in answers)
@@ -0,0 +1,158 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.runtime.metrics import Metric, MetricsRegistry, MetricsServer
+
+
+def test_render_prometheus_text():
+    registry = MetricsRegistry()
+    registry.register(
+        lambda: [
+            Metric("taro_active_chats", "gauge", "有worker任务的会话数").add(3),
+            Metric("taro_chat_queue_depth", "gauge", "各会话排队中的消息数")
+            .add(2, open_id="ou_1", chat_id='oc_"1"'),
+            Metric("taro_empty", "gauge", "没有样本时不输出"),
+        ]
+    )
+    turns = registry.histogram("taro_turn_duration_seconds", "每轮对话耗时", buckets=(1, 5))
+    for value in (0.5, 2, 10):
+        turns.observe(value)
+    tools = registry.histogram("taro_tool_duration_seconds", "工具调用耗时", buckets=(1,))
+    tools.observe(0.2, tool="search_docs")
+
+    text = registry.render()
+    assert "# TYPE taro_active_chats gauge\ntaro_active_chats 3\n" in text
+    assert 'taro_chat_queue_depth{open_id="ou_1",chat_id="oc_\\"1\\""} 2' in text
+    assert "taro_empty" not in text
+    assert 'taro_turn_duration_seconds_bucket{le="1"} 1' in text
+    assert 'taro_turn_duration_seconds_bucket{le="5"} 2' in text
+    assert 'taro_turn_duration_seconds_bucket{le="+Inf"} 3' in text
+    assert "taro_turn_duration_seconds_sum 12.5" in text
+    assert "taro_turn_duration_seconds_count 3" in text
+    assert 'taro_tool_duration_seconds_count{tool="search_docs"} 1' in text
+
+
+@pytest.mark.asyncio
+async def test_metrics_server():
+    registry = MetricsRegistry()
+    registry.register(lambda: [Metric("taro_inflight_runs", "gauge", "正在运行的agent轮次").add(1)])
+    scrapes = []
+
+    async def refresh():
+        scrapes.append(len(scrapes) + 1)
+
+    registry.register(lambda: [Metric("taro_scrapes", "counter", "抓取次数").add(scrapes[-1])])
+    registry.register_refresher(refresh)
+    server = MetricsServer(registry, host="127.0.0.1", port=0)
+    await server.start()
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.port}") as client:
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "taro_inflight_runs 1" in response.text
+        assert "taro_scrapes 1" in response.text
+        assert "taro_scrapes 2" in (await client.get("/metrics")).text
+        assert (await client.get("/")).status_code == 404
+    await server.close()
+
+
+@pytest.mark.asyncio
+async def test_runner_metrics(tmp_path):
+    from src.bench.fake_lark import FakeLarkAPI, FakeLarkClient, FakeLarkServer, FakeLarkWsServer
+    from src.runner import LarkRunner
+    from src.utlis.config import Config
+
+    class EchoAgent:
+        async def invoke2lark(self, query, **kwargs):
+            yield {"type": "text", "text": query}
+
+        async def aclose(self):
+            pass
+
+    config = Config(db_file=str(tmp_path / "metrics.db"), kb_folder=str(tmp_path / "kb"))
+    config.coalesce_window = 0
+    lark_api = FakeLarkAPI(FakeLarkServer(api_latency=0, rate_limit=None))
+    runner = LarkRunner(config, lark_api=lark_api, lark_client=FakeLarkClient(lark_api))
+    runner.set_agent(EchoAgent())
+    ws = FakeLarkWsServer(
+        callback_reply_message=runner.callback_reply_message,
+        callback_card_action=runner.callback_card_action,
+        callback_hello=runner.call_back_hello,
+    )
+
+    try:
+        await ws.send_message("ou_1", "oc_1", "你好")
+        for _ in range(100):
+            if "taro_turn_duration_seconds_count 1" in runner.metrics.render():
+                break
+            await asyncio.sleep(0.02)
+
+        text = runner.metrics.render()
+        assert "taro_turn_duration_seconds_count 1" in text
+        assert "taro_queue_wait_seconds_count 1" in text
+        assert "taro_active_chats 1" in text
+        assert "taro_hot_sessions 1" in text
+        assert "taro_evicted_sessions_total 0" in text
+        assert 'taro_duplicate_events_total{kind="message"} 0' in text
+        assert 'taro_research_jobs{state="running"} 0' in text
+        assert 'taro_research_jobs{state="queued"} 0' in text
+        assert "taro_research_jobs_finished_total 0" in text
+        assert "taro_inflight_runs 0" in text
+        assert 'taro_lane_in_use{lane="interactive"} 0' in text
+        assert "taro_card_updates_total" in text
+        assert 'taro_db_queries_total{client="runner"}' in text
+    finally:
+        await runner.shutdown(timeout=5)
+
+
+def test_metrics_served_before_first_event(tmp_path, monkeypatch):
+    import easylark.conn
+
+    from src.bench.fake_lark import FakeLarkAPI, FakeLarkClient, FakeLarkServer
+    from src.runner import LarkRunner
+    from src.utlis.config import Config
+
+    class IdleAgent:
+        async def aclose(self):
+            pass
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    config = Config(db_file=str(tmp_path / "metrics.db"), kb_folder=str(tmp_path / "kb"))
+    lark_api = FakeLarkAPI(FakeLarkServer(api_latency=0, rate_limit=None))
+    runner = LarkRunner(
+        config, lark_api=lark_api, lark_client=FakeLarkClient(lark_api), metrics_port=0
+    )
+    runner.set_agent(IdleAgent())
+    responses = []
+
+    async def scrape():
+        for _ in range(100):
+            if runner.metrics_server.server is not None:
+                break
+            await asyncio.sleep(0.01)
+        port = runner.metrics_server.port
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+            responses.append(await client.get("/metrics"))
+
+    class FakeWsServer:
+        """没有任何飞书事件，只运行事件循环"""
+
+        def __init__(self, **kwargs):
+            pass
+
+        def start(self):
+            loop.run_until_complete(scrape())
+
+    monkeypatch.setattr(easylark.conn, "EasyLarkWsServer", FakeWsServer)
+    try:
+        runner.start()
+        assert responses[0].status_code == 200
+        assert "taro_active_chats 0" in responses[0].text
+        loop.run_until_complete(runner.shutdown(timeout=1))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
@@ -0,0 +1,120 @@
+import json
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from src.core.rag import LarkRAGManager
+from src.runtime.resilience import Resilience
+
+
+class FakeLarkSync:
+    def __init__(self, pages):
+        self.pages = pages
+
+    async def get_wiki_nodes_content(self, space_id):
+        return self.pages
+
+
+class BrokenEmbedding(DeterministicFakeEmbedding):
+    async def aembed_query(self, text):
+        raise RuntimeError("embedding service unavailable")
+
+
+PAGES = [
+    ("报销", "https://wiki/1", "报销流程：先在系统提交申请，再由主管审批。"),
+    ("年假", "https://wiki/2", "年假政策：入职满一年享有五天年假。"),
+]
+
+
+@pytest.mark.asyncio
+async def test_catalog_refreshes_on_build_only(tmp_path):
+    legacy = tmp_path / "legacy"
+    legacy.mkdir()
+    (legacy / "README.md").write_text("# 旧知识库\n公司产研知识库", encoding="utf-8")
+
+    manager = LarkRAGManager(
+        FakeLarkSync(PAGES), str(tmp_path), embeddings=DeterministicFakeEmbedding(size=16)
+    )
+    assert manager.list_knowledge_bases() == [("legacy", "# 旧知识库\n公司产研知识库")]
+    assert manager.catalog()[0]["chunks"] is None
+
+    # 读取时不再扫描磁盘
+    (tmp_path / "manual").mkdir()
+    assert [entry["space_id"] for entry in manager.catalog()] == ["legacy"]
+
+    kb = await manager.build_knowledge_base("hr")
+    entries = {entry["space_id"]: entry for entry in manager.catalog()}
+    assert set(entries) == {"hr", "legacy", "manual"}
+    assert entries["hr"]["chunks"] == 2
+    assert entries["hr"]["documents"] == 2
+    assert entries["hr"]["version"] == int(kb.built_at)
+
+    prompt = manager.render_catalog()
+    assert "- hr: # Knowledge Base: hr This knowledge base was created" in prompt
+    assert "，2个片段" in prompt
+    assert "- legacy: # 旧知识库 公司产研知识库" in prompt
+    assert manager.render_catalog() is prompt
+
+
+@pytest.mark.asyncio
+async def test_query_falls_back_to_keyword_search(tmp_path):
+    resilience = Resilience(failure_threshold=1, recovery_timeout=60)
+    manager = LarkRAGManager(
+        FakeLarkSync(PAGES),
+        str(tmp_path),
+        embeddings=BrokenEmbedding(size=16),
+        resilience=resilience,
+    )
+    await manager.build_knowledge_base("hr")
+
+    for _ in range(2):
+        docs = await manager.query("hr", "年假有几天", top_k=1)
+        assert docs[0].metadata["title"] == "年假"
+    stats = resilience.stats()["embedding"]
+    assert stats["failures"] == 1
+    assert stats["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_keyword_search_after_load(tmp_path):
+    builder = LarkRAGManager(
+        FakeLarkSync(PAGES), str(tmp_path), embeddings=DeterministicFakeEmbedding(size=16)
+    )
+    await builder.build_knowledge_base("hr")
+
+    manager = LarkRAGManager(
+        FakeLarkSync(PAGES),
+        str(tmp_path),
+        embeddings=BrokenEmbedding(size=16),
+        resilience=Resilience(),
+    )
+    docs = await manager.query("hr", "报销流程", top_k=1)
+    assert docs[0].metadata["title"] == "报销"
+    assert len(manager.knowledge_bases["hr"].chunks) == 2
+
+
+@pytest.mark.asyncio
+async def test_reload_when_rebuilt_by_another_process(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=16)
+    builder = LarkRAGManager(FakeLarkSync(PAGES), str(tmp_path), embeddings=embeddings)
+    await builder.build_knowledge_base("hr")
+
+    manager = LarkRAGManager(FakeLarkSync([]), str(tmp_path), embeddings=embeddings)
+    kb = manager.load_knowledge_base("hr")
+    chunks = kb.chunks
+    assert len(chunks) == 2
+    assert manager.load_knowledge_base("hr").chunks is chunks
+
+    # 另一个进程重新构建；同一秒内构建的版本相同，这里把构建时间推后
+    pages = PAGES + [("差旅", "https://wiki/3", "差旅标准：一线城市住宿每晚五百元。")]
+    other = LarkRAGManager(FakeLarkSync(pages), str(tmp_path), embeddings=embeddings)
+    await other.build_knowledge_base("hr")
+    meta_path = tmp_path / "hr" / "meta.json"
+    meta = json.loads(meta_path.read_text())
+    meta["built_at"] = kb.built_at + 10
+    meta_path.write_text(json.dumps(meta))
+
+    kb = manager.load_knowledge_base("hr")
+    assert len(kb.chunks) == 3
+    assert kb.num_documents == 3
+    assert manager.catalog()[0]["version"] == kb.version
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from src.runtime.resilience import CircuitBreaker, CircuitOpenError, Resilience
+from src.agents.resilient_model import ResilientChatModel
+from src.bench.fake_model import FakeStreamingChatModel
+
+
+def test_breaker_opens_and_recovers_through_half_open():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    import time
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    # 探测进行中时不放行其他调用
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_call_fails_fast_and_falls_back_when_open():
+    resilience = Resilience(failure_threshold=2, recovery_timeout=60)
+    calls = 0
+
+    async def broken():
+        nonlocal calls
+        calls += 1
+        raise RuntimeError("503")
+
+    async def fallback():
+        return "keyword"
+
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await resilience.call("embedding", broken)
+
+    with pytest.raises(CircuitOpenError):
+        await resilience.call("embedding", broken)
+    assert await resilience.call("embedding", broken, fallback=fallback) == "keyword"
+    assert calls == 2
+
+    stats = resilience.stats()["embedding"]
+    assert stats["state"] == "open"
+    assert stats["rejected"] == 2
+    assert stats["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_hedge_wins_over_slow_attempt_and_deadline():
+    resilience = Resilience(hedge_default_delay=0.05)
+    delays = [1.0, 0.01]
+
+    async def search():
+        await asyncio.sleep(delays.pop(0))
+        return "result"
+
+    started = asyncio.get_running_loop().time()
+    assert await resilience.call("search:tavily", search, hedge=True) == "result"
+    assert asyncio.get_running_loop().time() - started < 0.5
+    stats = resilience.stats()["search:tavily"]
+    assert stats["hedged"] == 1
+    assert stats["hedge_wins"] == 1
+
+    async def stuck():
+        await asyncio.sleep(10)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await resilience.call("search:tavily", stuck, deadline=0.1, hedge=True)
+    assert resilience.stats()["search:tavily"]["failures"] == 1
+
+
+@pytest.mark.asyncio
+async def test_model_falls_back_on_first_token_timeout():
+    resilience = Resilience(failure_threshold=1, recovery_timeout=60)
+    model = ResilientChatModel(
+        model=FakeStreamingChatModel(first_token_latency=1, answer_tokens=3),
+        fallback=FakeStreamingChatModel(first_token_latency=0, answer_tokens=3, token="备"),
+        resilience=resilience,
+        first_token_timeout=0.05,
+    )
+
+    chunks = [chunk.content async for chunk in model.astream([HumanMessage("你好")])]
+    assert "".join(chunks) == "备备备"
+    assert resilience.stats()["llm"]["state"] == "open"
+
+    # 熔断期间直接使用备用模型
+    message = await model.ainvoke([HumanMessage("你好")])
+    assert message.content == "备备备"
+    assert resilience.stats()["llm"]["rejected"] == 1
@@ -0,0 +1,51 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+from src.agents.router import ModelRouter, RoutedChatModel
+from src.bench.fake_model import FakeStreamingChatModel
+
+
+def test_route_heuristics():
+    router = ModelRouter(long_query_chars=20, long_history_chars=200)
+    system = SystemMessage("系统提示词" * 100)
+
+    assert router.route([system, HumanMessage("hi")]) == ("fast", "simple")
+    assert router.route([HumanMessage("帮我在知识库里找一下报销流程")]) == ("slow", "complex_hint")
+    assert router.route([HumanMessage("x" * 20)]) == ("slow", "long_query")
+    assert router.route([HumanMessage("y" * 150), AIMessage("z" * 60), HumanMessage("好的")]) == (
+        "slow",
+        "long_history",
+    )
+
+    # 当前轮次工具调用超过一次时升级，上一轮的工具调用不计入
+    call = AIMessage("", tool_calls=[{"name": "search_docs", "args": {}, "id": "1"}])
+    result = ToolMessage("结果", tool_call_id="1")
+    turn = [HumanMessage("之前的问题"), call, result, call, result, HumanMessage("在吗")]
+    assert router.route(turn) == ("fast", "simple")
+    assert router.route(turn + [call, result]) == ("fast", "simple")
+    assert router.route(turn + [call, result, call, result]) == ("slow", "multi_hop")
+
+
+@pytest.mark.asyncio
+async def test_routed_model_streams_selected_model_and_records_latency():
+    router = ModelRouter()
+    model = RoutedChatModel(
+        models={
+            "fast": FakeStreamingChatModel(first_token_latency=0, answer_tokens=2, token="快"),
+            "slow": FakeStreamingChatModel(first_token_latency=0.05, answer_tokens=2, token="慢"),
+        },
+        router=router,
+    )
+
+    chunks = [chunk.content async for chunk in model.astream([HumanMessage("你好")])]
+    assert "".join(chunks) == "快快"
+    chunks = [chunk.content async for chunk in model.astream([HumanMessage("为什么天是蓝的")])]
+    assert "".join(chunks) == "慢慢"
+    message = await model.ainvoke([HumanMessage("谢谢")])
+    assert message.content == "快快"
+
+    stats = router.stats()
+    assert stats["fast"]["reasons"] == {"simple": 2}
+    assert stats["slow"]["reasons"] == {"complex_hint": 1}
+    assert stats["slow"]["first_token_p50"] >= 0.05
+    assert model.bind_tools([]).models.keys() == {"fast", "slow"}
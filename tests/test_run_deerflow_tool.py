@@ -1,4 +1,5 @@
 import pytest
+import asyncio
 import os
 import sys
 from unittest.mock import AsyncMock, MagicMock, patch
@@ -6,7 +7,9 @@ from unittest.mock import AsyncMock, MagicMock, patch
 # Add the project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.agents.toolkits import DeepResearchTool
+from src.agents.toolkits import BackgroundResearchTool, DeepResearchTool, research_events
+from src.runtime.jobs import ChatContext, current_chat
+from src.runtime.tool_cache import ToolResultCache
 
 
 class TestDeepResearchTool:
@@ -128,6 +131,123 @@ class TestDeepResearchTool:
                     assert "测试异常" in result
 
 
+class FakeResearchGraph:
+    """记录每次调用的thread_id与并发数的DeerFlow图替身"""
+
+    def __init__(self):
+        self.thread_ids = []
+        self.running = 0
+        self.max_running = 0
+
+    async def astream(self, input, config, stream_mode):
+        self.thread_ids.append(config["configurable"]["thread_id"])
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.05)
+        self.running -= 1
+        yield {"final_report": input["messages"][0]["content"]}
+
+
+@pytest.mark.asyncio
+async def test_research_graph_is_shared_and_runs_are_isolated():
+    graph = FakeResearchGraph()
+    with patch("src.agents.toolkits._research_graph", graph):
+        tools = [DeepResearchTool(max_concurrent=2) for _ in range(2)]
+        results = await asyncio.gather(
+            *(tools[i % 2]._arun(f"查询{i}") for i in range(5))
+        )
+
+    assert results == [f"查询{i}" for i in range(5)]
+    assert len(set(graph.thread_ids)) == 5
+    assert graph.max_running == 2
+
+
+def test_research_limit_per_event_loop_and_config():
+    graph = FakeResearchGraph()
+
+    async def run(max_concurrent):
+        tool = DeepResearchTool(max_concurrent=max_concurrent)
+        await asyncio.gather(*(tool._arun(f"查询{i}") for i in range(4)))
+        return graph.max_running
+
+    # 每次asyncio.run都是新的事件循环(如各个supervisor worker)，上限取各自的配置
+    with patch("src.agents.toolkits._research_graph", graph):
+        assert asyncio.run(run(1)) == 1
+        graph.max_running = 0
+        assert asyncio.run(run(3)) == 3
+    assert len(graph.thread_ids) == 8
+
+
+class PlanGraph:
+    """按DeerFlow的状态顺序产出计划、步骤结果与最终报告"""
+
+    async def astream(self, input, config, stream_mode):
+        steps = [{"title": "收集资料"}, {"title": "分析"}]
+        yield {"messages": []}
+        yield {"current_plan": "{\"title\": ..."}
+        yield {"current_plan": {"title": "研究计划", "steps": steps}}
+        steps[0]["execution_res"] = "资料"
+        yield {"current_plan": {"title": "研究计划", "steps": steps}}
+        steps[1]["execution_res"] = "结论"
+        yield {"current_plan": {"title": "研究计划", "steps": steps}}
+        yield {"current_plan": {"title": "研究计划", "steps": steps}, "final_report": "报告"}
+
+
+@pytest.mark.asyncio
+async def test_research_events_report_plan_progress():
+    with patch("src.agents.toolkits._research_graph", PlanGraph()):
+        events = [event async for event in research_events("测试查询")]
+
+    assert [event["type"] for event in events] == ["progress"] * 3 + ["report"]
+    assert "1. 收集资料" in events[0]["text"]
+    assert events[1]["text"] == "已完成步骤1：收集资料\n"
+    assert events[2]["text"] == "已完成步骤2：分析\n"
+    assert events[3]["text"] == "报告"
+
+
+@pytest.mark.asyncio
+async def test_research_events_reuse_cached_report():
+    graph = FakeResearchGraph()
+    cache = ToolResultCache()
+    with patch("src.agents.toolkits._research_graph", graph):
+        runs = await asyncio.gather(
+            *(
+                collect_events(research_events("量子计算", cache=cache))
+                for _ in range(3)
+            )
+        )
+        again = await collect_events(research_events("量子计算？", cache=cache))
+        fresh = await collect_events(
+            research_events("量子计算", cache=cache, bypass_cache=True)
+        )
+
+    for events in [*runs, again, fresh]:
+        assert events[-1] == {"type": "report", "text": "量子计算"}
+    assert len(graph.thread_ids) == 2
+
+
+async def collect_events(events):
+    return [event async for event in events]
+
+
+@pytest.mark.asyncio
+async def test_background_research_tool_submits_job_for_current_chat():
+    jobs = MagicMock()
+    jobs.submit = AsyncMock(return_value=MagicMock(job_id="abc123"))
+
+    tool = BackgroundResearchTool()
+    assert "不支持" in await tool._arun("测试查询")
+
+    token = current_chat.set(ChatContext(jobs, "ou_1", "oc_1", "open_id"))
+    try:
+        result = await tool._arun("测试查询")
+    finally:
+        current_chat.reset(token)
+
+    assert "abc123" in result
+    assert jobs.submit.call_args.args == ("ou_1", "oc_1", "open_id", "测试查询")
+
+
 @pytest.mark.asyncio
 async def test_real_deerflow_integration():
     """Integration test with real DeerFlow (requires deer_flow directory)"""
@@ -0,0 +1,235 @@
+import asyncio
+
+import pytest
+
+from src.bench.fake_lark import FakeLarkAPI, FakeLarkClient, FakeLarkServer, FakeLarkWsServer
+from src.runner import LarkRunner
+from src.utlis.config import Config
+
+
+class RecordingAgent:
+    """记录每轮的输入与并发数"""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.queries: list[tuple[str, str]] = []
+        self.running: dict[str, int] = {}
+        self.peak = 0
+        self.peak_per_thread = 0
+
+    async def invoke2lark(self, query, thread_id=None, **kwargs):
+        self.queries.append((thread_id, query))
+        self.running[thread_id] = self.running.get(thread_id, 0) + 1
+        self.peak = max(self.peak, sum(self.running.values()))
+        self.peak_per_thread = max(self.peak_per_thread, self.running[thread_id])
+        try:
+            await asyncio.sleep(self.latency)
+            yield {"type": "text", "text": query}
+        finally:
+            self.running[thread_id] -= 1
+
+    async def aclose(self):
+        pass
+
+
+def make_runner(tmp_path, api_latency=0.0, **overrides):
+    config = Config(db_file=str(tmp_path / "runner.db"), kb_folder=str(tmp_path / "kb"))
+    config.coalesce_window = 0
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    lark_api = FakeLarkAPI(FakeLarkServer(api_latency=api_latency, rate_limit=None))
+    runner = LarkRunner(config, lark_api=lark_api, lark_client=FakeLarkClient(lark_api))
+    runner.set_agent(RecordingAgent())
+    ws = FakeLarkWsServer(
+        callback_reply_message=runner.callback_reply_message,
+        callback_card_action=runner.callback_card_action,
+        callback_hello=runner.call_back_hello,
+        delivery_latency=0,
+    )
+    return runner, ws
+
+
+async def wait_until(predicate, timeout=3):
+    for _ in range(int(timeout / 0.01)):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not met")
+
+
+def idle(runner):
+    return all(not rc.messages_queue and not rc.processing for rc in runner.runtime_configs.hot.values())
+
+
+@pytest.mark.asyncio
+async def test_one_worker_per_chat(tmp_path):
+    runner, ws = make_runner(tmp_path)
+    try:
+        for content in ("a", "b", "c"):
+            await ws.send_message("ou_1", "oc_1", content)
+        await ws.send_message("ou_2", "oc_2", "d")
+        assert set(runner.workers) == {("ou_1", "oc_1"), ("ou_2", "oc_2")}
+
+        await wait_until(lambda: len(runner.agent.queries) >= 3 and idle(runner))
+        # 同一会话的消息串行处理，不会同时运行两轮
+        assert runner.agent.peak_per_thread == 1
+        queries = [q for _, q in runner.agent.queries]
+        assert "d" in queries
+        assert "".join(q for q in queries if q != "d").replace("\n", "") == "abc"
+    finally:
+        await runner.shutdown(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_global_run_limit(tmp_path):
+    runner, ws = make_runner(
+        tmp_path, max_concurrent_runs=2, scheduler_lanes={"interactive": 2}
+    )
+    try:
+        for i in range(5):
+            await ws.send_message(f"ou_{i}", f"oc_{i}", f"q{i}")
+        await wait_until(lambda: len(runner.agent.queries) == 5 and idle(runner))
+        assert runner.agent.peak == 2
+    finally:
+        await runner.shutdown(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_idle_worker_exits(tmp_path):
+    runner, ws = make_runner(tmp_path, worker_idle_timeout=0.05)
+    try:
+        await ws.send_message("ou_1", "oc_1", "你好")
+        await wait_until(lambda: runner.agent.queries and idle(runner))
+        await wait_until(lambda: not runner.workers)
+        assert not runner.worker_events
+
+        # 退出后新消息重新创建worker
+        await ws.send_message("ou_1", "oc_1", "再来")
+        await wait_until(lambda: len(runner.agent.queries) == 2)
+    finally:
+        await runner.shutdown(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_burst_is_coalesced_into_one_turn(tmp_path):
+    runner, ws = make_runner(tmp_path, coalesce_window=0.1)
+    try:
+        for content in ("第一句", "第二句", "第三句"):
+            await ws.send_message("ou_1", "oc_1", content)
+            await asyncio.sleep(0.02)
+        await wait_until(lambda: runner.agent.queries and idle(runner))
+        assert [q for _, q in runner.agent.queries] == ["第一句\n第二句\n第三句"]
+    finally:
+        await runner.shutdown(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_messages_before_agent_start_join_the_turn(tmp_path):
+    # 创建卡片需要0.1秒，期间本轮已拿到运行名额但agent尚未开始
+    runner, ws = make_runner(tmp_path, api_latency=0.1)
+    try:
+        await ws.send_message("ou_1", "oc_1", "a")
+        await wait_until(lambda: runner.admission.stats()["in_flight"] == 1)
+        await ws.send_message("ou_1", "oc_1", "b")
+        await wait_until(lambda: runner.agent.queries and idle(runner))
+        assert [q for _, q in runner.agent.queries] == ["a\nb"]
+    finally:
+        await runner.shutdown(timeout=5)
+
+
+class StoppableAgent(RecordingAgent):
+    """收到停止信号后输出部分回答并结束，ignore_stop时忽略停止信号"""
+
+    def __init__(self, latency: float = 10, ignore_stop: bool = False):
+        super().__init__(latency)
+        self.ignore_stop = ignore_stop
+        self.stopped = False
+
+    async def invoke2lark(self, query, thread_id=None, stop_event=None, **kwargs):
+        self.queries.append((thread_id, query))
+        self.running[thread_id] = self.running.get(thread_id, 0) + 1
+        try:
+            if self.ignore_stop:
+                await asyncio.sleep(self.latency)
+            else:
+                await asyncio.wait_for(stop_event.wait(), self.latency)
+                self.stopped = True
+            yield {"type": "text", "text": "部分回答"}
+        finally:
+            self.running[thread_id] -= 1
+
+
+def test_sigterm_drains_and_restart_resumes(tmp_path, monkeypatch):
+    import signal
+
+    import easylark.conn
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        runner, ws = make_runner(tmp_path)
+        runner.agent.latency = 0.3
+
+        async def scenario():
+            await ws.send_message("ou_1", "oc_1", "first")
+            await wait_until(lambda: any(runner.agent.running.values()))
+            runner._handle_signal(signal.SIGTERM, None)
+            # 停机期间到达的消息只入队持久化
+            await ws.send_message("ou_1", "oc_1", "second")
+
+        loop.run_until_complete(scenario())
+        # shutdown完成后停止事件循环
+        loop.run_forever()
+
+        assert [q for _, q in runner.agent.queries] == ["first"]
+        card = runner.lark_client.server.cards[0]
+        assert card.text == "first" and card.finished_at is not None
+
+        # 重启：事件循环启动后立即恢复排队的消息，不需要新的飞书事件
+        class FakeWsServer:
+            def __init__(self, **kwargs):
+                pass
+
+            def start(self):
+                loop.run_until_complete(wait_until(lambda: len(restarted.agent.queries) == 1))
+
+        monkeypatch.setattr(easylark.conn, "EasyLarkWsServer", FakeWsServer)
+        restarted, _ = make_runner(tmp_path)
+        restarted.start()
+        assert [q for _, q in restarted.agent.queries] == ["second"]
+        loop.run_until_complete(wait_until(lambda: idle(restarted)))
+        loop.run_until_complete(restarted.shutdown(timeout=5))
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+@pytest.mark.asyncio
+async def test_shutdown_stops_turns_after_timeout(tmp_path):
+    runner, ws = make_runner(tmp_path, shutdown_stop_grace=1)
+    runner.set_agent(StoppableAgent())
+    await ws.send_message("ou_1", "oc_1", "长任务")
+    await wait_until(lambda: any(runner.agent.running.values()))
+
+    started = asyncio.get_running_loop().time()
+    await runner.shutdown(timeout=0.1)
+    # 超过timeout后发送停止信号，轮次输出部分回答并结束，不等待agent的10秒
+    assert runner.agent.stopped
+    assert asyncio.get_running_loop().time() - started < 5
+    assert runner.lark_client.server.cards[0].text == "部分回答"
+
+
+@pytest.mark.asyncio
+async def test_shutdown_cancels_turns_after_stop_grace(tmp_path):
+    runner, ws = make_runner(tmp_path, shutdown_stop_grace=0.2)
+    runner.set_agent(StoppableAgent(ignore_stop=True))
+    await ws.send_message("ou_1", "oc_1", "不响应停止")
+    await wait_until(lambda: any(runner.agent.running.values()))
+    worker = runner.workers[("ou_1", "oc_1")]
+
+    started = asyncio.get_running_loop().time()
+    await runner.shutdown(timeout=0.1)
+    # 停止信号被忽略时，宽限期结束后直接取消worker
+    assert asyncio.get_running_loop().time() - started < 5
+    assert worker.cancelled()
+    assert not any(runner.agent.running.values())
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from src.runtime.scheduler import FairScheduler
+
+
+async def run_turns(scheduler, requests, duration=0.01):
+    """按顺序提交(flow, lane)请求，返回实际被调度的flow顺序"""
+    order = []
+
+    async def run(i, flow, lane):
+        async with scheduler.slot((flow, str(i)), flow, lane):
+            order.append(flow)
+            await asyncio.sleep(duration)
+
+    tasks = []
+    for i, (flow, lane) in enumerate(requests):
+        tasks.append(asyncio.create_task(run(i, flow, lane)))
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return order
+
+
+@pytest.mark.asyncio
+async def test_heavy_flow_does_not_starve_others():
+    scheduler = FairScheduler({"interactive": 1})
+    # 先让heavy积累虚拟时间
+    await run_turns(scheduler, [("heavy", "interactive")], duration=0.05)
+
+    order = await run_turns(
+        scheduler,
+        [("heavy", "interactive")] * 3 + [("light", "interactive")] * 2,
+    )
+    # 第一个heavy请求直接拿到名额，之后light与排队中的heavy交替，而不是排在最后
+    assert order == ["heavy", "light", "heavy", "light", "heavy"]
+
+
+@pytest.mark.asyncio
+async def test_weights_favor_heavier_tenant():
+    scheduler = FairScheduler({"interactive": 1}, weights={"gold": 10})
+    await run_turns(scheduler, [("gold", "interactive"), ("free", "interactive")])
+
+    order = await run_turns(
+        scheduler,
+        [("free", "interactive"), ("free", "interactive"), ("gold", "interactive")],
+    )
+    assert order[1] == "gold"
+
+
+@pytest.mark.asyncio
+async def test_lanes_have_independent_capacity():
+    scheduler = FairScheduler({"interactive": 1, "research": 1}, max_total=2)
+    release = asyncio.Event()
+
+    async def hold(flow, lane):
+        async with scheduler.slot((flow, "c"), flow, lane):
+            await release.wait()
+
+    research = asyncio.create_task(hold("u1", "research"))
+    await asyncio.sleep(0)
+    assert scheduler.has_capacity("interactive")
+    assert not scheduler.has_capacity("research")
+
+    queued = asyncio.create_task(hold("u2", "research"))
+    interactive = asyncio.create_task(hold("u3", "interactive"))
+    await asyncio.sleep(0)
+    assert scheduler.position(("u2", "c")) == 1
+    assert scheduler.position(("u2", "c"), "research") == 1
+    assert scheduler.position(("u2", "c"), "interactive") is None
+    assert scheduler.stats()["interactive"]["in_use"] == 1
+
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.gather(research, queued, interactive)
+    stats = scheduler.stats()
+    assert stats["research"]["granted"] == 2
+    assert stats["research"]["wait_p95"] > 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_releases_its_place():
+    scheduler = FairScheduler({"interactive": 1})
+    release = asyncio.Event()
+
+    async def hold(flow):
+        async with scheduler.slot((flow, "c"), flow):
+            await release.wait()
+
+    first = asyncio.create_task(hold("u1"))
+    waiting = asyncio.create_task(hold("u2"))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    await asyncio.sleep(0)
+    assert scheduler.waiting_count() == 0
+
+    release.set()
+    await first
+    assert scheduler.in_flight == 0
@@ -0,0 +1,93 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.core.search import SearchClients
+
+
+@pytest.mark.asyncio
+async def test_tavily_uses_shared_client(monkeypatch):
+    monkeypatch.setenv("TAVILY_API_KEY", "tvly-test")
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        return httpx.Response(200, json={"query": "python", "results": [{"title": "Python"}]})
+
+    clients = SearchClients()
+    clients.http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    http = clients._client()
+
+    for _ in range(3):
+        result = await clients.search("tavily", "python", max_results=3)
+        assert result["results"] == [{"title": "Python"}]
+
+    assert clients._client() is http
+    assert len(requests) == 3
+    assert requests[0].headers["Authorization"] == "Bearer tvly-test"
+    assert clients.stats()["tavily"]["calls"] == 3
+    await clients.aclose()
+    assert clients.http is None
+
+
+@pytest.mark.asyncio
+async def test_engine_concurrency_limit_and_timeout(monkeypatch):
+    clients = SearchClients(timeout=0.2, concurrency={"tavily": 2})
+    running = 0
+    max_running = 0
+
+    async def slow_search(engine, query, max_results):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.05 if query != "卡住" else 10)
+        running -= 1
+        return query
+
+    monkeypatch.setattr(clients, "_search", slow_search)
+
+    results = await asyncio.gather(*(clients.search("tavily", str(i)) for i in range(6)))
+    assert results == [str(i) for i in range(6)]
+    assert max_running == 2
+
+    with pytest.raises(asyncio.TimeoutError):
+        await clients.search("tavily", "卡住")
+    stats = clients.stats()["tavily"]
+    assert stats["calls"] == 7
+    assert stats["errors"] == 1
+    assert stats["latency_p95"] >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_hedge_needs_its_own_slot(monkeypatch):
+    from src.runtime.resilience import Resilience
+
+    resilience = Resilience(hedge_default_delay=0.02)
+    clients = SearchClients(timeout=1, concurrency={"tavily": 2}, resilience=resilience)
+    running = 0
+    max_running = 0
+
+    async def slow_search(engine, query, max_results):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        try:
+            await asyncio.sleep(0.1)
+            return query
+        finally:
+            running -= 1
+
+    monkeypatch.setattr(clients, "_search", slow_search)
+
+    # 有空闲名额时对冲，对冲请求占用第二个名额
+    assert await clients.search("tavily", "a") == "a"
+    assert resilience.stats()["search:tavily"]["hedged"] == 1
+    assert max_running == 2
+
+    # 名额已满时不对冲，引擎上的并发请求不超过上限
+    max_running = 0
+    results = await asyncio.gather(*(clients.search("tavily", str(i)) for i in range(4)))
+    assert results == ["0", "1", "2", "3"]
+    assert max_running == 2
+    assert resilience.stats()["search:tavily"]["hedged"] == 1
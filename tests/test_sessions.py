@@ -0,0 +1,73 @@
+import pytest
+import pytest_asyncio
+
+from src.core.db_client import DatabaseClient
+from src.runtime.sessions import SessionStore
+
+
+@pytest_asyncio.fixture
+async def db_api(tmp_path):
+    db_api = DatabaseClient(str(tmp_path / "sessions.db"))
+    yield db_api
+    await db_api.close()
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction_and_lazy_restore(db_api):
+    store = SessionStore(db_api, max_hot=2)
+    first = await store.get(("u1", "c1"))
+    first.thread_id = "thread-1"
+    await store.get(("u2", "c2"))
+    await store.get(("u3", "c3"))
+
+    assert store.stats() == {"hot": 2, "evicted": 1, "restored": 0}
+    assert store.peek(("u1", "c1")) is None
+
+    restored = await store.get(("u1", "c1"))
+    assert restored.thread_id == "thread-1"
+    assert store.stats()["restored"] == 1
+
+
+@pytest.mark.asyncio
+async def test_busy_sessions_are_not_evicted(db_api):
+    store = SessionStore(db_api, max_hot=1)
+    busy = await store.get(("u1", "c1"))
+    busy.messages_queue.append("hello")
+    await store.get(("u2", "c2"))
+
+    assert store.peek(("u1", "c1")) is busy
+    assert store.stats()["evicted"] == 0
+
+
+@pytest.mark.asyncio
+async def test_idle_ttl_and_restart(db_api, tmp_path):
+    store = SessionStore(db_api, idle_ttl=60)
+    runtime_config = await store.get(("u1", "c1"))
+    runtime_config.thread_id = "thread-1"
+    runtime_config.processing = True
+    await store.save(("u1", "c1"))
+    runtime_config.processing = False
+
+    store.last_access[("u1", "c1")] -= 120
+    assert await store.evict_idle() == 1
+
+    # 新的存储实例（模拟重启）从数据库恢复会话
+    restarted = SessionStore(db_api)
+    restored = await restarted.get(("u1", "c1"))
+    assert restored.thread_id == "thread-1"
+    assert restored.processing is False
+
+
+@pytest.mark.asyncio
+async def test_pending_includes_persisted_queues(db_api):
+    store = SessionStore(db_api)
+    queued = await store.get(("u1", "c1"))
+    queued.messages_queue.append("hello")
+    await store.get(("u2", "c2"))
+    await store.save_all()
+
+    # 重启后内存为空，排队消息从数据库中找回
+    restarted = SessionStore(db_api)
+    assert await restarted.pending() == [("u1", "c1")]
+    restored = await restarted.get(("u1", "c1"))
+    assert restored.messages_queue == ["hello"]
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from src.runtime.speculation import SpeculativeRetriever, current_speculation, similarity
+
+
+def test_similarity():
+    assert similarity("7xOne有哪些产品", "7xOne 有哪些产品？") == 1.0
+    assert similarity("7xOne有哪些产品", "7xOne产品列表") > 0.3
+    assert similarity("报销流程", "今天天气") == 0.0
+    assert similarity("", "报销流程") == 0.0
+
+
+def render(results, space_id):
+    if space_id:
+        return results[space_id]
+    return " | ".join(results.values())
+
+
+@pytest.mark.asyncio
+async def test_prefetch_is_served_when_query_matches():
+    calls = []
+
+    async def retrieve(query):
+        calls.append(query)
+        await asyncio.sleep(0.05)
+        return {"kb1": f"kb1: {query}", "kb2": f"kb2: {query}"}
+
+    retriever = SpeculativeRetriever(retrieve, render, threshold=0.5)
+    speculation = retriever.start("报销流程是怎样的")
+    assert current_speculation.get() is speculation
+
+    # 模型换了说法但足够接近时复用预取结果
+    assert await speculation.take("报销流程是怎样的？") == "kb1: 报销流程是怎样的 | kb2: 报销流程是怎样的"
+    assert await speculation.take("报销流程是怎样") == "kb1: 报销流程是怎样的 | kb2: 报销流程是怎样的"
+    assert await speculation.take("年假有几天") is None
+    # 指定知识库时只返回该知识库的预取结果，未预取的知识库需要重新检索
+    assert await speculation.take("报销流程是怎样的", space_id="kb2") == "kb2: 报销流程是怎样的"
+    assert await speculation.take("报销流程是怎样的", space_id="kb9") is None
+    speculation.close()
+    assert await speculation.take("报销流程是怎样的") is None
+    assert calls == ["报销流程是怎样的"]
+
+    # 没有用到的预取会被取消
+    speculation = retriever.start("年假有几天呢")
+    speculation.close()
+    await asyncio.sleep(0)
+    assert speculation.task.cancelled()
+
+    assert retriever.start("hi") is None
+    assert current_speculation.get() is None
+    assert retriever.stats() == {
+        "started": 2,
+        "hits": 1,
+        "misses": 2,
+        "unused": 1,
+        "hit_rate": 0.5,
+    }
@@ -0,0 +1,90 @@
+import pytest
+
+from src.runtime.supervisor import HashRing, Supervisor
+from src.utlis.config import Config
+
+
+def test_hash_ring_is_stable_and_balanced():
+    ring = HashRing(list(range(4)))
+    keys = [f"user{i}:chat{i}" for i in range(2000)]
+    assignment = {key: ring.get(key) for key in keys}
+
+    assert all(HashRing(list(range(4))).get(key) == node for key, node in assignment.items())
+    counts = [list(assignment.values()).count(node) for node in range(4)]
+    assert min(counts) > 2000 / 4 * 0.5
+
+    # 增加一个worker只迁移一小部分会话，且只迁移到新worker
+    grown = HashRing(list(range(5)))
+    moved = [key for key in keys if grown.get(key) != assignment[key]]
+    assert len(moved) < 2000 * 0.35
+    assert all(grown.get(key) == 4 for key in moved)
+
+
+@pytest.mark.asyncio
+async def test_events_of_one_chat_go_to_one_worker_in_order():
+    supervisor = Supervisor(Config(), agent_factory=None, workers=3)
+    for i in range(5):
+        await supervisor.callback_reply_message("u1", "c1", f"m{i}", f"q{i}", "open_id")
+
+    worker_id = supervisor.route("u1", "c1")
+    inbox = supervisor.inboxes[worker_id]
+    contents = [inbox.get(timeout=1)[2][3] for _ in range(5)]
+    assert contents == [f"q{i}" for i in range(5)]
+    assert all(
+        supervisor.inboxes[i].empty() for i in range(3) if i != worker_id
+    )
+
+
+def blocking_worker(worker_id, num_workers, config, agent_factory, inbox, outbox):
+    """替代_worker_main：阻塞在inbox.get()上，卡片操作返回处理它的进程"""
+    import os
+    import threading
+    import time
+
+    def heartbeat():
+        while True:
+            outbox.put(("heartbeat", worker_id, None))
+            time.sleep(0.1)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    while True:
+        event = inbox.get()
+        if event is None:
+            return
+        kind, event_id, args = event
+        if kind == "card_action":
+            outbox.put(("result", event_id, {"pid": os.getpid()}))
+        outbox.put(("ack", worker_id, event_id))
+
+
+@pytest.mark.asyncio
+async def test_restarted_worker_receives_events(monkeypatch):
+    import asyncio
+    import time
+
+    from src.runtime import supervisor as supervisor_module
+
+    monkeypatch.setattr(supervisor_module, "_worker_main", blocking_worker)
+    config = Config()
+    config.worker_heartbeat_interval = 0.1
+    config.card_action_timeout = 15
+    supervisor = Supervisor(config, agent_factory=None, workers=1)
+    supervisor.start_workers()
+    try:
+        first = await supervisor.callback_card_action("u1", "c1", {"name": "stop"})
+        old_pid = supervisor.processes[0].pid
+        assert first == {"pid": old_pid}
+
+        # 在worker阻塞于inbox.get()时将其终止，之后投递的事件要由新进程处理
+        time.sleep(0.2)
+        supervisor.processes[0].terminate()
+        during_restart = await supervisor.callback_card_action("u1", "c1", {"name": "stop"})
+        assert supervisor.restarts[0] == 1
+        assert during_restart == {"pid": supervisor.processes[0].pid} != first
+
+        later = await supervisor.callback_card_action("u1", "c1", {"name": "stop"})
+        assert later == during_restart
+        await asyncio.sleep(0.2)
+        assert supervisor.unacked[0] == {}
+    finally:
+        supervisor.stop_workers(timeout=5)
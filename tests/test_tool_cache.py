@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from src.core.db_client import DatabaseClient
+from src.runtime.tool_cache import ToolResultCache
+
+
+@pytest_asyncio.fixture
+async def db_api(tmp_path):
+    db_api = DatabaseClient(str(tmp_path / "cache.db"))
+    yield db_api
+    await db_api.close()
+
+
+def test_key_normalizes_query():
+    key = ToolResultCache.make_key("web_search", "  Ｐython   异步？", engine="tavily")
+    assert key == ToolResultCache.make_key("web_search", "python 异步", engine="tavily")
+    assert key != ToolResultCache.make_key("web_search", "python 异步", engine="duckduckgo")
+    assert key != ToolResultCache.make_key("deep_research", "python 异步", engine="tavily")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_are_single_flighted():
+    cache = ToolResultCache()
+    calls = 0
+
+    async def search():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "结果"
+
+    key = cache.make_key("web_search", "问题")
+    results = await asyncio.gather(
+        *(cache.get_or_call("web_search", key, search) for _ in range(5))
+    )
+    assert results == ["结果"] * 5
+    assert calls == 1
+
+    assert await cache.get_or_call("web_search", key, search) == "结果"
+    assert calls == 1
+    stats = cache.stats()["web_search"]
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 4
+    assert stats["hits"] == 1
+    assert stats["hit_rate"] == round(5 / 6, 3)
+
+
+@pytest.mark.asyncio
+async def test_bypass_refreshes_and_failures_are_not_cached():
+    cache = ToolResultCache()
+    key = cache.make_key("web_search", "问题")
+
+    async def fail():
+        raise RuntimeError("超时")
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_call("web_search", key, fail)
+    assert await cache.get(key) is None
+
+    async def answer(text):
+        return text
+
+    assert await cache.get_or_call("web_search", key, lambda: answer("旧")) == "旧"
+    assert await cache.get_or_call("web_search", key, lambda: answer("新"), bypass=True) == "新"
+    assert await cache.get_or_call("web_search", key, lambda: answer("更新")) == "新"
+    assert cache.stats()["web_search"]["bypassed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_results_persist_with_per_tool_ttl(db_api):
+    cache = ToolResultCache(db_api, ttls={"web_search": 0})
+    search_key = cache.make_key("web_search", "问题")
+    research_key = cache.make_key("deep_research", "问题")
+
+    async def answer():
+        return "报告"
+
+    await cache.get_or_call("web_search", search_key, answer)
+    await cache.get_or_call("deep_research", research_key, answer)
+
+    restarted = ToolResultCache(db_api, ttls={"web_search": 0})
+    assert await restarted.get(research_key) == "报告"
+    # ttl为0的结果立即过期
+    assert await restarted.get(search_key) is None
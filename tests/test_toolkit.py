@@ -6,6 +6,7 @@ from easylark.conn.larkapi import EasyLarkAPI
 from src.core.lark_sync import LarkSynchronizer
 from src.core.db_client import DatabaseClient
 from src.core.rag import LarkRAGManager
+from src.core.search import SearchClients
 from src.agents.toolkits import LarkToolkit, ListKBsTool, SearchDocsTool, WebSearchTool
 
 
@@ -51,3 +52,70 @@ async def test_toolkits(rag_manager):
     #     input={"query": "dpi是干什么的？", "engine": "serpapi", "max_results": 5}
     # )
     # print(res)
+
+
+class FakeSearchClients(SearchClients):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def search(self, engine, query, max_results=5):
+        self.calls.append(engine)
+        if engine == "duckduckgo":
+            raise RuntimeError("rate limited")
+        return [query]
+
+
+@pytest.mark.asyncio
+async def test_web_search_merges_parallel_engines():
+    clients = FakeSearchClients()
+    web_search_tool = WebSearchTool(clients=clients)
+
+    res = await web_search_tool.ainvoke(
+        input={"query": "dpi是干什么的？", "engine": "tavily, duckduckgo"}
+    )
+    assert res == "Tavily搜索结果: ['dpi是干什么的？']\n\nDuckDuckGo搜索失败: rate limited"
+    assert sorted(clients.calls) == ["duckduckgo", "tavily"]
+
+    res = await web_search_tool.ainvoke(input={"query": "dpi", "engine": "serpapi"})
+    assert res.startswith("不支持的搜索引擎")
+
+
+class FakeRAGManager:
+    def __init__(self):
+        self.queries = []
+
+    def list_knowledge_bases(self):
+        return [("kb1", "产研知识库")]
+
+    async def query(self, space_id, query, top_k=5):
+        from langchain_core.documents import Document
+
+        self.queries.append(query)
+        return [Document(page_content=f"{query}的答案")]
+
+
+@pytest.mark.asyncio
+async def test_search_docs_uses_speculative_prefetch():
+    from src.agents.toolkits import format_docs, query_knowledge_bases
+    from src.runtime.speculation import SpeculativeRetriever
+
+    rag_manager = FakeRAGManager()
+    query_kb = SearchDocsTool.model_construct(rag_manager=rag_manager)
+    retriever = SpeculativeRetriever(
+        lambda query: query_knowledge_bases(rag_manager, query),
+        lambda results, space_id: format_docs(rag_manager, results, space_id),
+    )
+
+    speculation = retriever.start("7xOne有哪些产品")
+    res = await query_kb.ainvoke(input={"query": "7xOne 有哪些产品"})
+    assert res == "[知识库: 产研知识库]: 7xOne有哪些产品的答案"
+    # 模型按知识库目录指定space_id时同样使用预取结果
+    res = await query_kb.ainvoke(input={"query": "7xOne有哪些产品", "space_id": "kb1"})
+    assert res == "知识库 kb1 中的搜索结果:\n7xOne有哪些产品的答案"
+    res = await query_kb.ainvoke(input={"query": "年假政策"})
+    assert res == "[知识库: 产研知识库]: 年假政策的答案"
+    speculation.close()
+
+    assert rag_manager.queries == ["7xOne有哪些产品", "年假政策"]
+    assert retriever.stats()["hit_rate"] == 1.0
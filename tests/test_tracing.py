@@ -0,0 +1,88 @@
+import json
+
+import httpx
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_core.tools import tool
+
+from src.agents.resilient_model import ResilientChatModel
+from src.bench.fake_model import FakeStreamingChatModel
+from src.runtime.resilience import Resilience
+from src.runtime.tracing import JsonlSpanExporter, OtlpSpanExporter, Tracer, span
+
+
+@tool
+async def search_docs(query: str) -> str:
+    """搜索文档"""
+    with span("embed_query", "embedding"):
+        pass
+    with span("vector_search", "retrieval"):
+        return f"{query}的结果"
+
+
+@pytest.mark.asyncio
+async def test_turn_spans_are_exported_with_summary(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer([JsonlSpanExporter(str(path))])
+    model = ResilientChatModel(
+        model=FakeStreamingChatModel(first_token_latency=0.02, token_latency=0, answer_tokens=5),
+        resilience=Resilience(),
+    )
+
+    trace = tracer.start(thread_id="t1")
+    trace.add_span("queue_wait", "queue", trace.root.start - 0.5, trace.root.start)
+    async for _ in model.astream([HumanMessage("你好")]):
+        pass
+    assert await search_docs.ainvoke({"query": "报销"}) == "报销的结果"
+    await tracer.finish(trace)
+    await tracer.aclose()
+
+    # 不在轮次中时不记录
+    with span("embed_query", "embedding") as s:
+        assert s is None
+
+    spans = {s["name"]: s for s in map(json.loads, path.read_text().splitlines())}
+    assert set(spans) == {
+        "turn",
+        "queue_wait",
+        "llm:fake-streaming",
+        "tool:search_docs",
+        "embed_query",
+        "vector_search",
+    }
+    llm = spans["llm:fake-streaming"]
+    assert llm["attrs"]["tokens"] == 5
+    assert llm["attrs"]["ttft"] >= 0.02
+    assert spans["embed_query"]["parent_id"] == spans["tool:search_docs"]["span_id"]
+    assert spans["tool:search_docs"]["parent_id"] == spans["turn"]["span_id"]
+
+    summary = trace.summary()
+    assert summary["llm"]["calls"] == 1
+    assert summary["queue"]["time"] == pytest.approx(0.5, abs=0.01)
+    assert summary["tool"]["calls"] == 1
+    assert "llm=" in trace.summary_line()
+
+
+@pytest.mark.asyncio
+async def test_otlp_exporter_payload():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json={})
+
+    exporter = OtlpSpanExporter("http://collector:4318/")
+    exporter.http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    tracer = Tracer([exporter])
+
+    trace = tracer.start(thread_id="t1")
+    with span("search:tavily", "search"):
+        pass
+    await tracer.finish(trace)
+    await tracer.aclose()
+
+    spans = requests[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["turn", "search:tavily"]
+    assert spans[1]["traceId"] == spans[0]["traceId"] == trace.trace_id
+    assert spans[1]["parentSpanId"] == spans[0]["spanId"]
+    assert {"key": "kind", "value": {"stringValue": "search"}} in spans[1]["attributes"]